@@ -13,6 +13,8 @@ from __future__ import division
 
 import numpy as np
 
+from slab_processing import process_in_slabs
+
 def shift_left(array, n=1):
 
 	return np.pad(array, (0,n), mode='constant', constant_values=(0,np.nan))[n:]
@@ -22,81 +24,104 @@ def shift_right(array, n=1):
 	return np.pad(array, (n,0), mode='constant', constant_values=(np.nan,0))[:-n]
 
 
-def interpolate_single(array):
-	""" Linearly interpolates single `nan` values based on their neighbors. """
+def _fill_single_nans(array, axis):
+	""" Fills single `nan`s along `axis` of `array`, in place. """
 
-	new_array = np.copy(array)
+	# view with `axis` last: a[..., i]
+	a = np.rollaxis(array, axis, array.ndim)
+	nans = np.isnan(a)
 
-	# 1. find single nans in the array -- i.e. nans whose neighbors are both NOT nans
-	nan_positions = np.where(np.isnan(array) & ~np.isnan(shift_right(array)) & ~np.isnan(shift_left(array)))
+	# 1. find single nans -- i.e. nans whose neighbors are both NOT nans
+	before = np.nonzero(nans[..., 1:-1] & ~nans[..., :-2] & ~nans[..., 2:])
+	at = before[:-1] + (before[-1] + 1,)
+	after = before[:-1] + (before[-1] + 2,)
 
-	for i in nan_positions[0]:
-		# interpolate between neighbors
-		new_array[i] = np.mean((new_array[i+1], new_array[i-1]))
+	# interpolate between neighbors (exactly as np.mean of the two would)
+	a[at] = (a[after] + a[before]) / 2
 
-	return new_array
+def _fill_double_nans(array, axis):
+	""" Fills double `nan`s along `axis` of `array`, in place. Ignores single nans! """
+
+	a = np.rollaxis(array, axis, array.ndim)
+	nans = np.isnan(a)
+
+	# 1. find double nans -- i.e. two nans whose neighbors are both NOT nans.
+	before = np.nonzero(nans[..., 1:-2] & nans[..., 2:-1] & ~nans[..., :-3] & ~nans[..., 3:])
+	at = before[:-1] + (before[-1] + 1,)
+	next_at = before[:-1] + (before[-1] + 2,)
+	after = before[:-1] + (before[-1] + 3,)
+
+	# interpolate between neighbors, in double precision
+	low = a[before].astype(np.float64)
+	high = a[after].astype(np.float64)
+	a[at] = (2/3 * low) + (1/3 * high)
+	a[next_at] = (1/3 * low) + (2/3 * high)
 
-def interpolate_double(array):
-	""" Linearly interpolates double `nan` values based on their neighbors. Ignores single nans! """
+
+def interpolate_single(array, axis=-1):
+	""" Linearly interpolates single `nan` values based on their neighbors. """
 
 	new_array = np.copy(array)
+	_fill_single_nans(new_array, axis)
 
-	# 1. find double nans in the array -- i.e. two nans whose neighbors are both NOT nans.
-	# We only count the bottom of the two, to simplify things. (symmetrical so that's good.)
-	nan_positions = np.where(np.isnan(array) & np.isnan(shift_left(array,1)) & ~np.isnan(shift_right(array,1)) & ~np.isnan(shift_left(array,2)))
+	return new_array
 
-	for i in nan_positions[0]:
-		# interpolate between neighbors
-		new_array[i] = (2/3 * new_array[i-1]) + (1/3 * new_array[i+2])
-		new_array[i+1] = (1/3 * new_array[i-1]) + (2/3 * new_array[i+2])
+def interpolate_double(array, axis=-1):
+	""" Linearly interpolates double `nan` values based on their neighbors. Ignores single nans! """
+
+	new_array = np.copy(array)
+	_fill_double_nans(new_array, axis)
 
 	return new_array
 
-def interpolate_spectrum(array):
+def interpolate_spectrum(array, axis=-1):
 	""" Interpolates a spectrum, first doing single-nans, then double-nans """
-	intermediate_array = interpolate_single(array)
-	return interpolate_double(intermediate_array)
 
+	new_array = np.copy(array)
+	_fill_single_nans(new_array, axis)
+	_fill_double_nans(new_array, axis)
 
-def interpolate_datacube(data, spectrum_axis=2, lon_axis=1, lat_axis=0):
+	return new_array
+
+
+def interpolate_datacube(data, spectrum_axis=2, lon_axis=1, lat_axis=0, slab_size=None, out=None):
 	""" 
 	Interpolate missing values in a datacube according to Dame's prescription.
 
-	Default: assumes (b, l, v) cube.
+	Default: assumes (b, l, v) cube; any other order of axes can be given.
+
+	Each step works on the whole cube at once along one axis: every 
+	spectrum, then every longitude slice, then every latitude slice.
+
+	If `slab_size` is given, the cube is processed that many longitudes
+	at a time (with one longitude of overlap either side), writing into
+	`out` if given; `data` and `out` may then be memory-mapped cubes
+	larger than memory.
 
 	"""
 
 	if len(data.shape) != 3:
 		raise ValueError("`data` must have dimensions=3")
 
-	if (spectrum_axis != 2) or (lon_axis != 1) or (lat_axis != 0):
-		raise NotImplementedError("Function can't yet handle different axis permutations")
+	if sorted([spectrum_axis, lon_axis, lat_axis]) != [0, 1, 2]:
+		raise ValueError("`spectrum_axis`, `lon_axis` and `lat_axis` must be 0, 1 and 2 in some order")
 
-	new_data = np.copy(data)
+	if slab_size is not None:
+		def interpolate_slab(slab, indices):
+			return interpolate_datacube(slab, spectrum_axis, lon_axis, lat_axis)
+
+		return process_in_slabs(interpolate_slab, data, out, axis=lon_axis, slab_size=slab_size, halo=1)
 
-	# interpolate each spectrum, fix in-place
-	for l_i in range(new_data.shape[lon_axis]):
-		for b_i in range(new_data.shape[lat_axis]):
+	new_data = np.copy(data)
 
-			old_spectrum = new_data[b_i, l_i, :] # In principle, the order of [b, l, :] should be dependent on spectrum_axis and the like. But I don't know how to do that.
-			new_data[b_i, l_i, :] = interpolate_spectrum(old_spectrum)
+	# interpolate each spectrum
+	_fill_single_nans(new_data, spectrum_axis)
+	_fill_double_nans(new_data, spectrum_axis)
 
 	# interpolate each longitude slice
-	for v_i in range(new_data.shape[spectrum_axis]):
-		for b_i in range(new_data.shape[lat_axis]):
-
-			old_lon_slice = new_data[b_i, :, v_i]
-			new_data[b_i, :, v_i] = interpolate_single(old_lon_slice)
+	_fill_single_nans(new_data, lon_axis)
 
 	# interpolate each latitude slice
-	for v_i in range(new_data.shape[spectrum_axis]):
-		for l_i in range(new_data.shape[lon_axis]):
-
-			old_lat_slice = new_data[:, l_i, v_i]
-			new_data[:, l_i, v_i] = interpolate_single(old_lat_slice)
+	_fill_single_nans(new_data, lat_axis)
 
 	return new_data
-
-
-
-
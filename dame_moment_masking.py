@@ -20,9 +20,12 @@ http://arxiv.org/abs/1101.1499
 from __future__ import division
 
 import numpy as np
+from scipy.ndimage import maximum_filter1d
 
 from FITS_tools.cube_regrid import gsmooth_cube
 
+from slab_processing import process_in_slabs
+
 def integer_to_tuple(x):
     if x >= 0:
         return (x, 0)
@@ -50,15 +53,47 @@ def roll_cube(cube, roll_tuple):
     return shifted_cube
 
 
-def moment_mask(cube, rms_noise, smoothed_rms_noise=None, velocity_smoothing=2, spatial_smoothing=2, clip_at_sigma=5, velocity_axis=0):
+def dilate_mask(mask, half_widths):
+    """
+    Grows a boolean mask by a box of +/- `half_widths` pixels along each axis.
+
+    A pixel ends up in the mask if any pixel within the box around it was
+    in the mask. A box is separable, so this is one running-maximum pass
+    per axis rather than one pass per offset in the box.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray of bool
+    half_widths : sequence of int
+        One per axis of `mask`.
+
+    Returns
+    -------
+    dilated_mask : numpy.ndarray of bool
+
+    """
+
+    if len(half_widths) != mask.ndim:
+        raise ValueError("`half_widths` must match the mask shape")
+
+    dilated_mask = mask.view(np.uint8)
+    for axis, half_width in enumerate(half_widths):
+        if half_width > 0:
+            dilated_mask = maximum_filter1d(dilated_mask, size=2*half_width+1, axis=axis,
+                                            mode='constant', cval=0)
+
+    return dilated_mask.view(bool)
+
+
+def moment_mask(cube, rms_noise, smoothed_rms_noise=None, velocity_smoothing=2, spatial_smoothing=2, clip_at_sigma=5, velocity_axis=0, in_place=False,
+                slab_size=None, slab_axis=None, out=None):
     """
     Moment-masks a cube according to Dame 2011 prescription.
 
     Parameters
     ----------
     cube : numpy.ndarray
-        PPV datacube with velocity axis first (i.e. numpy zero-th axis).
-        Dame (2011) calls this "T (v,x,y)".
+        PPV datacube. Dame (2011) calls this "T (v,x,y)".
     rms_noise : float
         RMS noise per channel in `cube`. 
         Only used if `smoothed_rms_noise` is not given.
@@ -77,18 +112,28 @@ def moment_mask(cube, rms_noise, smoothed_rms_noise=None, velocity_smoothing=2,
     clip_at_sigma : float, optional
         What factor times `smoothed_rms_noise` should the mask cube clip at?
         Dame (2011) recommends that `clip_at_sigma`=5.
+    velocity_axis : int, optional
+        Which numpy axis of `cube` is velocity (default: the zero-th).
+    in_place : bool, optional
+        If True, blank `cube` itself rather than a copy. Handy for big
+        float32 cubes.
+    slab_size : int or None, optional
+        If given, process the cube `slab_size` planes at a time along
+        `slab_axis` (by default, the last non-velocity axis), so that
+        `cube` and `out` can be memory-mapped cubes larger than memory.
+        With `in_place`, each slab is written back into `cube` only once
+        no later slab needs its unmasked planes.
+    out : numpy.ndarray, optional
+        Where to write the result when processing in slabs.
 
     Returns
     -------
     moment_masked_cube : numpy.ndarray
-        A noise-suppressed version of `cube`.
+        A noise-suppressed version of `cube`, of the same dtype.
         Dame (2011) calls this "T_M (v,x,y)".
 
     """
 
-    if velocity_axis != 0:
-        raise NotImplementedError("Velocity axis has to be zero right now.")
-
     # cube : T (v, x, y)
 
     # convert between FWHM and Gaussian "sigma"
@@ -98,9 +143,6 @@ def moment_mask(cube, rms_noise, smoothed_rms_noise=None, velocity_smoothing=2,
     kernelsize = 3 * [spatial_sigma]
     kernelsize[velocity_axis] = velocity_sigma
 
-    # T_s (v, x, y)
-    smooth_cube = gsmooth_cube(cube, kernelsize, kernelsize_mult=4)
-
     if smoothed_rms_noise is None:
         # yes, square root not cube root: noise goes down as (# pixels binned) squared.
         smoothed_rms_noise = 1/np.sqrt(spatial_smoothing*spatial_smoothing*velocity_smoothing) * rms_noise
@@ -108,30 +150,68 @@ def moment_mask(cube, rms_noise, smoothed_rms_noise=None, velocity_smoothing=2,
     # T_c
     clipping_level = clip_at_sigma*smoothed_rms_noise
 
-    # M (v, x, y)
-    mask_cube = np.zeros_like(cube)
-
-    mask_cube[smooth_cube > clipping_level] = 1
-
     # This nomenclature departs from the Dame (2011) paper: 
-    #  My `ns` and `nv` are double that of Dame's.
-    #  I do this to simplify the following code.
+    #  My `ns` and `nv` are double that of Dame's, and the mask extends
+    #  `ns`-1 and `nv`-1 pixels either side of each pixel above T_c.
     ns = spatial_smoothing
     nv = velocity_smoothing
 
-    for dx in range(-ns+1, ns):
+    half_widths = 3 * [max(int(ns)-1, 0)]
+    half_widths[velocity_axis] = max(int(nv)-1, 0)
+
+    if slab_size is not None:
+        if slab_axis is None:
+            slab_axis = max(set(range(3)) - set([velocity_axis]))
+        if in_place:
+            out = cube
 
-        for dy in range(-ns+1, ns):
+        # the smoothing kernel's extent (as in gsmooth_cube), plus the dilation
+        halo = int(kernelsize[slab_axis]*4) + half_widths[slab_axis]
 
-            for dv in range(-nv+1, nv):
+        def moment_mask_slab(slab, indices):
+            outside = (indices < 0) | (indices >= cube.shape[slab_axis])
+            mask_cube = _moment_mask_cube(slab, kernelsize, clipping_level, half_widths,
+                                          outside=(slab_axis, outside))
+            return slab * mask_cube
 
-                # The following line needs to be fixed before we can lift the NotImplementedError exception.
-                rolled_smooth_cube = roll_cube(smooth_cube, (dv, dx, dy)) # assumes data has been transposed (2, 0, 1)
+        # gsmooth_cube's FFT convolution wraps around the cube's edges, so the halos do too
+        return process_in_slabs(moment_mask_slab, cube, out, axis=slab_axis, slab_size=slab_size,
+                                halo=halo, wrap=True)
 
-                mask_cube[rolled_smooth_cube > clipping_level] = 1
+    mask_cube = _moment_mask_cube(cube, kernelsize, clipping_level, half_widths)
 
     # T_M (v, x, y)
-    moment_masked_cube = mask_cube * cube
+    if in_place:
+        moment_masked_cube = cube
+    else:
+        moment_masked_cube = np.empty_like(cube)
+    np.multiply(cube, mask_cube, out=moment_masked_cube)
 
     return moment_masked_cube
-    # , mask_cube, smooth_cube, clipping_level
+
+
+def _moment_mask_cube(cube, kernelsize, clipping_level, half_widths, outside=None):
+    """
+    Computes the (boolean) moment mask M of `cube`.
+
+    `outside`, if given, is an (axis, boolean array) pair marking planes
+    that lie beyond the real data (wrapped-around halos), whose smoothed
+    values are needed but which must not seed the mask.
+
+    """
+
+    # T_s (v, x, y)
+    smooth_cube = gsmooth_cube(cube, kernelsize, kernelsize_mult=4)
+
+    # M (v, x, y)
+    with np.errstate(invalid='ignore'):
+        mask_cube = smooth_cube > clipping_level
+    del smooth_cube
+
+    if outside is not None:
+        axis, outside_planes = outside
+        outside_slices = [slice(None)] * cube.ndim
+        outside_slices[axis] = outside_planes
+        mask_cube[tuple(outside_slices)] = False
+
+    return dilate_mask(mask_cube, half_widths)
@@ -23,6 +23,9 @@ import astropy.io.fits as fits
 
 from astrodendro.scatter import Scatter
 from dendrogal.integrated_viewer import IntegratedViewer
+from dendrogal.production.remove_degenerate_structures import remove_degenerate_structures
+from dendrogal.slab_processing import process_in_slabs
+from dendrogal.resampling import block_reduce, block_reduce_header
 try:
     from dendrogal.reid_distance_assigner import make_reid_distance_column
     from dendrogal.assign_physical_values import assign_size_mass_alpha_pressure
@@ -31,56 +34,29 @@ except:
 
 data_path = os.path.expanduser("~/Dropbox/College/Astro99/DATA/")
 
-# Downsamples a datacube by averaging. Code derived from aplpy.image_util (written by Tom Robitaille)
-def resample_3d(array, factor):
+# Downsamples a datacube by averaging. Originally derived from aplpy.image_util (written by Tom Robitaille)
+def resample_3d(array, factor, dtype=np.float64):
 
-    nx, ny, nz = np.shape(array)
+    return block_reduce(array, (factor, factor, factor), how='mean', dtype=dtype)
 
-    nx_new = nx // factor
-    ny_new = ny // factor
-    nz_new = nz // factor    
-
-    array2 = np.zeros((nx_new, ny, nz))
-    for i in range(nx_new):
-        array2[i, :, :] = np.nanmean(array[i * factor:(i + 1) * factor, :, :], axis=0)
-    del array
-
-    array3 = np.zeros((nx_new, ny_new, nz))
-    for j in range(ny_new):
-        array3[:, j, :] = np.nanmean(array2[:, j * factor:(j + 1) * factor, :], axis=1)
-    del array2
-
-    array4 = np.zeros((nx_new, ny_new, nz_new))
-    for k in range(nz_new):
-        array4[:, :, k] = np.nanmean(array3[:, :, k * factor:(k + 1) * factor], axis=2)
-    del array3
-
-    return array4
-
-def resample_3d_variable(array, x_factor, y_factor, z_factor):
-
-    nx, ny, nz = np.shape(array)
+def resample_3d_variable(array, x_factor, y_factor, z_factor, slab_size=None, out=None, dtype=np.float64):
+    """
+    Downsamples `array` by averaging (ignoring NaNs) over blocks of
+    `x_factor` by `y_factor` by `z_factor` pixels.
 
-    nx_new = nx // x_factor
-    ny_new = ny // y_factor
-    nz_new = nz // z_factor    
+    If `slab_size` is given, `array` is read that many x-planes at a
+    time and the result written into `out` if given, so both may be
+    memory-mapped. `dtype` sets the accumulator and output type.
 
-    array2 = np.zeros((nx_new, ny, nz))
-    for i in range(nx_new):
-        array2[i, :, :] = np.nanmean(array[i * x_factor:(i + 1) * x_factor, :, :], axis=0)
-    del array
+    """
 
-    array3 = np.zeros((nx_new, ny_new, nz))
-    for j in range(ny_new):
-        array3[:, j, :] = np.nanmean(array2[:, j * y_factor:(j + 1) * y_factor, :], axis=1)
-    del array2
+    if slab_size is not None:
+        def resample_slab(slab, indices):
+            return resample_3d_variable(slab, x_factor, y_factor, z_factor, dtype=dtype)
 
-    array4 = np.zeros((nx_new, ny_new, nz_new))
-    for k in range(nz_new):
-        array4[:, :, k] = np.nanmean(array3[:, :, k * z_factor:(k + 1) * z_factor], axis=2)
-    del array3
+        return process_in_slabs(resample_slab, array, out, axis=0, slab_size=slab_size, reduction=x_factor)
 
-    return array4
+    return block_reduce(array, (x_factor, y_factor, z_factor), how='mean', dtype=dtype)
 
 def recenter_wcs_header(input_header, central_value=0):
     """ 
@@ -118,42 +94,31 @@ def downsample_and_transpose_data_and_header(input_data, input_header,
 
         new_data = resample_3d_variable(input_data, *df).transpose(*tt)
         df = tuple(df[i] for i in tt)
+        averaged = True
 
     elif resample and df > 1:
         new_data = resample_3d(input_data, df).transpose(*tt)
         df = (df, df, df)
+        averaged = True
     else:
         # Someday I may improve this with something less crude.
         new_data = input_data[::df, ::df, ::df].transpose(*tt)
         df = (df, df, df)
+        averaged = False
 
-    new_header = input_header.copy()
-
-    # let's transpose. and downsample.
-    new_header['naxis'+str(tt[0]+1)] = input_header['naxis1'] // df[0]
-    new_header['naxis'+str(tt[1]+1)] = input_header['naxis2'] // df[1]
-    new_header['naxis'+str(tt[2]+1)] = input_header['naxis3'] // df[2] 
-
-    new_header['ctype'+str(tt[0]+1)] = input_header['ctype1']
-    new_header['ctype'+str(tt[1]+1)] = input_header['ctype2']
-    new_header['ctype'+str(tt[2]+1)] = input_header['ctype3']
+    # block_reduce_header pairs the last factor with NAXIS1
+    reduced_header = block_reduce_header(input_header, df[::-1])
+    if not averaged:
+        # each new pixel is the first of its block, not its center
+        for i, factor in enumerate(df):
+            n = str(i+1)
+            reduced_header['crpix'+n] = (input_header['crpix'+n] - 1)/factor + 1
 
-    new_header['crval'+str(tt[0]+1)] = input_header['crval1']
-    new_header['crval'+str(tt[1]+1)] = input_header['crval2']
-    new_header['crval'+str(tt[2]+1)] = input_header['crval3']
-
-    new_header['cdelt'+str(tt[0]+1)] = input_header['cdelt1'] * df[0]
-    new_header['cdelt'+str(tt[1]+1)] = input_header['cdelt2'] * df[1]
-    new_header['cdelt'+str(tt[2]+1)] = input_header['cdelt3'] * df[2]
-
-    if resample:
-        new_header['crpix'+str(tt[0]+1)] = (input_header['crpix1'] - 1)//df[0]
-        new_header['crpix'+str(tt[1]+1)] = (input_header['crpix2'] - 1)//df[1]
-        new_header['crpix'+str(tt[2]+1)] = (input_header['crpix3'] - 1)//df[2]
-    else:
-        new_header['crpix'+str(tt[0]+1)] = (input_header['crpix1'] - 1)//df[0] + 1
-        new_header['crpix'+str(tt[1]+1)] = (input_header['crpix2'] - 1)//df[1] + 1
-        new_header['crpix'+str(tt[2]+1)] = (input_header['crpix3'] - 1)//df[2] + 1
+    # let's transpose.
+    new_header = input_header.copy()
+    for i, t in enumerate(tt):
+        for key in ['naxis', 'ctype', 'crval', 'cdelt', 'crpix']:
+            new_header[key+str(t+1)] = reduced_header[key+str(i+1)]
 
     if recenter:
         return_header = recenter_wcs_header(new_header)
@@ -471,23 +436,4 @@ def reduce_selection_to_principal_branches(structures):
 
     """
 
-    structure_set = set(structures)
-
-    # sort by size
-    structures_by_descendants = sorted(structures, key=lambda k: len(k.descendants))
-
-    # from smallest to largest:
-    for little_struct, i in zip(structures_by_descendants, range(len(structures_by_descendants))):
-
-        # ask from largest to smallest:
-        for big_struct in structures_by_descendants[:i:-1]: # backwards, and skip everyone smaller than little_struct
-
-            # "are you my ancestor?" (# wait, why isn't there an "ancestors" property?)
-            if little_struct in big_struct.descendants: 
-
-                # if so, remove the little guy
-                structure_set.remove(little_struct)
-                # and stop asking
-                break 
-
-    return list(structure_set)
\ No newline at end of file
+    return remove_degenerate_structures(structures)
\ No newline at end of file
@@ -0,0 +1,339 @@
+"""
+Precomputed (l, b, v) -> kinematic distance lookup tables.
+
+Kinematic distances only depend on where a structure sits in (l, b, v),
+and every extractor, noise trial and grid search asks for distances
+within the same survey footprint. So we solve each rotation curve once,
+on a regular grid, and afterwards interpolate.
+
+A table holds, at every grid node, the near and far distances and their
++/- errors. When it is built, each grid cell is checked at its center
+against the exact solver; cells where trilinear interpolation is off by
+more than `tolerance` (e.g. straddling a tangent point, where distance
+changes steeply with velocity) are flagged, and lookups that land in a
+flagged cell -- or outside the grid -- are passed to the exact solver.
+
+On disk, a table is a directory of `.npy` arrays plus a small JSON
+description, so that the arrays can be memory-mapped rather than read
+in full.
+
+"""
+
+from __future__ import division
+
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.ndimage import binary_dilation
+
+from rotation_curve_distance import (kinematic_distance, flat_rotation_curve, universal_rotation_curve,
+                                     reid2014_flat_parameters, reid2014_universal_parameters)
+from kinematic_distance import brand_blitz_distances, brand_blitz_parameters
+
+from dendrogal.production.config import distance_lookup_path
+
+# Bump this if the on-disk layout of a table changes.
+table_format_version = 1
+
+value_columns = ('near', 'error_near_plus', 'error_near_minus',
+                 'far', 'error_far_plus', 'error_far_minus')
+
+
+def _reid2014_solver(rotation_curve, parameters):
+    def solver(longitude, latitude, velocity, nearfar):
+        return kinematic_distance(longitude, latitude, velocity, nearfar,
+                                  rotation_curve=rotation_curve, parameters=parameters)[:3]
+    return solver
+
+
+def _brand_blitz_solver(longitude, latitude, velocity, nearfar):
+    distance = brand_blitz_distances(longitude, velocity, nearfar, verbose=False)
+    return distance, np.zeros_like(distance), np.zeros_like(distance)
+
+
+# Each model: a solver(longitude, latitude, velocity, nearfar) that returns
+# (distance, error_plus, error_minus) arrays, and a description of its
+# parameters, which is stored with a table so that stale tables are rebuilt.
+distance_models = {
+    'reid2014_universal': (_reid2014_solver(universal_rotation_curve, reid2014_universal_parameters),
+                           repr(sorted(reid2014_universal_parameters.items()))),
+    'reid2014_flat': (_reid2014_solver(flat_rotation_curve, reid2014_flat_parameters),
+                      repr(sorted(reid2014_flat_parameters.items()))),
+    'brand_blitz': (_brand_blitz_solver, repr(sorted(brand_blitz_parameters.items()))),
+    }
+
+# Survey footprint covered by default: (start, stop, step) per axis.
+default_longitude_axis = (0, 360, 0.5)
+default_latitude_axis = (-5, 5, 1)
+default_velocity_axis = (-200, 200, 1)
+
+
+def _axis_array(start, stop, step):
+    n = int(round((stop - start) / step)) + 1
+    return start + step * np.arange(n)
+
+
+def _solve(solver, longitude, latitude, velocity):
+    """ All six value columns for arrays of points, as a (6, n) array. """
+
+    values = []
+    for nearfar in ['near', 'far']:
+        values.extend(solver(longitude, latitude, velocity, nearfar))
+
+    return np.array(values)
+
+
+class DistanceLookupTable(object):
+    """
+    Kinematic distances tabulated on a regular (l, b, v) grid.
+
+    Parameters
+    ----------
+    model : str
+        Key into `distance_models`.
+    axes : list of (start, step, n) tuples
+        The longitude, latitude and velocity grids (degrees, km/s).
+    values : np.ndarray
+        (6, n_l, n_b, n_v) array of `value_columns` at the grid nodes.
+    accurate : np.ndarray of bool
+        Per grid cell, whether interpolating inside it meets the tolerance.
+    tolerance : float
+        The accuracy (kpc) the table was checked to.
+
+    """
+
+    def __init__(self, model, axes, values, accurate, tolerance):
+
+        self.model = model
+        self.solver = distance_models[model][0]
+        self.axes = [tuple(axis) for axis in axes]
+        self.values = values
+        self.accurate = accurate
+        self.tolerance = tolerance
+
+    @classmethod
+    def build(cls, model, longitude_axis=default_longitude_axis, latitude_axis=default_latitude_axis,
+              velocity_axis=default_velocity_axis, tolerance=0.05, verbose=True):
+        """
+        Solves `model` on a grid and checks where interpolating it is accurate.
+
+        Parameters
+        ----------
+        model : str
+            Key into `distance_models`.
+        longitude_axis, latitude_axis, velocity_axis : tuple
+            (start, stop, step) for each axis. An axis with start == stop
+            is a single plane, which the interpolation treats as constant
+            (useful for models that ignore latitude).
+        tolerance : float, optional
+            Largest acceptable interpolation error, in kpc. A finer grid
+            flags fewer cells, so fewer lookups fall back to the solver.
+
+        """
+
+        solver = distance_models[model][0]
+
+        axis_arrays = [_axis_array(*axis) for axis in [longitude_axis, latitude_axis, velocity_axis]]
+        axes = [(float(array[0]), float(axis[2]), len(array))
+                for array, axis in zip(axis_arrays, [longitude_axis, latitude_axis, velocity_axis])]
+        shape = tuple(len(array) for array in axis_arrays)
+
+        if verbose:
+            print "Building {0} distance lookup table on a {1} grid".format(model, shape)
+
+        nodes = np.meshgrid(*axis_arrays, indexing='ij')
+        values = _solve(solver, *[x.ravel() for x in nodes]).reshape((len(value_columns),) + shape)
+
+        table = cls(model, axes, values.astype(np.float32), np.ones(1, dtype=bool), tolerance)
+
+        # check each cell at its center
+        centers = [(array[:-1] + array[1:]) / 2 if len(array) > 1 else array
+                   for array in axis_arrays]
+        center_points = [x.ravel() for x in np.meshgrid(*centers, indexing='ij')]
+        exact = _solve(solver, *center_points)
+        interpolated = table._interpolate(*center_points)
+
+        with np.errstate(invalid='ignore'):
+            error = np.abs(exact - interpolated)
+            # cells where the model has no solution at all are fine as they are
+            accurate = np.all((error <= tolerance) | (np.isnan(exact) & np.isnan(interpolated)), axis=0)
+
+        # a single check point can miss a sharp feature (a tangent point)
+        # that clips a cell's corner, so distrust the neighbours of failed cells too
+        table.accurate = ~binary_dilation(~accurate.reshape([len(x) for x in centers]),
+                                          structure=np.ones((3, 3, 3), dtype=bool))
+
+        if verbose:
+            print "{0:.1%} of cells can be interpolated to within {1} kpc".format(table.accurate.mean(), tolerance)
+
+        return table
+
+    def save(self, path):
+        """ Writes the table into directory `path`, replacing whatever is there. """
+
+        parent = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        # write next to the destination, then move into place
+        temporary_path = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+        np.save(os.path.join(temporary_path, 'values.npy'), self.values)
+        np.save(os.path.join(temporary_path, 'accurate.npy'), self.accurate)
+
+        description = {'format_version': table_format_version,
+                       'model': self.model,
+                       'model_parameters': distance_models[self.model][1],
+                       'axes': self.axes,
+                       'tolerance': self.tolerance}
+        with open(os.path.join(temporary_path, 'table.json'), 'w') as f:
+            json.dump(description, f)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Reads a table saved by `save`, memory-mapping its arrays by default.
+
+        Raises a ValueError if the table is out of date with its model.
+
+        """
+
+        with open(os.path.join(path, 'table.json')) as f:
+            description = json.load(f)
+
+        model = description['model']
+        if (description['format_version'] != table_format_version or
+                model not in distance_models or
+                description['model_parameters'] != distance_models[model][1]):
+            raise ValueError("Distance lookup table at {0} is out of date.".format(path))
+
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode=mmap_mode)
+        accurate = np.load(os.path.join(path, 'accurate.npy'), mmap_mode=mmap_mode)
+
+        return cls(model, description['axes'], values, accurate, description['tolerance'])
+
+    def _locate(self, longitude, latitude, velocity):
+        """
+        Finds the grid cell (lower node) and fractional offset of each point.
+
+        Returns
+        -------
+        cells, fractions : lists of np.ndarray, one per axis
+        inside : np.ndarray of bool
+            Whether each point lies within the grid.
+
+        """
+
+        cells = []
+        fractions = []
+        inside = np.ones(len(longitude), dtype=bool)
+
+        for x, (start, step, n) in zip([longitude, latitude, velocity], self.axes):
+            if n == 1:
+                cells.append(np.zeros(len(x), dtype=int))
+                fractions.append(np.zeros(len(x)))
+                continue
+
+            position = (x - start) / step
+            inside &= (position >= 0) & (position <= n - 1)
+
+            cell = np.clip(np.floor(position).astype(int), 0, n - 2)
+            cells.append(cell)
+            fractions.append(np.clip(position - cell, 0, 1))
+
+        return cells, fractions, inside
+
+    def _interpolate(self, longitude, latitude, velocity, columns=slice(None)):
+        """ Trilinear interpolation of `values[columns]` at each point. """
+
+        cells, fractions, inside = self._locate(longitude, latitude, velocity)
+        values = self.values[columns]
+
+        result = 0
+        for corner in np.ndindex(2, 2, 2):
+            weight = 1
+            index = []
+            for offset, cell, fraction, (start, step, n) in zip(corner, cells, fractions, self.axes):
+                weight = weight * (fraction if offset else 1 - fraction)
+                index.append(np.minimum(cell + offset, n - 1))
+            result = result + weight * values[(Ellipsis,) + tuple(index)]
+
+        return result
+
+    def check_model(self, model):
+        """ Raises ValueError unless this table holds the distances of `model`. """
+
+        if self.model != model:
+            raise ValueError("This table holds '{0}' distances, not '{1}'.".format(self.model, model))
+
+    def lookup(self, longitude, latitude, velocity, nearfar='near'):
+        """
+        Interpolates distances and errors for arrays of points.
+
+        Points outside the grid, or in cells that failed the accuracy
+        check, are solved exactly.
+
+        Returns
+        -------
+        distance, error_plus, error_minus : np.ndarray
+            In kpc.
+
+        """
+
+        if nearfar not in ['near', 'far']:
+            raise ValueError("`nearfar` must be 'near' or 'far'.")
+
+        longitude, latitude, velocity = [np.atleast_1d(np.asarray(x, dtype=float))
+                                         for x in np.broadcast_arrays(longitude, latitude, velocity)]
+        longitude = longitude % 360
+
+        first_column = value_columns.index(nearfar)
+        columns = slice(first_column, first_column + 3)
+
+        result = self._interpolate(longitude, latitude, velocity, columns).astype(float)
+
+        cells, fractions, inside = self._locate(longitude, latitude, velocity)
+        accurate_cells = np.zeros(len(longitude), dtype=bool)
+        accurate_cells[inside] = self.accurate[tuple(cell[inside] for cell in cells)]
+
+        needs_solving = ~accurate_cells
+        if np.any(needs_solving):
+            result[:, needs_solving] = self.solver(longitude[needs_solving], latitude[needs_solving],
+                                                   velocity[needs_solving], nearfar)
+
+        distance, error_plus, error_minus = result
+        return distance, error_plus, error_minus
+
+
+def distance_lookup_table(model, lookup_path=distance_lookup_path, **build_kwargs):
+    """
+    Loads the lookup table for `model`, building and saving it if needed.
+
+    Parameters
+    ----------
+    model : str
+        Key into `distance_models`.
+    lookup_path : str, optional
+        Directory holding one table directory per model.
+    build_kwargs :
+        Passed to `DistanceLookupTable.build` when (re)building.
+
+    """
+
+    path = os.path.join(lookup_path, model)
+
+    try:
+        return DistanceLookupTable.load(path)
+    except (IOError, OSError, ValueError):
+        pass
+
+    table = DistanceLookupTable.build(model, **build_kwargs)
+    table.save(path)
+
+    return DistanceLookupTable.load(path)
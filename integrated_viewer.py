@@ -10,6 +10,8 @@ import matplotlib.pyplot as plt
 
 from wcsaxes import WCSAxes
 
+from dendrogal.production.moment_maps import moment_maps_for
+
 class IntegratedViewer(object):
     def __init__(self, dendrogram, hub, alignment='horizontal', cmap=plt.cm.gray,
                  clip_velocity=None, aspect=2.5, linewidths=0.9, figsize=None):
@@ -60,12 +62,11 @@ class IntegratedViewer(object):
             self.ax_lb = self.fig.add_axes(ax_lb_limits)
             self.ax_lv = self.fig.add_axes(ax_lv_limits)
 
-        array_lb = np.nansum(self.datacube, axis=0)
-        array_lb[(array_lb < 0) | np.isinf(array_lb) | np.isnan(array_lb)] = 0
+        moment_maps = moment_maps_for(self.datacube)
+        array_lb = moment_maps.lb()
         self.array_lb = array_lb
 
-        array_lv = np.nansum(self.datacube, axis=1)
-        array_lv[(array_lv < 0) | np.isinf(array_lv) | np.isnan(array_lv)] = 0
+        array_lv = moment_maps.lv()
         self.array_lv = array_lv
 
         if clip_velocity is None:
@@ -15,10 +15,22 @@ import astropy.io.fits as fits
 
 from dame_interpolation import interpolate_datacube
 from dame_moment_masking import moment_mask
+from slab_processing import create_memmapped_fits
 
 data_path = os.path.expanduser("~/Dropbox/College/Astro99/DATA/")
 
-def create_intermom_file(filename, memmap=False, clobber=False, rms_noise=None):
+def create_intermom_file(filename, memmap=False, clobber=False, rms_noise=None, slab_size=None):
+    """
+    Interpolates a *mom.fits file, or moment-masks an *interp.fits file.
+
+    If `slab_size` is given, the input is memory-mapped and processed in
+    slabs of that many planes, straight into a memory-mapped output file,
+    so cubes larger than memory can be handled.
+
+    """
+
+    if slab_size is not None:
+        memmap = True
 
     beginning = datetime.datetime.now()
 
@@ -37,7 +49,12 @@ def create_intermom_file(filename, memmap=False, clobber=False, rms_noise=None):
             print "{0} not saved: clobber=False".format(new_filename)
             return
 
-        new_data = interpolate_datacube(data)
+        if slab_size is not None:
+            output = create_memmapped_fits(new_filename, data.shape, data.dtype.newbyteorder('='), header, clobber=clobber)
+            interpolate_datacube(data, slab_size=slab_size, out=output[0].data)
+            output.close()
+        else:
+            new_data = interpolate_datacube(data)
 
     elif "_interp.fits" in filename: 
         data, header = getdata(filename, memmap=memmap, header=True)
@@ -53,16 +70,22 @@ def create_intermom_file(filename, memmap=False, clobber=False, rms_noise=None):
             print "{0} not saved: clobber=False".format(new_filename)
             return
 
-        new_data = moment_mask(data, rms_noise)
+        if slab_size is not None:
+            output = create_memmapped_fits(new_filename, data.shape, data.dtype.newbyteorder('='), header, clobber=clobber)
+            moment_mask(data, rms_noise, slab_size=slab_size, out=output[0].data)
+            output.close()
+        else:
+            new_data = moment_mask(data, rms_noise)
 
     else:
         raise ValueError("This function is only intended for files ending in *mom.fits or *interp.fits")
 
-    try:
-        fits.writeto(new_filename, new_data, header, clobber=clobber)        
-    except IOError, e:
-        print "File not saved: {0}".format(e)
-        return
+    if slab_size is None:
+        try:
+            fits.writeto(new_filename, new_data, header, clobber=clobber)        
+        except IOError, e:
+            print "File not saved: {0}".format(e)
+            return
 
     end = datetime.datetime.now()
     time_elapsed = (end - beginning)
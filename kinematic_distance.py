@@ -14,29 +14,51 @@ from astropy.coordinates import Galactic
 import astropy.units as u
 import astropy.constants as c
 
-brand_blitz_parameters = dict()
+#- rotation curve from Brand & Blitz (1993), here flat; ro and vo from Reid et al. (2014)
+brand_blitz_parameters = dict(a1=1, a2=0, a3=0, ro=8.34, vo=240)
 
-def make_blitz_distance_column(catalog, nearfar='near'):
-    """ Makes a Blitz distance column. """
+def brand_blitz_distances(longitude, velocity, nearfar='near', verbose=True):
+    """
+    Brand & Blitz distances for arrays of longitude and velocity.
 
-    nearfar_dict = {'near': 0, 'far': 1}
+    Where the near distance is geometrically negative, the far one is
+    used; where neither is positive, the distance is NaN.
 
-    distance_list = []
+    """
 
-    for row in catalog:
-    	blitz_output = brand_blitz_kinematic_distance(row['x_cen'], row['v_cen'])
+    if nearfar not in ['near', 'far']:
+        raise ValueError("`nearfar` must be 'near' or 'far'.")
 
-    	# Sometimes the "near" distance is geometrically negative - obviously, use the far one.
-    	if blitz_output[0] < 0:
-    		if blitz_output[1] < 0:
-    			blitz_output = [np.nan, np.nan]
-    		else:
-    			blitz_output[0] = blitz_output[1]
+    near, far = brand_blitz_kinematic_distances(longitude, velocity, verbose=verbose)
 
-    	distance_list.append(blitz_output[nearfar_dict[nearfar]])
+    # Sometimes the "near" distance is geometrically negative - obviously, use the far one.
+    with np.errstate(invalid='ignore'):
+        far = np.where(far < 0, np.nan, far)
+        near = np.where(near < 0, far, near)
+
+    if nearfar == 'near':
+        return near
+    else:
+        return far
+
+def make_blitz_distance_column(catalog, nearfar='near', lookup_table=None):
+    """ 
+    Makes a Blitz distance column. 
+
+    If a `distance_lookup_table.DistanceLookupTable` for the 'brand_blitz'
+    model is given (any other raises a ValueError), distances are
+    interpolated from it.
+
+    """
+
+    if lookup_table is not None:
+        lookup_table.check_model('brand_blitz')
+        distances = lookup_table.lookup(catalog['x_cen'], catalog['y_cen'], catalog['v_cen'], nearfar)[0]
+    else:
+        distances = brand_blitz_distances(catalog['x_cen'], catalog['v_cen'], nearfar)
 
     distance_column = astropy.table.Column(
-        data=distance_list, 
+        data=distances, 
         name="Distance")
 
     distance_column.units = u.kpc    
@@ -57,9 +79,10 @@ def assign_blitz_distances(catalog, nearfar='near'):
 
 
 
-def brand_blitz_kinematic_distance(longitude, velocity, galaxy_parameters=brand_blitz_parameters):
+def brand_blitz_kinematic_distances(longitude, velocity, galaxy_parameters=brand_blitz_parameters,
+                                    verbose=True, chunk_size=10000):
 	"""
-	Computes a kdist for a given (l,b) pair.
+	Computes kdists for arrays of longitude and velocity, all at once.
 
 	- notation:
 	 v : rotation velocity
@@ -72,66 +95,103 @@ def brand_blitz_kinematic_distance(longitude, velocity, galaxy_parameters=brand_
 	 v/vo = a1 * (R/Ro)^a2 + a3
 	 vr = sin(l) * vo * [ a1 * (r/ro)^(a2-1) + a3*(r/ro)^-1 - 1]
 
+	Returns
+	-------
+	near, far : np.ndarray
+	    In kpc. Equal where there is one solution, NaN where there are none.
+
 	"""
-	l = np.radians(longitude) % 2*np.pi
 
-	a1=1
-	a2=0
-	a3=0
+	longitude, velocity = [np.atleast_1d(np.asarray(x, dtype=float)) 
+	                       for x in np.broadcast_arrays(longitude, velocity)]
 
-	#- the following are from Reid et al. (2014)
-	ro=8.34
-	vo=240 # aka theta_0
+	l = np.radians(longitude) % (2*np.pi)
 
-	r = (np.arange(2000) + 1) / 2000 * 2 * ro
-	root = np.sin(l) * vo * (a1 * (r/ro)**(a2-1) + a3 * (r/ro)**(-1) - 1) - velocity
+	a1 = galaxy_parameters['a1']
+	a2 = galaxy_parameters['a2']
+	a3 = galaxy_parameters['a3']
+	ro = galaxy_parameters['ro']
+	vo = galaxy_parameters['vo']
 
-	#find the zero crossing
-	root *= np.roll(root,1)
-	root[0] = 1
-	root[-1] = 1
+	r_grid = (np.arange(2000) + 1) / 2000 * 2 * ro
+	rotation_term = vo * (a1 * (r_grid/ro)**(a2-1) + a3 * (r_grid/ro)**(-1) - 1)
 
-	hit = np.where(root < 0)
+	# find the first zero crossing along the radius grid
+	# (a crossing into the last grid point doesn't count)
+	r = np.full(len(l), np.nan)
+	sin_l = np.sin(l)
 
-	if len(hit[0]) < 1:
-		print 'Cannot determine galactocentric distance'
-		print 'returned 0 (NaN) solutions'
-		return [np.nan, np.nan]
-	r=r[hit[0]][0]
+	if np.all(np.diff(rotation_term) < 0):
+		# the usual case: the root is where rotation_term passes v / sin(l), 
+		# and since it only ever decreases, we can binary-search for it
+		has_sin = sin_l != 0
+		target = velocity[has_sin] / sin_l[has_sin]
+		hit = len(r_grid) - np.searchsorted(rotation_term[::-1], target, side='right')
 
-	warnmsg = 'Warning: The galactocentric distance extrapolates the measured galactic roation curve'
-	if (r < 2 or r > 17):
-		print warnmsg
+		has_root = (hit >= 1) & (hit <= len(r_grid) - 2)
+		has_root[has_root] &= rotation_term[hit[has_root]] != target[has_root]
+		r[np.where(has_sin)[0][has_root]] = r_grid[hit[has_root]]
 
-	# Having determined "r", we now need to solve the triangle and find
-	# "d". If "l" is acute, there are (usually) two possible solutions; if
-	# "l" is obtuse, then there should be one unique solution.
+	else:
+		for start in range(0, len(l), chunk_size):
+			chunk = slice(start, start + chunk_size)
+			root = sin_l[chunk, np.newaxis] * rotation_term - velocity[chunk, np.newaxis]
+			crossing = (root[:, 1:-1] * root[:, :-2]) < 0
 
-	# Case I: obtuse l - 1 solution
+			has_root = crossing.any(axis=1)
+			hit = np.argmax(crossing, axis=1) + 1
+			r[chunk][has_root] = r_grid[hit[has_root]]
 
-	if (l >= np.pi/2) and (l < 3*np.pi/2): 
+	no_root = np.isnan(r)
+	extrapolated = ~no_root & ((np.nan_to_num(r) < 2) | (np.nan_to_num(r) > 17))
 
-	   # "Gamma" and "Beta" refer to the angles opposite "ro" and "d", 
-	   # respectively. (I made a triangle to sketch this all out.)
-	   gamma = np.arcsin( ro / r * np.sin(l))
-	   beta = np.pi - ( l + gamma)
-	   d = r * np.sin(beta) / np.sin( l )
+	# Having determined "r", we now need to solve the triangle and find
+	# "d". If "l" is acute, there are (usually) two possible solutions; if
+	# "l" is obtuse, then there should be one unique solution.
+	obtuse = (l >= np.pi/2) & (l < 3*np.pi/2)
+
+	near = np.full(len(l), np.nan)
+	far = np.full(len(l), np.nan)
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		# Case I: obtuse l - 1 solution
+		# "Gamma" and "Beta" refer to the angles opposite "ro" and "d", 
+		# respectively. (I made a triangle to sketch this all out.)
+		gamma = np.arcsin( ro / r[obtuse] * np.sin(l[obtuse]))
+		beta = np.pi - ( l[obtuse] + gamma)
+		near[obtuse] = far[obtuse] = r[obtuse] * np.sin(beta) / np.sin( l[obtuse] )
+
+		# Case II: acute l - 2 or 0 solutions
+		acute = ~obtuse
+		rmin = ro*np.cos(l[acute])
+		dr = np.sqrt(r[acute]**2-(ro*np.sin(l[acute]))**2)
+		near[acute] = rmin-dr
+		far[acute] = rmin+dr
+
+	unreproducible = acute & ~no_root & ~np.isfinite(far)
+
+	if verbose:
+		if np.any(no_root):
+			print 'Cannot determine galactocentric distance for {0} of {1} sources: returned NaN'.format(
+				no_root.sum(), len(l))
+		if np.any(unreproducible):
+			print 'Motion cannot be reproduced via galactic rotation for {0} of {1} sources: returned NaN'.format(
+				unreproducible.sum(), len(l))
+		if np.any(extrapolated):
+			print 'Warning: for {0} of {1} sources, the galactocentric distance extrapolates the measured galactic rotation curve'.format(
+				extrapolated.sum(), len(l))
+
+	return near, far
 
-	   print 'returned one solution'
-	   return [d, d]
 
-	# Case II: acute l - 2 or 0 solutions
+def brand_blitz_kinematic_distance(longitude, velocity, galaxy_parameters=brand_blitz_parameters):
+	"""
+	Computes a kdist for a given (l, v) pair; see `brand_blitz_kinematic_distances`.
 
-	else:
+	Returns [near, far].
 
-	   rmin = ro*np.cos(l)
-	   dr = np.sqrt(r**2-(ro*np.sin(l))**2)
-	   if ~np.isfinite(dr):
-	      print 'motion cannot be reproduced via galactic rotation'
-	      print 'returned 0 (NaN) solutions'
-	      return [np.nan, np.nan]
-	   else:
-	      print 'returned 2 solutions'
-	      return [rmin-dr,rmin+dr]
+	"""
 
+	near, far = brand_blitz_kinematic_distances(longitude, velocity, galaxy_parameters)
 
+	return [near[0], far[0]]
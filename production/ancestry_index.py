@@ -0,0 +1,183 @@
+"""
+A nested-interval index for answering ancestry questions about a dendrogram.
+
+Numbering the structures in prefix (depth-first) order makes every subtree
+a contiguous run of numbers: structure `a` is an ancestor of `b` exactly
+when `b`'s position falls inside `a`'s run. With that, and a sparse table
+of depths over the same ordering, we can ask
+
+ - is `a` an ancestor of `b`?
+ - what is the lowest common ancestor of `a` and `b`?
+ - what are all the descendants of `a`?
+ - which structures in a selection are not descended from any other
+   structure in the selection (its "principal branches")?
+
+in constant time per structure (or per pair), instead of building
+`struct.descendants` lists over and over.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from .structure_statistics import accumulate_over_subtrees
+
+
+class AncestryIndex(object):
+    """
+    Nested-interval index over the trees rooted at `trunk`.
+
+    All methods accept and return structure idx values (scalars or arrays).
+
+    Parameters
+    ----------
+    trunk : list of astrodendro.structure.Structure
+        Root structures; usually `d.trunk`.
+
+    """
+
+    def __init__(self, trunk):
+
+        preorder = []
+        parents = []
+        depths = []
+
+        # iterative, so deep trees can't overflow the stack
+        todo = [(struct, -1, 0) for struct in reversed(list(trunk))]
+        while todo:
+            struct, parent_idx, depth = todo.pop()
+            preorder.append(struct.idx)
+            parents.append(parent_idx)
+            depths.append(depth)
+            todo.extend((child, struct.idx, depth+1) for child in reversed(struct.children))
+
+        self.preorder = np.array(preorder, dtype=int)
+        n_slots = self.preorder.max() + 1 if len(preorder) > 0 else 0
+
+        self.position = -np.ones(n_slots, dtype=int)
+        self.position[self.preorder] = np.arange(len(preorder))
+
+        self.parent = -np.ones(n_slots, dtype=int)
+        self.parent[self.preorder] = parents
+
+        self.depth = np.zeros(n_slots, dtype=int)
+        self.depth[self.preorder] = depths
+
+        subtree_size = accumulate_over_subtrees(
+            (self.position > -1).astype(int), self.parent, self.depth)
+        # last prefix-order position inside each structure's subtree
+        self.end = self.position + subtree_size - 1
+
+        self._build_sparse_table(np.array(depths, dtype=int))
+
+    def _build_sparse_table(self, preorder_depths):
+        """ table[k][i] is the position of the shallowest structure in [i, i + 2**k). """
+
+        self._preorder_depths = preorder_depths
+        self._table = [np.arange(len(preorder_depths))]
+
+        k = 1
+        while 2**k <= len(preorder_depths):
+            previous = self._table[-1]
+            left = previous[:len(previous) - 2**(k-1)]
+            right = previous[2**(k-1):]
+            self._table.append(np.where(preorder_depths[left] <= preorder_depths[right], left, right))
+            k += 1
+
+    def _shallowest_position(self, lo, hi):
+        """ Position of the shallowest structure in the inclusive position range [lo, hi]. """
+
+        k = np.floor(np.log2(hi - lo + 1)).astype(int)
+
+        left = np.empty_like(lo)
+        right = np.empty_like(lo)
+        for level in np.unique(k):
+            at_level = k == level
+            left[at_level] = self._table[level][lo[at_level]]
+            right[at_level] = self._table[level][hi[at_level] - 2**level + 1]
+
+        return np.where(self._preorder_depths[left] <= self._preorder_depths[right], left, right)
+
+    def is_ancestor(self, a, b):
+        """ Whether `a` is a (strict) ancestor of `b`. """
+
+        position_b = self.position[b]
+
+        return (self.position[a] < position_b) & (position_b <= self.end[a])
+
+    def lowest_common_ancestor(self, a, b):
+        """
+        The deepest structure containing both `a` and `b` (which may be `a` or `b`).
+
+        Returns -1 where `a` and `b` are in different trees.
+
+        """
+
+        scalar_input = np.ndim(a) == 0 and np.ndim(b) == 0
+        a, b = np.broadcast_arrays(np.atleast_1d(a), np.atleast_1d(b))
+
+        position_a = self.position[a]
+        position_b = self.position[b]
+        lo = np.minimum(position_a, position_b)
+        hi = np.maximum(position_a, position_b)
+
+        lca = a.copy()
+        distinct = lo != hi
+        if np.any(distinct):
+            # the shallowest structure strictly after `lo`, up to `hi`, is a
+            # child of the common ancestor (or a trunk structure, if none)
+            shallowest = self._shallowest_position(lo[distinct] + 1, hi[distinct])
+            lca[distinct] = self.parent[self.preorder[shallowest]]
+
+        if scalar_input:
+            return lca[0]
+        return lca
+
+    def descendants(self, a):
+        """ All descendants of `a`, in prefix order. """
+
+        return self.preorder[self.position[a]+1:self.end[a]+1]
+
+    def principal_branches(self, selection):
+        """
+        Reduces `selection` to those structures that are not descendants of
+        any other structure in `selection`.
+
+        Returns
+        -------
+        principal_idx : np.ndarray
+            The surviving idx values, in the order they appear in `selection`.
+
+        """
+
+        selection = np.asarray(selection, dtype=int)
+        if len(selection) == 0:
+            return selection
+
+        positions = self.position[selection]
+        order = np.argsort(positions, kind='mergesort')
+        ends = self.end[selection][order]
+
+        # Subtrees are either nested or disjoint, so in prefix order a
+        # structure lies inside an earlier one exactly when it starts before
+        # the furthest end seen so far.
+        furthest_end = np.concatenate(([-1], np.maximum.accumulate(ends)[:-1]))
+        keep = np.zeros(len(selection), dtype=bool)
+        keep[order] = positions[order] > furthest_end
+
+        return selection[keep]
+
+
+def ancestry_index(d):
+    """
+    Returns the `AncestryIndex` of dendrogram `d`, building it on first use.
+
+    The index is stored on `d`; it goes stale if `d` is later pruned.
+
+    """
+
+    if getattr(d, '_ancestry_index', None) is None:
+        d._ancestry_index = AncestryIndex(d.trunk)
+
+    return d._ancestry_index
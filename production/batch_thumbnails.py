@@ -0,0 +1,344 @@
+"""
+Renders per-cloud thumbnails (l-b map, l-v map, dendrogram) in batches.
+
+`make_thumbnail_dendro_figure` builds a whole new figure per cloud: new
+WCSAxes, the full dendrogram tree plotted again, and the cube integrated
+again over the cloud's velocity (or latitude) window. Here each process
+builds one `ThumbnailTemplate` -- axes, tick formatting and the full tree
+drawn once -- and then, per cloud, only swaps in a cropped map from the
+shared moment maps, the cloud's contours, ellipses and highlighted
+subtree, saves, and takes those artists away again.
+
+Figures are drawn with the Agg canvas directly, never through pyplot, so
+no figure windows or pyplot bookkeeping pile up over a long batch.
+
+"""
+
+from __future__ import division
+
+import multiprocessing
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Ellipse
+
+import astropy.units as u
+
+from wcsaxes import WCSAxes
+
+from dendrogal.production.dame_color_dict import dame_cmap
+from dendrogal.production.integrated_map_figure import (latitude_world2pix, velocity_world2pix,
+                                                        sanitize_integration_limits)
+from dendrogal.production.moment_maps import moment_maps_for
+
+colorbrewer_red = '#e41a1c'
+colorbrewer_blue = '#377eb8'
+
+# what each worker process renders; set in the parent before the pool forks
+_batch_state = {}
+
+
+def _window(center, half_width, n):
+    """ A slice of pixels around `center`, one pixel wider than the panel on either side. """
+
+    low = int(np.floor(center - half_width)) - 1
+    high = int(np.ceil(center + half_width)) + 2
+
+    return slice(min(max(low, 0), n), min(max(high, 0), n))
+
+
+def _pixel_edges(window):
+    """ imshow `extent` limits placing a cropped map at its pixel coordinates in the full map. """
+
+    return window.start - 0.5, window.stop - 0.5
+
+
+class ThumbnailTemplate(object):
+    """
+    A thumbnail figure for one dendrogram, re-used for each cloud in turn.
+
+    Parameters
+    ----------
+    dendrogram : astrodendro.dendrogram.Dendrogram
+        Over a (v, b, l) cube, with a WCS.
+    catalog : astropy.table.Table
+        Needs '_idx', 'x_cen', 'y_cen', 'v_cen', 'v_rms', 'radius',
+        'major_sigma', 'minor_sigma' and 'position_angle'.
+    panel_width : astropy.units.Quantity, optional
+        Width of the map panels.
+    latitude_px_override : (int, int), optional
+        Latitude pixels to integrate the l-v map over, for every cloud.
+    moment_maps : `moment_maps.MomentMaps`, optional
+        Defaults to the shared `moment_maps_for(dendrogram.data)`.
+    cmap : optional
+
+    """
+
+    def __init__(self, dendrogram, catalog, panel_width=7*u.deg, latitude_px_override=None,
+                 moment_maps=None, cmap=dame_cmap):
+
+        d = dendrogram
+
+        self.dendrogram = d
+        self.catalog = catalog
+        self.rows = dict((idx, i) for i, idx in enumerate(catalog['_idx']))
+        self.half_width = (panel_width/2).to(u.deg).value
+        self.latitude_px_override = latitude_px_override
+        if moment_maps is None:
+            moment_maps = moment_maps_for(d.data)
+        self.moment_maps = moment_maps
+
+        self.spatial_scale = np.abs(d.wcs.wcs.cdelt[0])
+        self.velocity_scale = np.abs(d.wcs.wcs.cdelt[2])
+        aspect_in_units = 5*(u.km/u.s)/u.deg
+        self.aspect_px = ((self.velocity_scale*u.km/u.s)/(self.spatial_scale*u.deg)/aspect_in_units).decompose().value
+
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+
+        # the tree is drawn once; each cloud just adds its highlighted subtree
+        self.ax_dendro = self.fig.add_subplot(122)
+        self.plotter = d.plotter()
+        self.plotter.plot_tree(self.ax_dendro, color='black')
+        self.ax_dendro.set_ylabel("Intensity (K)")
+        for label in self.ax_dendro.get_xticklabels():
+            label.set_visible(False)
+
+        self.ax_lb = self.fig.add_axes(WCSAxes(self.fig, [0.1, 0.55, 0.35, 0.35], wcs=d.wcs, slices=('x', 'y', 0)))
+        self.ax_lv = self.fig.add_axes(WCSAxes(self.fig, [0.1, 0.1, 0.35, 0.35], wcs=d.wcs, slices=('x', 0, 'y')))
+
+        self.image_lb = self.ax_lb.imshow(np.zeros((1, 1)), origin='lower', interpolation='nearest',
+                                          cmap=cmap, aspect=1)
+        self.image_lv = self.ax_lv.imshow(np.zeros((1, 1)), origin='lower', interpolation='nearest',
+                                          cmap=cmap, aspect=self.aspect_px)
+
+        for coordinate, label in [(self.ax_lb.coords['glon'], r"$l$ (deg)"),
+                                  (self.ax_lb.coords['glat'], r"$b$ (deg)"),
+                                  (self.ax_lv.coords['glon'], r"$l$ (deg)")]:
+            coordinate.set_ticks(spacing=2*u.deg, color='white', exclude_overlapping=True)
+            coordinate.display_minor_ticks(True)
+            coordinate.set_axislabel(label, minpad=1.5)
+
+        # each panel's third coordinate is constant across it; give it no ticks to place
+        self.ax_lb.coords['vopt'].set_ticks(values=[] * u.m/u.s)
+        self.ax_lv.coords['glat'].set_ticks(values=[] * u.deg)
+
+        vlsr = self.ax_lv.coords['vopt']
+        vlsr.set_ticks(spacing=10*u.m/u.s, color='white', exclude_overlapping=True) # erroneous units - why!?
+        vlsr.display_minor_ticks(True)
+        vlsr.set_axislabel(r"$v_{LSR}$ (km s$^{-1}$)")
+        vlsr.set_ticklabel_position('lr')
+
+    def _draw_ellipses(self, ax, xy, width, height, angle=0):
+        """ A red ellipse over a broader white one, as in the single-cloud thumbnails. """
+
+        artists = []
+        for edgecolor, linewidth, alpha, zorder in [(colorbrewer_red, 1.5, None, 0.95),
+                                                    ('white', 5, 0.8, 0.9)]:
+            e = Ellipse(xy=xy, width=width, height=height, angle=angle)
+            ax.add_artist(e)
+            e.set_facecolor('none')
+            e.set_edgecolor(edgecolor)
+            e.set_linewidth(linewidth)
+            e.set_zorder(zorder)
+            if alpha is not None:
+                e.set_alpha(alpha)
+            artists.append(e)
+
+        return artists
+
+    def _draw_mask(self, ax, mask, x_window, y_window):
+        """ Contours a cropped 2-d mask; returns the contour sets. """
+
+        if not mask.any():
+            return []
+
+        x = np.arange(x_window.start, x_window.stop)
+        y = np.arange(y_window.start, y_window.stop)
+
+        return [ax.contour(x, y, mask, levels=[0.5], colors=colorbrewer_blue, linewidths=2, zorder=0.85),
+                ax.contour(x, y, mask, levels=[0.5], colors='white', linewidths=3, zorder=0.8)]
+
+    def render(self, cloud_idx, filename, annotation=None, **savefig_kwargs):
+        """
+        Draws cloud `cloud_idx` into the template and saves it to `filename`.
+
+        Parameters
+        ----------
+        cloud_idx : int
+        filename : str
+            The format follows the extension, as in `Figure.savefig`.
+        annotation : str, optional
+            Text written below the figure (e.g. catalog properties).
+        savefig_kwargs :
+            Passed to `Figure.savefig`; `bbox_inches` defaults to 'tight'.
+
+        """
+
+        d = self.dendrogram
+        row = self.catalog[self.rows[cloud_idx]]
+        structure = d[cloud_idx]
+
+        l_px, b_px, v_px = d.wcs.wcs_world2pix(np.array([[row['x_cen'], row['y_cen'], row['v_cen']]]), 0)[0]
+        n_v, n_b, n_l = d.data.shape
+
+        half_width_px = self.half_width / self.spatial_scale
+        velocity_half_width_px = 17.5/3.5 * self.half_width / self.velocity_scale
+
+        l_window = _window(l_px, half_width_px, n_l)
+        b_window = _window(b_px, half_width_px, n_b)
+        v_window = _window(v_px, velocity_half_width_px, n_v)
+
+        # integrate over the cloud's velocities (lb) and latitudes (lv)
+        velocity_limits = velocity_world2pix(d.wcs, [row['v_cen'] - 3*row['v_rms'], row['v_cen'] + 3*row['v_rms']])
+        velocity_limits = sanitize_integration_limits(velocity_limits, d.data, axis=0)
+        array_lb = self.moment_maps.lb(velocity_limits, window=(b_window, l_window))
+
+        if self.latitude_px_override is None:
+            latitude_limits = latitude_world2pix(d.wcs, [row['y_cen'] - 3*row['radius'], row['y_cen'] + 3*row['radius']])
+            latitude_limits = sanitize_integration_limits(latitude_limits, d.data, axis=1)
+        else:
+            latitude_limits = self.latitude_px_override
+        array_lv = self.moment_maps.lv(latitude_limits, window=(v_window, l_window))
+
+        for image, array, x_window, y_window in [(self.image_lb, array_lb, l_window, b_window),
+                                                 (self.image_lv, array_lv, l_window, v_window)]:
+            image.set_data(np.log10(array + 1))
+            image.set_extent(_pixel_edges(x_window) + _pixel_edges(y_window))
+            image.autoscale()
+
+        # the cloud's own artists, removed again once it's saved
+        artists = []
+
+        artists += self._draw_ellipses(self.ax_lb, (l_px, b_px),
+                                       width=2*row['major_sigma']/self.spatial_scale,
+                                       height=2*row['minor_sigma']/self.spatial_scale,
+                                       angle=row['position_angle'])
+        artists += self._draw_ellipses(self.ax_lv, (l_px, v_px),
+                                       width=2*row['major_sigma']/self.spatial_scale,
+                                       height=2*row['v_rms']/self.velocity_scale)
+
+        v, b, l = structure.indices(subtree=True)
+        mask_lb = np.zeros((b_window.stop - b_window.start, l_window.stop - l_window.start), dtype=bool)
+        mask_lv = np.zeros((v_window.stop - v_window.start, l_window.stop - l_window.start), dtype=bool)
+        in_lb = ((b >= b_window.start) & (b < b_window.stop) & (l >= l_window.start) & (l < l_window.stop))
+        in_lv = ((v >= v_window.start) & (v < v_window.stop) & (l >= l_window.start) & (l < l_window.stop))
+        mask_lb[b[in_lb] - b_window.start, l[in_lb] - l_window.start] = True
+        mask_lv[v[in_lv] - v_window.start, l[in_lv] - l_window.start] = True
+
+        contour_sets = (self._draw_mask(self.ax_lb, mask_lb, l_window, b_window) +
+                        self._draw_mask(self.ax_lv, mask_lv, l_window, v_window))
+
+        self.ax_lb.set_xlim(l_px - half_width_px, l_px + half_width_px)
+        self.ax_lb.set_ylim(b_px - half_width_px, b_px + half_width_px)
+        self.ax_lv.set_xlim(l_px - half_width_px, l_px + half_width_px)
+        self.ax_lv.set_ylim(v_px - velocity_half_width_px, v_px + velocity_half_width_px)
+
+        # highlight the cloud's subtree, and zoom to it
+        subtree_lines = self.plotter.get_lines(structures=[structure], color=colorbrewer_blue, lw=2)
+        self.ax_dendro.add_collection(subtree_lines)
+        artists.append(subtree_lines)
+
+        structures = structure.descendants + [structure]
+        positions = [self.plotter._cached_positions[x] for x in structures]
+        range_positions = max(max(positions) - min(positions), 10)
+        self.ax_dendro.set_xlim(min(positions) - range_positions/2, max(positions) + range_positions/2)
+
+        min_vmin = min(x.vmin for x in structures)
+        max_vmax = max(max(x.vmax for x in structures), 1)
+        v_range = max_vmax - min_vmin
+        self.ax_dendro.set_ylim(min_vmin - v_range/10, max_vmax + v_range/10)
+
+        if annotation is not None:
+            artists.append(self.fig.text(0.2, -0.15, annotation))
+
+        savefig_kwargs.setdefault('bbox_inches', 'tight')
+        try:
+            self.fig.savefig(filename, **savefig_kwargs)
+        finally:
+            for artist in artists:
+                artist.remove()
+            for contour_set in contour_sets:
+                for collection in contour_set.collections:
+                    collection.remove()
+
+        return filename
+
+
+def _render_batch(tasks):
+    """ Renders a list of (cloud_idx, filename, annotation) tasks with one template. """
+
+    template = ThumbnailTemplate(**_batch_state['template_kwargs'])
+    verbose = _batch_state['verbose']
+
+    for cloud_idx, filename, annotation in tasks:
+        template.render(cloud_idx, filename, annotation=annotation)
+        if verbose:
+            print cloud_idx
+
+
+def render_thumbnails(dendrogram, catalog, cloud_idxs, filenames, annotations=None,
+                      n_processes=None, verbose=True, **template_kwargs):
+    """
+    Renders a thumbnail per cloud, spreading the clouds over a process pool.
+
+    Parameters
+    ----------
+    dendrogram : astrodendro.dendrogram.Dendrogram
+    catalog : astropy.table.Table
+        Catalog of `dendrogram`'s structures; see `ThumbnailTemplate`.
+    cloud_idxs : list of int
+        Structure ids of the clouds to render.
+    filenames : list of str
+        Where to save each thumbnail.
+    annotations : list of str, optional
+        Text to write under each thumbnail.
+    n_processes : int, optional
+        Size of the process pool. Defaults to the number of CPUs.
+        Each process builds its own template, so a handful of clouds
+        is quickest in one process.
+    template_kwargs :
+        Passed to `ThumbnailTemplate`.
+
+    Returns
+    -------
+    filenames : list of str
+
+    """
+
+    if annotations is None:
+        annotations = [None] * len(cloud_idxs)
+    tasks = list(zip(cloud_idxs, filenames, annotations))
+
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    n_processes = max(min(n_processes, len(tasks)), 1)
+
+    # Computed (or loaded) here, before forking, so that the workers
+    # share the maps rather than each making their own.
+    if template_kwargs.get('moment_maps') is None:
+        template_kwargs['moment_maps'] = moment_maps_for(dendrogram.data)
+
+    # The workers inherit this (dendrogram and all) when the pool forks,
+    # rather than having it pickled over to them.
+    _batch_state['template_kwargs'] = dict(template_kwargs, dendrogram=dendrogram, catalog=catalog)
+    _batch_state['verbose'] = verbose
+
+    # one batch per process, so each builds a single template
+    batches = [tasks[i::n_processes] for i in range(n_processes)]
+
+    try:
+        if n_processes > 1:
+            pool = multiprocessing.Pool(n_processes)
+            try:
+                pool.map(_render_batch, batches)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            _render_batch(tasks)
+    finally:
+        _batch_state.clear()
+
+    return list(filenames)
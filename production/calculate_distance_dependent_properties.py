@@ -4,6 +4,11 @@ Takes a catalog and calculates distance-dependent properties.
 Most of these relationships are taken from Rosolowsky et al. (2008),
 which in turn largely borrowed from Rosolowsky & Leroy (2006).
 
+The `assign_*_with_uncertainties` functions compute them one at a time
+with `u.Quantity` arithmetic; `assign_properties` (and everything built
+on it) computes them all at once on plain floats, with
+`raw_distance_dependent_properties`, and attaches units at the end.
+
 """
 
 from __future__ import division
@@ -146,6 +151,149 @@ def assign_pressure_with_uncertainties(catalog, flux_column_name='flux_true'):
     catalog['error_pressure_minus'] = error_pressure_minus.to(u.K * u.cm**-3)
 
 
+# The unit contract of `raw_distance_dependent_properties`: what its
+# inputs are taken to be in, and what its outputs come out in.
+raw_input_units = {'radius': u.deg,
+                   'flux': u.K * u.km/u.s * u.sr,
+                   'v_rms': u.km/u.s,
+                   'x_cen': u.deg,
+                   'y_cen': u.deg,
+                   'distance': u.kpc}
+
+# in the order `assign_properties` assigns them
+raw_output_units = [('size', u.pc), ('error_size_plus', u.pc), ('error_size_minus', u.pc),
+                    ('mass', u.solMass), ('error_mass_plus', u.solMass), ('error_mass_minus', u.solMass),
+                    ('virial_alpha', u.dimensionless_unscaled),
+                    ('error_virial_alpha_plus', u.dimensionless_unscaled),
+                    ('error_virial_alpha_minus', u.dimensionless_unscaled),
+                    ('pressure', u.K * u.cm**-3), ('error_pressure_plus', u.K * u.cm**-3),
+                    ('error_pressure_minus', u.K * u.cm**-3),
+                    ('x_sol', u.kpc), ('y_sol', u.kpc), ('z_sol', u.kpc),
+                    ('x_gal', u.kpc), ('y_gal', u.kpc), ('z_gal', u.kpc),
+                    ('R_gal', u.kpc), ('phi_gal', u.deg)]
+
+# the unit conversions of the formulae above, folded into constants:
+# G in pc (km/s)^2 / Msun, and Msun (km/s)^2 / pc^3 / k_B in K cm^-3
+_G = c.G.to(u.pc * (u.km/u.s)**2 / u.solMass).value
+_pressure_per_k = (u.solMass * (u.km/u.s)**2 / u.pc**3 / c.k_B).to(u.K * u.cm**-3).value
+
+
+def raw_distance_dependent_properties(radius, flux, v_rms, x_cen, y_cen,
+                                      distance, error_distance_plus, error_distance_minus,
+                                      galactic_center_distance=8.340):
+    """
+    Computes every distance-dependent property from plain float arrays.
+
+    This is the engine behind `assign_properties`: the same formulae as
+    the `assign_*_with_uncertainties` functions and
+    `compute_galactic_coordinates`, but without any `u.Quantity`
+    arithmetic, since every input is taken to be in the units of
+    `raw_input_units` (distances and `galactic_center_distance` in kpc).
+    All the arguments broadcast against each other, so e.g. (K, N)
+    distances may be passed with (N,) cloud properties. With the distance
+    errors None, the error columns are skipped.
+
+    Returns
+    -------
+    properties : dict
+        Column name -> np.ndarray, in the units of `raw_output_units`.
+
+    """
+
+    eta = 1.9
+    X2 = 1.0
+    error_X2 = 0.3 # error on X_CO is around +/- 30% according to Bolatto et al. 2013
+
+    distance_pc = distance * 1000
+
+    properties = {}
+
+    size = eta * np.radians(radius) * distance_pc
+    properties['size'] = size
+
+    # flux in K km/s sr and distance in pc give a luminosity in K km/s pc^2
+    mass = 4.4 * X2 * flux * distance_pc**2
+    properties['mass'] = mass
+
+    virial_parameter = 5 * eta * v_rms**2 * size / (mass * _G)
+    properties['virial_alpha'] = virial_parameter
+
+    pressure = _pressure_per_k * mass * v_rms**2 / (4/3 * np.pi * size**3)
+    properties['pressure'] = pressure
+
+    if error_distance_plus is not None:
+        fractional_error_plus = error_distance_plus / distance
+        fractional_error_minus = error_distance_minus / distance
+
+        properties['error_size_plus'] = size * fractional_error_plus
+        properties['error_size_minus'] = size * fractional_error_minus
+
+        properties['error_mass_plus'] = mass * ((error_X2/X2)**2 + (2 * fractional_error_plus)**2)**(1/2)
+        properties['error_mass_minus'] = mass * ((error_X2/X2)**2 + (2 * fractional_error_minus)**2)**(1/2)
+
+        # alpha and pressure share their fractional errors
+        error_factor_plus = ((error_X2/X2)**2 + fractional_error_plus**2)**(1/2)
+        error_factor_minus = ((error_X2/X2)**2 + fractional_error_minus**2)**(1/2)
+
+        properties['error_virial_alpha_plus'] = virial_parameter * error_factor_plus
+        properties['error_virial_alpha_minus'] = virial_parameter * error_factor_minus
+
+        properties['error_pressure_plus'] = pressure * error_factor_plus
+        properties['error_pressure_minus'] = pressure * error_factor_minus
+
+    # as in `compute_galactic_coordinates`, with the Sun 25 pc above the midplane
+    l = np.radians(x_cen)
+    b = np.radians(y_cen)
+    R_0 = galactic_center_distance
+    theta = np.arcsin(0.025 / R_0)
+
+    cos_l_cos_b = np.cos(l) * np.cos(b)
+    sin_l_cos_b = np.sin(l) * np.cos(b)
+    sin_b = np.sin(b)
+
+    properties['x_sol'] = distance * cos_l_cos_b
+    properties['y_sol'] = distance * sin_l_cos_b
+    properties['z_sol'] = distance * sin_b
+
+    x_gal = R_0*np.cos(theta) - distance * (cos_l_cos_b*np.cos(theta) + sin_b*np.sin(theta))
+    y_gal = -distance * sin_l_cos_b
+    properties['x_gal'] = x_gal
+    properties['y_gal'] = y_gal
+    properties['z_gal'] = R_0*np.sin(theta) - distance * (cos_l_cos_b*np.sin(theta) + sin_b*np.cos(theta))
+
+    properties['R_gal'] = np.sqrt(x_gal**2 + y_gal**2)
+    properties['phi_gal'] = np.degrees(np.arctan2(y_gal, x_gal))
+
+    return properties
+
+
+def column_values(column, unit):
+    """
+    The values of a table column (or Quantity) in `unit`, as a float64 array.
+
+    A column without a unit is taken to be in `unit` already.
+
+    """
+
+    values = np.asarray(column, dtype=np.float64)
+    column_unit = getattr(column, 'unit', None)
+
+    if column_unit is not None and column_unit != unit:
+        values = values * u.Unit(column_unit).to(unit)
+
+    return values
+
+
+def _raw_catalog_columns(catalog, flux_column_name):
+    """ The distance-independent inputs of `raw_distance_dependent_properties`, from `catalog`. """
+
+    return dict(radius=column_values(catalog['radius'], raw_input_units['radius']),
+                flux=column_values(catalog[flux_column_name], raw_input_units['flux']),
+                v_rms=column_values(catalog['v_rms'], raw_input_units['v_rms']),
+                x_cen=column_values(catalog['x_cen'], raw_input_units['x_cen']),
+                y_cen=column_values(catalog['y_cen'], raw_input_units['y_cen']))
+
+
 def assign_properties(catalog, galactic_center_distance=8.340*u.kpc, flux_column_name='flux_true'):
     """
     Computes and assigns distance-dependent properties to a catalog.
@@ -158,64 +306,102 @@ def assign_properties(catalog, galactic_center_distance=8.340*u.kpc, flux_column
     Solar coordinates x, y, z (kpc)
     Galactic coordinates x, y, z (kpc)
 
+    Each comes with +/- errors where it has them. The calculation itself is
+    done on plain floats by `raw_distance_dependent_properties`; units
+    are only attached to the columns as they are assigned.
+
     """
 
     if 'distance' not in catalog.colnames:
         raise ValueError("`catalog` must have a `distance` column")
 
-    # eta = 1.9
+    properties = raw_distance_dependent_properties(
+        distance=column_values(catalog['distance'], u.kpc),
+        error_distance_plus=column_values(catalog['error_distance_plus'], u.kpc),
+        error_distance_minus=column_values(catalog['error_distance_minus'], u.kpc),
+        galactic_center_distance=u.Quantity(galactic_center_distance, u.kpc).value,
+        **_raw_catalog_columns(catalog, flux_column_name))
 
-    # sky_radius = eta * u.Quantity(catalog['radius'])
-    # distance = u.Quantity(catalog['distance'])
+    for name, unit in raw_output_units:
+        catalog[name] = u.Quantity(properties[name], unit, copy=False)
 
-    # size = sky_radius.to(u.rad).value * distance
 
-    # catalog['size'] = size.to(u.pc)
-    assign_size_with_uncertainties(catalog)
+def distance_dependent_properties(catalog, distance, error_distance_plus, error_distance_minus,
+                                  galactic_center_distance=8.340*u.kpc, flux_column_name='flux_true'):
+    """
+    Computes every property `assign_properties` assigns, at any number of distances at once.
+
+    The distances may have any number of leading axes (e.g. a (3, N)
+    stack of best, near and far distances for N clouds); every property
+    is evaluated for all of them in one pass, broadcasting the
+    distance-independent columns of `catalog` against them.
+
+    Parameters
+    ----------
+    catalog : astropy.table.Table
+        Needs `radius`, `v_rms`, `x_cen`, `y_cen` and `flux_column_name`.
+    distance, error_distance_plus, error_distance_minus : u.Quantity
+        Shaped (..., N) for a catalog of N clouds.
+
+    Returns
+    -------
+    properties : dict
+        Column name -> u.Quantity shaped like `distance`, in the units
+        `assign_properties` uses.
 
-    # flux = u.Quantity(catalog[flux_column_name])
-    # sigma_v = u.Quantity(catalog['v_rms'])
+    """
 
-    # # mass and alpha calculations from http://adsabs.harvard.edu/abs/2008ApJ...679.1338R
+    properties = raw_distance_dependent_properties(
+        distance=u.Quantity(distance).to(u.kpc).value,
+        error_distance_plus=u.Quantity(error_distance_plus).to(u.kpc).value,
+        error_distance_minus=u.Quantity(error_distance_minus).to(u.kpc).value,
+        galactic_center_distance=u.Quantity(galactic_center_distance, u.kpc).value,
+        **_raw_catalog_columns(catalog, flux_column_name))
 
-    # luminosity = flux * distance**2 / (1 * u.steradian)
-    # X2 = 1.0
-    # mass = 4.4 * X2 * luminosity.to(u.K * u.km/u.s * u.pc**2).value * u.solMass
+    return dict((name, u.Quantity(properties[name], unit, copy=False)) for name, unit in raw_output_units)
 
-    # catalog['mass'] = mass.to(u.solMass)
-    assign_mass_with_uncertainties(catalog)
 
-    # virial_parameter = 5 * eta * sigma_v**2 * size / (mass * c.G)
+def assign_nearfar_properties(catalog, nearfar_columns=('size', 'z_gal', 'mass'),
+                              galactic_center_distance=8.340*u.kpc, flux_column_name='flux_true'):
+    """
+    Assigns distance-dependent properties at the best, near and far distances together.
 
-    # catalog['virial_alpha'] = virial_parameter.decompose()
-    assign_alpha_with_uncertainties(catalog)
+    The `distance`, `near_distance` and `far_distance` columns (and their
+    errors) are stacked into (3, N) arrays and evaluated in a single
+    call to `distance_dependent_properties`, without copying the catalog.
+    The best-distance properties are assigned just as `assign_properties`
+    would assign them; those named in `nearfar_columns` (all of them, if
+    None) are also assigned at the near and far distances, as `near_*`
+    and `far_*` columns.
 
-    # # Pressure is calculated as a kinetic energy density: mass density times velocity squared
-    # pressure = mass * sigma_v**2 / (4/3 * np.pi * size**3)
-    # pressure_per_k = pressure / c.k_B
+    """
 
-    # catalog['pressure'] = pressure_per_k.to(u.K * u.cm**-3)
-    assign_pressure_with_uncertainties(catalog)
+    if 'distance' not in catalog.colnames:
+        raise ValueError("`catalog` must have a `distance` column")
 
-    R_0 = u.Quantity(galactic_center_distance, u.kpc)
+    prefixes = ['', 'near_', 'far_']
 
-    distance = catalog['distance'].data * catalog['distance'].unit
-    lrad = (catalog['x_cen'] * u.deg).to(u.rad).value
-    brad = (catalog['y_cen'] * u.deg).to(u.rad).value
+    def stack(column_format):
+        return np.array([column_values(catalog[column_format.format(prefix)], u.kpc) for prefix in prefixes])
 
-    solar_cart, gal_cart, gal_cyl = compute_galactic_coordinates(lrad, brad, distance, R_0=R_0)
+    properties = raw_distance_dependent_properties(
+        distance=stack('{0}distance'),
+        error_distance_plus=stack('error_{0}distance_plus'),
+        error_distance_minus=stack('error_{0}distance_minus'),
+        galactic_center_distance=u.Quantity(galactic_center_distance, u.kpc).value,
+        **_raw_catalog_columns(catalog, flux_column_name))
 
-    catalog['x_sol'] = solar_cart[0].to(u.kpc)
-    catalog['y_sol'] = solar_cart[1].to(u.kpc)
-    catalog['z_sol'] = solar_cart[2].to(u.kpc)
+    units = dict(raw_output_units)
 
-    catalog['x_gal'] = gal_cart[0].to(u.kpc)
-    catalog['y_gal'] = gal_cart[1].to(u.kpc)
-    catalog['z_gal'] = gal_cart[2].to(u.kpc)
+    for name, unit in raw_output_units:
+        catalog[name] = u.Quantity(properties[name][0], unit)
 
-    catalog['R_gal'] = gal_cyl[0].to(u.kpc)
-    catalog['phi_gal'] = gal_cyl[1].to(u.deg)
+    if nearfar_columns is None:
+        nearfar_columns = [name for name, unit in raw_output_units]
 
+    for name in nearfar_columns:
+        for i, prefix in enumerate(prefixes[1:], 1):
+            catalog[prefix + name] = u.Quantity(properties[name][i], units[name])
 
 
 def compute_galactic_coordinates(l, b, d_sun, R_0=8.340*u.kpc):
@@ -22,6 +22,9 @@ def size_linewidth_slope(catalog):
     ODR means "orthogonal distance regression", and is a way of fitting
     models to data where both the x and y values have scatter.
 
+    For uncertainties from bootstrapping the catalog, see
+    `size_linewidth_fit.fit_size_linewidth`.
+
     Parameters
     ----------
     catalog : astropy.table.table.Table
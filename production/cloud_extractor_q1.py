@@ -11,7 +11,7 @@ import astropy
 import astropy.units as u
 
 from dendrogal.production.convenience_function import load_permute_dendro_catalog
-from dendrogal.production.calculate_distance_dependent_properties import assign_properties
+from dendrogal.production.calculate_distance_dependent_properties import assign_properties, assign_nearfar_properties
 from dendrogal.production.remove_degenerate_structures import reduce_catalog
 from dendrogal.production.detect_disparate_distances import detect_disparate_distances
 from dendrogal.production.disqualify_edge_structures import identify_edge_structures
@@ -77,24 +77,8 @@ def first_quad_cloud_catalog(d=d, catalog=catalog):
 
     # assignment of physical properties to unambigously-distanced structures
     # let's think critically about whether this step is needed.
-    assign_properties(catalog_cp)
-
-    near_catalog = catalog_cp.copy(copy_data=True)
-    far_catalog = catalog_cp.copy(copy_data=True)
-
-    near_catalog['distance'] = catalog_cp['near_distance']
-    far_catalog['distance'] = catalog_cp['far_distance']
-    assign_properties(near_catalog)
-    assign_properties(far_catalog)
-
-    catalog_cp['near_size'] = near_catalog['size']
-    catalog_cp['far_size'] = far_catalog['size']
-
-    catalog_cp['near_z_gal'] = near_catalog['z_gal']
-    catalog_cp['far_z_gal'] = far_catalog['z_gal']
-
-    catalog_cp['near_mass'] = near_catalog['mass']
-    catalog_cp['far_mass'] = far_catalog['mass']
+    # ... and, in the same pass, the near & far sizes, heights and masses
+    assign_nearfar_properties(catalog_cp)
 
     return catalog_cp
 
@@ -14,9 +14,14 @@ import astropy.constants as c
 
 from astropy import wcs
 
+from .config import dendrogram_n_processes
+from .tiled_dendrogram import compute_tiled_dendrogram, compute_stable_dendrogram
+from .structure_statistics import structure_scalars
+
 
 def compute_dendrogram(datacube, header, verbose=True,
-                       min_value=None, min_delta=None, min_npix=None):
+                       min_value=None, min_delta=None, min_npix=None,
+                       n_processes=dendrogram_n_processes):
     """
     Computes a dendrogram on input data/header.
 
@@ -54,9 +59,15 @@ def compute_dendrogram(datacube, header, verbose=True,
         Provide a progress bar? If False, the computation will be 
         silent, but for large dendrograms, it can be useful to have an 
         idea of how long the computation will take.
+    n_processes : int, default `config.dendrogram_n_processes`
+        If greater than 1, split the cube into longitude tiles and compute 
+        them across this many processes (see `tiled_dendrogram.py`). 
+        The result is identical to the serial computation (in both, 
+        pixels of equal value are taken in flat-index order).
 
     Returns
     -------
+    d : astrodendro.dendrogram.Dendrogram
 
     """
 
@@ -66,9 +77,14 @@ def compute_dendrogram(datacube, header, verbose=True,
     datacube_wcs = wcs.wcs.WCS(header)
     datacube_wcs.wcs.bounds_check(pix2world=False, world2pix=False)
 
-    d = astrodendro.Dendrogram.compute(
-        datacube, wcs=datacube_wcs, verbose=verbose,
-        min_value=min_value, min_delta=min_delta, min_npix=min_npix)
+    if n_processes > 1:
+        d = compute_tiled_dendrogram(
+            datacube, wcs=datacube_wcs, verbose=verbose, n_processes=n_processes,
+            min_value=min_value, min_delta=min_delta, min_npix=min_npix)
+    else:
+        d = compute_stable_dendrogram(
+            datacube, wcs=datacube_wcs, verbose=verbose,
+            min_value=min_value, min_delta=min_delta, min_npix=min_npix)
 
     # We'll only return d; the data and header are un-altered and should be
     # re-used.
@@ -139,14 +155,15 @@ def compute_catalog(d, header):
 
         catalog['flux_true'] = flux_kelvin_kms_sr
 
-        background_flux_array = np.zeros_like(catalog['flux_true'])
         # do a clipping -- 
         # this uses the approximation that any given structure's background is well-represented by its lowest-valued pixel, which can get messy sometimes.
-        for i, row in enumerate(catalog):
-            background_kelvins = d[i].vmin * u.K
-            background_flux = background_kelvins * d[i].get_npix() * metadata['velocity_scale'] * metadata['spatial_scale']**2
+        scalars = structure_scalars(d)
+        vmin_array = scalars['vmin'][catalog['_idx']]
+        npix_array = scalars['npix'][catalog['_idx']]
 
-            background_flux_array[i] = background_flux.to(u.K * u.km/u.s * u.steradian).value
+        # convert the units once, rather than once per structure
+        background_flux_unit = (u.K * metadata['velocity_scale'] * metadata['spatial_scale']**2).to(u.K * u.km/u.s * u.steradian).value
+        background_flux_array = vmin_array * npix_array * background_flux_unit
 
         catalog['flux_clipped'] = catalog['flux_true'] - background_flux_array
 
@@ -6,4 +6,13 @@ data_path = os.path.expanduser("~/Dropbox/College/Astro99/DATA/")
 idl_code_path = os.path.expanduser("~/Documents/Code/idl-low-sky/eroslib/")
 idl_executable = "/Applications/exelis/idl83/bin/idl"
 paper_path = os.path.expanduser("~/Dropbox/Grad School/Research/Milkyway/paper/")
-catalog_output_path = os.path.expanduser("~/Dropbox/Grad School/Research/Milkyway/data_products/")
\ No newline at end of file
+catalog_output_path = os.path.expanduser("~/Dropbox/Grad School/Research/Milkyway/data_products/")
+# The dendrogram cache can live anywhere (e.g. a shared scratch disk); override with $DENDROGAL_CACHE_PATH.
+dendrogram_cache_path = os.environ.get("DENDROGAL_CACHE_PATH",
+    os.path.expanduser("~/Documents/Code/dendrogal/production/saved_dendrograms/"))
+dendrogram_cache_max_bytes = int(os.environ.get("DENDROGAL_CACHE_MAX_BYTES", 50 * 1024**3))
+# Number of processes for computing dendrograms in longitude tiles; override with $DENDROGAL_N_PROCESSES.
+dendrogram_n_processes = int(os.environ.get("DENDROGAL_N_PROCESSES", 1))
+# Precomputed (l, b, v) -> distance lookup tables, one directory per rotation curve; override with $DENDROGAL_DISTANCE_LOOKUP_PATH.
+distance_lookup_path = os.environ.get("DENDROGAL_DISTANCE_LOOKUP_PATH",
+    os.path.expanduser("~/Documents/Code/dendrogal/production/distance_lookup_tables/"))
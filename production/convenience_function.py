@@ -3,6 +3,8 @@ Combines loading and computing dendrograms into one function.
 
 I am implementing caching options to save even more time. 
 
+The dendrogram cache itself lives in `dendrogram_cache.py`.
+
 """
 
 import os.path
@@ -16,34 +18,59 @@ from astropy.io.fits import getheader
 
 import astrodendro
 
-from .load_and_process_data import load_data, permute_data_to_standard_order
+from .config import data_path
+from .load_and_process_data import load_data, permute_data_to_standard_order, load_cube_view
 from .compute_dendrogram_and_catalog import compute_dendrogram, compute_catalog
+from .dendrogram_cache import DendrogramCache, cache_key
+from .moment_maps import register_moment_maps_path
+
+dendrogram_cache = DendrogramCache()
+
+
+def memoize(func, cache=dendrogram_cache):
+    """ 
+    Decorator function, ripped off of astrodendro.analysis.memoize()
 
+    Outputs are stored in `cache`, keyed on the contents of the input file 
+    and on every keyword argument, so a regenerated input file is never 
+    served a stale dendrogram.
 
-def memoize(func):
-    """ Decorator function, ripped off of astrodendro.analysis.memoize()"""
+    """
 
     @wraps(func)
     def wrapper(filename, **kwargs):        
         beginning = datetime.datetime.now()
+        key = cache_key(data_path+filename, function=func.__name__, **kwargs)
         try:
-            # LOAD THE dendrogram & catalog FROM WHEREVER IT WOULD LIVE IF IT WERE SAVED
-            return reload_dendrogram_catalog_output(data_filename=filename, **kwargs)
-        except IOError:
-            # generate and save the thing, then return it
-            output = func(filename=filename, **kwargs)
-            save_dendrogram_catalog_output(*output, data_filename=filename, **kwargs)
+            output = cache.get(key)
+            if output is None:
+                # generate and save the thing, then return it
+                output = func(filename=filename, **kwargs)
+                cache.put(key, *output)
+            # integrated maps of the cube are saved alongside it, the first time they're needed
+            register_moment_maps_path(output[0].data, cache.entry_path(key))
             return output
         finally:
             end = datetime.datetime.now()
             time_elapsed = (end - beginning)
             print " *** Dendrogram+catalog loading/generation took {0}".format(time_elapsed)
+            print " *** Dendrogram cache: {hits} hits, {misses} misses, {evictions} evictions".format(**cache.stats())
 
 
     return wrapper
 
 
-def load_permute_data(filename, memmap=False):
+def load_permute_data(filename, memmap=False, lazy=False):
+    """
+    Loads a datacube in (v,b,l) order. 
+
+    With `lazy`, returns a memory-mapped `CubeView` instead of an array.
+
+    """
+
+    if lazy:
+        view = load_cube_view(filename)
+        return view, view.header
 
     datacube, header = permute_data_to_standard_order(*load_data(filename, memmap=memmap))
 
@@ -0,0 +1,288 @@
+"""
+A content-addressed, size-bounded disk cache for dendrograms & catalogs.
+
+Cache entries are keyed on a hash of the input FITS file (its bytes and
+its header), the installed astrodendro version, and every parameter used
+to compute the dendrogram. Regenerating an input cube therefore changes
+its key, and a stale dendrogram can never be served for it.
+
+Each entry is a directory containing the dendrogram, catalog, header,
+metadata and a manifest of checksums. Entries are written into a hidden
+temporary directory and renamed into place, so a crashed or concurrent
+writer never leaves a half-written entry visible. When the cache grows
+beyond `max_bytes`, the least-recently-used entries are evicted.
+
+"""
+
+from __future__ import division
+
+import os
+import errno
+import shutil
+import pickle
+import hashlib
+import tempfile
+import time
+
+import astropy.table
+from astropy.io.fits import getheader
+
+import astrodendro
+
+from .config import dendrogram_cache_path, dendrogram_cache_max_bytes
+
+# Bump this if the on-disk layout of an entry changes.
+cache_format_version = 1
+
+entry_filenames = {'d': "d.hdf5",
+                   'catalog': "catalog.fits",
+                   'header': "header.fits",
+                   'metadata': "metadata.p"}
+manifest_filename = "manifest.p"
+temporary_prefix = ".tmp-"
+
+# Digests of input files, keyed on (path, size, mtime), so that a file is
+# only read once per session unless it changes on disk.
+_file_digest_memo = {}
+
+
+def file_digest(filepath, blocksize=2**22):
+    """
+    Computes the SHA-1 hex digest of a file's bytes, reading it in blocks.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the file.
+    blocksize : int, optional
+        Number of bytes to read at a time.
+
+    Returns
+    -------
+    digest : str
+
+    """
+
+    stat = os.stat(filepath)
+    memo_key = (os.path.realpath(filepath), stat.st_size, stat.st_mtime)
+
+    if memo_key not in _file_digest_memo:
+        sha = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                sha.update(block)
+        _file_digest_memo[memo_key] = sha.hexdigest()
+
+    return _file_digest_memo[memo_key]
+
+
+def cache_key(data_filepath, **compute_kwargs):
+    """
+    Generates a cache key for a dendrogram computed from `data_filepath`.
+
+    Parameters
+    ----------
+    data_filepath : str
+        Full path to the input FITS file.
+    **compute_kwargs
+        Every parameter that affects the computed output,
+        e.g. `min_value`, `min_delta`, `min_npix`.
+
+    Returns
+    -------
+    key : str
+        A hex digest uniquely describing the inputs.
+
+    """
+
+    if data_filepath is None:
+        raise ValueError("`data_filepath` must be provided!")
+
+    sha = hashlib.sha1()
+    sha.update(str(cache_format_version).encode())
+    sha.update(astrodendro.__version__.encode())
+    sha.update(file_digest(data_filepath).encode())
+    sha.update(getheader(data_filepath).tostring().encode())
+    # repr() keeps full float precision, so 0.3 and 0.1*3 are distinct
+    for key in sorted(compute_kwargs):
+        sha.update("{0}={1!r};".format(key, compute_kwargs[key]).encode())
+
+    return sha.hexdigest()
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+
+
+class DendrogramCache(object):
+    """
+    A disk cache of (d, catalog, header, metadata) tuples.
+
+    Safe to share between processes: writes are atomic directory renames,
+    and an entry's last-access time is stored in its manifest's mtime.
+
+    Parameters
+    ----------
+    cache_path : str, optional
+        Directory holding the cache. Created on first write.
+    max_bytes : int, optional
+        Size bound for the whole cache. The least-recently-used entries
+        are evicted after each write until the cache fits. The entry just
+        written is never evicted, even if it alone exceeds `max_bytes`.
+    verify : bool, optional
+        Check each file's checksum against the manifest when loading.
+
+    """
+
+    def __init__(self, cache_path=dendrogram_cache_path,
+                 max_bytes=dendrogram_cache_max_bytes, verify=True):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.verify = verify
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_path, key)
+
+    def entries(self):
+        """ Returns the keys of all complete entries in the cache. """
+
+        if not os.path.isdir(self.cache_path):
+            return []
+
+        return [x for x in os.listdir(self.cache_path)
+                if not x.startswith(temporary_prefix) and
+                os.path.isfile(os.path.join(self.cache_path, x, manifest_filename))]
+
+    def get(self, key):
+        """
+        Loads a cached entry.
+
+        Returns
+        -------
+        output : tuple or None
+            (d, catalog, header, metadata), or None if `key` is not cached
+            or its entry failed the integrity check (it is then discarded).
+
+        """
+
+        path = self.entry_path(key)
+
+        try:
+            with open(os.path.join(path, manifest_filename), 'rb') as f:
+                manifest = pickle.load(f)
+            if self.verify:
+                for filename, checksum in manifest['checksums'].items():
+                    if file_digest(os.path.join(path, filename)) != checksum:
+                        raise IOError("checksum mismatch in {0}".format(filename))
+        except (IOError, OSError, EOFError, KeyError, pickle.UnpicklingError) as e:
+            if os.path.isdir(path):
+                print " *** Discarding corrupt cache entry {0}: {1}".format(key, e)
+                shutil.rmtree(path, ignore_errors=True)
+            self.misses += 1
+            return None
+
+        d = astrodendro.Dendrogram.load_from(os.path.join(path, entry_filenames['d']))
+        catalog = astropy.table.Table.read(os.path.join(path, entry_filenames['catalog']))
+        header = getheader(os.path.join(path, entry_filenames['header']))
+        with open(os.path.join(path, entry_filenames['metadata']), 'rb') as f:
+            metadata = pickle.load(f)
+
+        # mark as recently used
+        os.utime(os.path.join(path, manifest_filename), None)
+        self.hits += 1
+
+        return d, catalog, header, metadata
+
+    def put(self, key, d, catalog, header, metadata):
+        """ Atomically writes an entry into the cache, then evicts as needed. """
+
+        _makedirs(self.cache_path)
+        temporary_path = tempfile.mkdtemp(prefix=temporary_prefix, dir=self.cache_path)
+
+        try:
+            d.save_to(os.path.join(temporary_path, entry_filenames['d']))
+            catalog.write(os.path.join(temporary_path, entry_filenames['catalog']))
+            header.tofile(os.path.join(temporary_path, entry_filenames['header']))
+            with open(os.path.join(temporary_path, entry_filenames['metadata']), 'wb') as f:
+                pickle.dump(metadata, f)
+
+            checksums = dict((x, file_digest(os.path.join(temporary_path, x)))
+                             for x in entry_filenames.values())
+            manifest = {'key': key,
+                        'checksums': checksums,
+                        'astrodendro_version': astrodendro.__version__,
+                        'created': time.time()}
+            # the manifest is written last: its presence marks a complete entry
+            with open(os.path.join(temporary_path, manifest_filename), 'wb') as f:
+                pickle.dump(manifest, f)
+
+            try:
+                os.rename(temporary_path, self.entry_path(key))
+            except OSError:
+                # another process got there first; its entry is equivalent.
+                shutil.rmtree(temporary_path, ignore_errors=True)
+        except:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None, stale_temporary_age=86400):
+        """
+        Removes least-recently-used entries until the cache fits in `max_bytes`.
+
+        Also clears out temporary directories older than
+        `stale_temporary_age` seconds, left over from crashed writers.
+
+        """
+
+        now = time.time()
+        for x in os.listdir(self.cache_path):
+            temporary_path = os.path.join(self.cache_path, x)
+            if (x.startswith(temporary_prefix) and
+                now - os.path.getmtime(temporary_path) > stale_temporary_age):
+                shutil.rmtree(temporary_path, ignore_errors=True)
+
+        entry_list = []
+        for key in self.entries():
+            path = self.entry_path(key)
+            try:
+                last_used = os.path.getmtime(os.path.join(path, manifest_filename))
+                entry_list.append((last_used, key, _directory_size(path)))
+            except OSError:
+                # evicted by someone else in the meantime
+                continue
+
+        total_bytes = sum(x[2] for x in entry_list)
+
+        for last_used, key, size in sorted(entry_list):
+            if total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        """ Returns a dict of hit/miss/eviction counts and current cache size. """
+
+        entry_keys = self.entries()
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(entry_keys),
+                'bytes': sum(_directory_size(self.entry_path(x)) for x in entry_keys)}
@@ -5,21 +5,19 @@ Finds out when structures have incompatible distance assignments internally.
 
 from __future__ import division
 
-import sys
-sys.setrecursionlimit(10000)
-
 import numpy as np
 
-# so the idea is:
+from .structure_statistics import structure_parents, structure_levels, accumulate_over_subtrees
+
+# the idea is:
 # go through *all* the structures in a catalog/dendrogram
 # and find out which ones inside it have distances that disagree.
 
-# this would probbaly take like O(n^2) if I don't optimize
-# so, first optimization:
-# once a struct has been flagged as "disparate", all of its ancestors are too
-# and so you can skip them.
-
-# we can probably draw upon the nifty output of catalog_tree_stats to help us.
+# A struct fails if its descendants' distances are a factor of 2 or more 
+# apart, and once a struct fails, all of its ancestors do too.
+# Both of those are bottom-up reductions over the tree, so we do them
+# with array operations, one tree level at a time: no recursion, and no
+# per-struct descendant lists.
 
 def detect_disparate_distances(d, catalog):
 
@@ -27,48 +25,47 @@ def detect_disparate_distances(d, catalog):
 
         raise ValueError("`catalog` must have `distance` and `n_descendants` columns!")
 
-    # a column: shows "not checked yet", "passes", or "fails".
-
     passes = 1
     fails = 0
-    unchecked = 10
 
-    disparate = np.ones(len(catalog), dtype=np.int) * unchecked
+    parents = structure_parents(d)
+    levels = structure_levels(parents)
+    has_parent = parents > -1
 
-    # if you're a single feature you pass
-    disparate[catalog['n_descendants'] == 0] = passes
+    # structures missing from the catalog (or without a distance) are ignored
+    distance_by_idx = np.zeros(len(parents)) * np.nan
+    distance_by_idx[catalog['_idx']] = catalog['distance']
 
-    for i, struct in enumerate(d):
+    # min & max distance over each struct's subtree, including itself...
+    subtree_min = accumulate_over_subtrees(distance_by_idx, parents, levels, ufunc=np.fmin)
+    subtree_max = accumulate_over_subtrees(distance_by_idx, parents, levels, ufunc=np.fmax)
 
-        if disparate[struct.idx] == unchecked:
+    # ... and over its descendants only, from its children's subtrees
+    descendant_min = np.zeros(len(parents)) * np.nan
+    descendant_max = np.zeros(len(parents)) * np.nan
+    np.fmin.at(descendant_min, parents[has_parent], subtree_min[has_parent])
+    np.fmax.at(descendant_max, parents[has_parent], subtree_max[has_parent])
 
-            # THIS DOESN'T WORK AS DESIRED WE HAVE TO FIX IT 
-            # Actually, works as desired in 4th quadrant.
-            descendant_idx_list = [x.idx for x in struct.descendants]
-            descendant_distance_list = catalog['distance'][np.in1d(catalog['_idx'], descendant_idx_list)]
+    # NaN comparisons are False, so a struct with no descendants passes
+    with np.errstate(invalid='ignore'):
+        fails_itself = (descendant_max >= 2*descendant_min).astype(int)
 
-            if max(descendant_distance_list) >= 2*min(descendant_distance_list):
-                fail_struct_and_ancestors(struct, disparate, fails=fails)
+    # if any struct in your subtree fails, you fail
+    fails_in_subtree = accumulate_over_subtrees(fails_itself, parents, levels, ufunc=np.maximum)
 
-            else:
-                disparate[struct.idx] = passes
+    disparate_by_idx = np.where(fails_in_subtree, fails, passes)
 
-    return disparate
-
-    # how does the check go?
-    # take a struct
-    # investigate its descendants' assigned distances
-    # if the min & max of those distances are a factor of 2 or more apart, fail this struct
+    return disparate_by_idx[catalog['_idx']]
 
 
 def fail_struct_and_ancestors(struct, disparate_column, fails=0):
     """
-    A recursive function that "fails" the ancestors of a failing struct. 
-
-    """
+    "Fails" a struct and all of its ancestors. 
 
-    disparate_column[struct.idx] = fails
-    if struct.level > 0:
-        fail_struct_and_ancestors(struct.parent, disparate_column, fails=fails)
+    Walks up the tree iteratively, so deep trees can't exhaust the stack.
 
+    """
 
+    while struct is not None:
+        disparate_column[struct.idx] = fails
+        struct = struct.parent
@@ -7,6 +7,8 @@ from __future__ import division
 
 import numpy as np
 
+from .structure_statistics import structure_scalars
+
 def on_edge(struct, shape):
     """ Checks whether a given struct is on an edge. """
 
@@ -31,12 +33,9 @@ def identify_edge_structures(d):
     Sorted by _idx, not by height - so it follows a catalog order, 
     not a dendrogram order.
 
-    """
-
-    shape = d.data.shape
-    on_edge_array = np.zeros(len(d), dtype=int)
+    Uses the bounding boxes from `structure_scalars`, rather than 
+    calling `on_edge` (and thus `struct.indices()`) on every structure.
 
-    for i in range(len(d)):
-        on_edge_array[i] = int(on_edge(d[i], shape))
+    """
 
-    return on_edge_array
+    return structure_scalars(d)['on_edge'].astype(int)
@@ -18,7 +18,8 @@ from scipy.stats import norm
 
 import astropy.units as u
 
-from dendrogal.production.calculate_distance_dependent_properties import assign_properties
+from dendrogal.production.calculate_distance_dependent_properties import (
+    raw_distance_dependent_properties, column_values, _raw_catalog_columns)
 
 
 def p_given_sigmas(N_sigmas):
@@ -74,34 +75,53 @@ def calculate_p_nearfar(catalog, return_intermediates=False,
                         A_coefficient=0.5,
                         B_coefficient=0.5,
                         scatter_in_log10_R=0.5,
-                        molecular_HWHM_height=60*u.pc
+                        molecular_HWHM_height=60*u.pc,
+                        galactic_center_distance=8.340*u.kpc,
+                        flux_column_name='flux_true'
                         ):
+    """
+    Probabilities of the near and far distances, from size-linewidth & latitude.
+
+    Returns p_near, p_far as plain arrays. With `return_intermediates`,
+    returns instead [properties, p_larson, p_latitude, p] for the near
+    and for the far distance, where `properties` is a dict holding the
+    `size` and `z_gal` (in pc) at that distance.
+
+    Both distances are evaluated together by
+    `raw_distance_dependent_properties`, the engine behind
+    `assign_properties`, so the catalog is never copied.
+
+    """
+
+    cloud_columns = _raw_catalog_columns(catalog, flux_column_name)
+    distances = np.array([column_values(catalog['near_distance'], u.kpc),
+                          column_values(catalog['far_distance'], u.kpc)])
+    R_0 = u.Quantity(galactic_center_distance, u.kpc).value
+
+    properties = raw_distance_dependent_properties(distance=distances,
+                                                   error_distance_plus=None, error_distance_minus=None,
+                                                   galactic_center_distance=R_0, **cloud_columns)
 
-    near_catalog = catalog.copy(copy_data=True)
-    near_catalog['distance'] = catalog['near_distance']
-    far_catalog = catalog.copy(copy_data=True)
-    far_catalog['distance'] = catalog['far_distance']
+    near_size, far_size = properties['size']
+    near_z, far_z = properties['z_gal'] * u.kpc.to(u.pc)
 
-    assign_properties(near_catalog)
-    assign_properties(far_catalog)
+    v_rms = cloud_columns['v_rms']
 
-    p_near_larson = p_from_size_linewidth(near_catalog['size'], near_catalog['v_rms'],
+    p_near_larson = p_from_size_linewidth(near_size, v_rms,
                                           A_coefficient, B_coefficient, scatter_in_log10_R=scatter_in_log10_R)
-    p_far_larson = p_from_size_linewidth(far_catalog['size'], far_catalog['v_rms'],
+    p_far_larson = p_from_size_linewidth(far_size, v_rms,
                                          A_coefficient, B_coefficient, scatter_in_log10_R=scatter_in_log10_R)
 
-    p_near_latitude = p_from_latitude((near_catalog['z_gal']).to(u.pc),
-                                      molecular_HWHM_height=molecular_HWHM_height)
+    p_near_latitude = p_from_latitude(near_z * u.pc, molecular_HWHM_height=molecular_HWHM_height)
 
-    p_far_latitude = p_from_latitude((far_catalog['z_gal']).to(u.pc),
-                                     molecular_HWHM_height=molecular_HWHM_height)
+    p_far_latitude = p_from_latitude(far_z * u.pc, molecular_HWHM_height=molecular_HWHM_height)
 
     p_near = p_near_larson * p_near_latitude
     p_far = p_far_larson * p_far_latitude
 
     if return_intermediates:
-        near_output = [near_catalog, p_near_larson, p_near_latitude, p_near]
-        far_output = [far_catalog, p_far_larson, p_far_latitude, p_far]
+        near_output = [{'size': near_size, 'z_gal': near_z}, p_near_larson, p_near_latitude, p_near]
+        far_output = [{'size': far_size, 'z_gal': far_z}, p_far_larson, p_far_latitude, p_far]
         return near_output, far_output
     else:
         return p_near, p_far
@@ -0,0 +1,254 @@
+"""
+Propagates distance uncertainties into cloud properties by Monte Carlo.
+
+The errors that `assign_properties` assigns are linearised, and
+symmetric in everything but the distance errors themselves. Here
+instead, each cloud gets K distances drawn from its distance
+distribution, its properties follow from those (through
+`raw_distance_dependent_properties`), and the spread of each property
+is summarized by percentiles.
+
+A cloud's distance distribution is a "split" normal: a normal of width
+`error_distance_minus` below its distance and `error_distance_plus`
+above it, truncated at zero. With `nearfar=True`, clouds subject to the
+kinematic distance ambiguity instead draw each sample from their near
+distance distribution with probability p_near / (p_near + p_far), and
+from their far one otherwise (see `distance_disambiguate`).
+
+The samples are held as a (K, N) array, but only a chunk of clouds is
+drawn and evaluated at once, so memory use is bounded by
+`max_elements` however many samples and clouds there are.
+
+Most properties are monotonic in distance (size, mass, alpha and
+pressure are powers of it; the Cartesian coordinates are linear in it),
+and a percentile of a monotonic function of the distance is that
+function of a percentile of the distance. So for those, only the
+distance samples are sorted (partially), and the properties are
+evaluated at the distance percentiles; only the others (R_gal and
+phi_gal) are evaluated at every sample.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+import astropy.units as u
+
+from dendrogal.production.calculate_distance_dependent_properties import (
+    raw_distance_dependent_properties, raw_output_units, column_values, _raw_catalog_columns)
+
+default_properties = ('size', 'mass', 'virial_alpha', 'pressure', 'z_gal')
+
+# properties that increase or decrease monotonically with distance
+monotonic_properties = ('size', 'mass', 'virial_alpha', 'pressure',
+                        'x_sol', 'y_sol', 'z_sol', 'x_gal', 'y_gal', 'z_gal')
+
+
+def _lowest_quantile(center, error_minus):
+    """ How much of a split normal's CDF lies below zero (and is truncated away). """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lowest = ndtr(-center / error_minus)
+
+    return np.where(np.isnan(lowest), 0, lowest)
+
+
+def _split_normal_quantile(uniform, center, error_plus, error_minus, lowest):
+    """ Inverts the CDF of a split normal truncated at zero, at `uniform` in [0, 1). """
+
+    z = ndtri(lowest + uniform * (1 - lowest))
+
+    return center + z * np.where(z > 0, error_plus, error_minus)
+
+
+def sample_split_normal(center, error_plus, error_minus, random_state, size):
+    """
+    Draws from split normals truncated at zero.
+
+    Each distribution is a normal of width `error_minus` below `center`
+    and `error_plus` above it, with whatever falls below zero cut away. Samples are drawn by
+    inverting the CDF, so the truncation costs nothing.
+
+    Parameters
+    ----------
+    center, error_plus, error_minus : np.ndarray
+        Broadcast against `size`.
+    random_state : np.random.RandomState
+    size : tuple
+        Shape of the output, e.g. (K, N).
+
+    """
+
+    return _split_normal_quantile(random_state.random_sample(size), center, error_plus, error_minus,
+                                  _lowest_quantile(center, error_minus))
+
+
+def _cloud_distances(catalog, nearfar):
+    """
+    The distance distributions to draw from.
+
+    Returns the (center, plus, minus) arrays of the near and the far
+    distributions, and the chance of drawing from the near one. Clouds
+    drawn from a single distribution (every cloud, without `nearfar`) have
+    their best distance as both, with a chance of 1.
+
+    """
+
+    def columns(prefix):
+        return [column_values(catalog[name.format(prefix)], u.kpc) for name in
+                ['{0}distance', 'error_{0}distance_plus', 'error_{0}distance_minus']]
+
+    best = columns('')
+    near_weight = np.ones(len(best[0]))
+
+    if not nearfar:
+        return best, best, near_weight
+
+    near = columns('near_')
+    far = columns('far_')
+
+    p_near = np.asarray(catalog['p_near'], dtype=np.float64)
+    p_far = np.asarray(catalog['p_far'], dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mixture_weight = p_near / (p_near + p_far)
+
+    # only clouds with two distinct distances, and some preference
+    # between them, are drawn from the mixture
+    mixed = (near[0] != far[0]) & np.isfinite(mixture_weight)
+
+    near = [np.where(mixed, x, y) for x, y in zip(near, best)]
+    far = [np.where(mixed, x, y) for x, y in zip(far, best)]
+    near_weight[mixed] = mixture_weight[mixed]
+
+    return near, far, near_weight
+
+
+def _sample_chunk(distributions, chunk, n_samples, random_state):
+    """ (n_samples, chunk size) distances for the clouds in slice `chunk`. """
+
+    near, far, near_weight = distributions
+
+    near = [x[chunk] for x in near]
+    far = [x[chunk] for x in far]
+    near_weight = near_weight[chunk]
+
+    uniform = random_state.random_sample((n_samples, len(near_weight)))
+
+    if np.all(near_weight == 1):
+        return _split_normal_quantile(uniform, *(near + [_lowest_quantile(near[0], near[2])]))
+
+    # one uniform both picks the distribution (below near_weight: near)
+    # and, rescaled to [0, 1), is the quantile drawn from it
+    use_near = uniform < near_weight
+    with np.errstate(divide='ignore', invalid='ignore'):
+        uniform = np.where(use_near, uniform / near_weight, (uniform - near_weight) / (1 - near_weight))
+
+    near.append(_lowest_quantile(near[0], near[2]))
+    far.append(_lowest_quantile(far[0], far[2]))
+    parameters = [np.where(use_near, x, y) for x, y in zip(near, far)]
+
+    return _split_normal_quantile(uniform, *parameters)
+
+
+def monte_carlo_properties(catalog, n_samples=1000, percentiles=(16, 50, 84),
+                           properties=default_properties, nearfar=False, seed=None,
+                           max_elements=2**20, galactic_center_distance=8.340*u.kpc,
+                           flux_column_name='flux_true'):
+    """
+    Percentiles of distance-dependent properties, by Monte Carlo over distance.
+
+    Parameters
+    ----------
+    catalog : astropy.table.Table
+        Needs `distance` and its +/- errors, plus the columns
+        `assign_properties` needs; with `nearfar`, also the near & far
+        distances and their errors, `p_near` and `p_far`.
+    n_samples : int, optional
+        Distance samples (K) per cloud.
+    percentiles : sequence of float, optional
+        Percentiles (0-100) of each property to return.
+    properties : sequence of str, optional
+        Any of the columns `assign_properties` assigns (other than the
+        error columns, which the samples supersede).
+    nearfar : bool, optional
+        Draw ambiguous clouds from both their near & far distances,
+        weighted by `p_near` and `p_far`.
+    seed : int, optional
+        Seeds the sampling. The samples also depend on `max_elements`,
+        which sets how they are chunked.
+    max_elements : int, optional
+        Most samples (K times clouds in a chunk) evaluated at once.
+
+    Returns
+    -------
+    percentile_values : dict
+        Property name -> u.Quantity of shape (len(percentiles), N).
+
+    """
+
+    random_state = np.random.RandomState(seed)
+    units = dict(raw_output_units)
+
+    distributions = _cloud_distances(catalog, nearfar)
+    cloud_columns = _raw_catalog_columns(catalog, flux_column_name)
+    R_0 = u.Quantity(galactic_center_distance, u.kpc).value
+
+    n_clouds = len(catalog)
+    chunk_size = max(max_elements // n_samples, 1)
+
+    # each monotonic property's percentile q is its value at the distance
+    # percentile q (if it increases with distance) or 100-q (if it
+    # decreases): the lower of the two below the median, the higher above
+    percentiles = np.asarray(percentiles, dtype=float)
+    below_median = (percentiles <= 50)[:, np.newaxis]
+    n_percentiles = len(percentiles)
+
+    percentile_values = dict((name, np.empty((n_percentiles, n_clouds))) for name in properties)
+
+    for start in range(0, n_clouds, chunk_size):
+        chunk = slice(start, min(start + chunk_size, n_clouds))
+        chunk_columns = dict((name, values[chunk]) for name, values in cloud_columns.items())
+
+        distance = _sample_chunk(distributions, chunk, n_samples, random_state)
+
+        distance_percentiles = np.percentile(distance, np.concatenate([percentiles, 100 - percentiles]), axis=0)
+        at_percentiles = raw_distance_dependent_properties(
+            distance=distance_percentiles, error_distance_plus=None, error_distance_minus=None,
+            galactic_center_distance=R_0, **chunk_columns)
+
+        if any(name not in monotonic_properties for name in properties):
+            sampled = raw_distance_dependent_properties(
+                distance=distance, error_distance_plus=None, error_distance_minus=None,
+                galactic_center_distance=R_0, **chunk_columns)
+
+        for name in properties:
+            if name in monotonic_properties:
+                lower, upper = at_percentiles[name][:n_percentiles], at_percentiles[name][n_percentiles:]
+                values = np.where(below_median, np.minimum(lower, upper), np.maximum(lower, upper))
+            else:
+                values = np.percentile(sampled[name], percentiles, axis=0)
+
+            percentile_values[name][:, chunk] = values
+
+    return dict((name, u.Quantity(values, units[name], copy=False))
+                for name, values in percentile_values.items())
+
+
+def assign_monte_carlo_properties(catalog, percentiles=(16, 50, 84), **kwargs):
+    """
+    Assigns the output of `monte_carlo_properties` to `catalog`.
+
+    Each percentile of each property becomes a column named for both,
+    e.g. `mass_p16`, `mass_p50` and `mass_p84`. Keyword arguments are
+    passed on to `monte_carlo_properties`.
+
+    """
+
+    percentile_values = monte_carlo_properties(catalog, percentiles=percentiles, **kwargs)
+
+    for name in kwargs.get('properties', default_properties):
+        for i, percentile in enumerate(percentiles):
+            catalog['{0}_p{1:g}'.format(name, percentile)] = percentile_values[name][i]
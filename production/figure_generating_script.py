@@ -40,7 +40,7 @@ from dendrogal.production.map_figures import make_quadrant_lbv_map, make_quadran
 from dendrogal.production.plot_catalog_measurements import plot_cmf, plot_size_linewidth_fit
 from dendrogal.production.multipanel_catalog_measurements import multipanel_size_linewidth, multipanel_cmf
 
-from dendrogal.production.map_dendrogram_thumbnail_figure import make_thumbnail_dendro_figure
+from dendrogal.production.batch_thumbnails import render_thumbnails
 
 
 output_path = os.path.expanduser("~/Dropbox/Grad School/Research/Milkyway/paper/")
@@ -143,8 +143,7 @@ def make_thumbnail_figures():
     quad1_cloud_idx = 2868
     quad1_cat = export_firstquad_catalog()
 
-    quad1_fig = make_thumbnail_dendro_figure(quad1_d, quad1_cat, quad1_cloud_idx)
-    quad1_fig.savefig(output_path+"quad1_thumbnail.pdf", bbox_inches='tight')
+    render_thumbnails(quad1_d, quad1_cat, [quad1_cloud_idx], [output_path+"quad1_thumbnail.pdf"], n_processes=1)
 
     print quad1_cat['mass'][quad1_cat['_idx']==quad1_cloud_idx]
     print quad1_cat['error_mass_plus'][quad1_cat['_idx']==quad1_cloud_idx]
@@ -159,8 +158,7 @@ def make_thumbnail_figures():
     quad2_cloud_idx = 66
     quad2_cat = export_secondquad_catalog()
 
-    quad2_fig = make_thumbnail_dendro_figure(quad2_d, quad2_cat, quad2_cloud_idx)
-    quad2_fig.savefig(output_path+"quad2_thumbnail.pdf", bbox_inches='tight')
+    render_thumbnails(quad2_d, quad2_cat, [quad2_cloud_idx], [output_path+"quad2_thumbnail.pdf"], n_processes=1)
 
     print quad2_cat['mass'][quad2_cat['_idx']==quad2_cloud_idx]
     print quad2_cat['error_mass_plus'][quad2_cat['_idx']==quad2_cloud_idx]
@@ -175,8 +173,8 @@ def make_thumbnail_figures():
     quad3_cloud_idx = 697
     quad3_cat = export_thirdquad_catalog()
 
-    quad3_fig = make_thumbnail_dendro_figure(quad3_d, quad3_cat, quad3_cloud_idx, panel_width=3.5*u.deg, latitude_px_override=[22, 32])
-    quad3_fig.savefig(output_path+"quad3_thumbnail.pdf", bbox_inches='tight')
+    render_thumbnails(quad3_d, quad3_cat, [quad3_cloud_idx], [output_path+"quad3_thumbnail.pdf"], n_processes=1,
+                      panel_width=3.5*u.deg, latitude_px_override=[22, 32])
 
     print quad3_cat['mass'][quad3_cat['_idx']==quad3_cloud_idx]
     print quad3_cat['error_mass_plus'][quad3_cat['_idx']==quad3_cloud_idx]
@@ -190,8 +188,8 @@ def make_thumbnail_figures():
 
 
     quad3b_cloud_idx = 710
-    quad3b_fig = make_thumbnail_dendro_figure(quad3_d, quad3_cat, quad3b_cloud_idx, latitude_px_override=[17, 34])
-    quad3b_fig.savefig(output_path+"quad3b_thumbnail.pdf", bbox_inches='tight')
+    render_thumbnails(quad3_d, quad3_cat, [quad3b_cloud_idx], [output_path+"quad3b_thumbnail.pdf"], n_processes=1,
+                      latitude_px_override=[17, 34])
 
     print "\n ****** THIS IS THE ONE: ****** \n \n \n"
 
@@ -209,8 +207,7 @@ def make_thumbnail_figures():
     quad4_cloud_idx = 484
     quad4_cat = export_fourthquad_catalog()
 
-    quad4_fig = make_thumbnail_dendro_figure(quad4_d, quad4_cat, quad4_cloud_idx)
-    quad4_fig.savefig(output_path+"quad4_thumbnail.pdf", bbox_inches='tight')
+    render_thumbnails(quad4_d, quad4_cat, [quad4_cloud_idx], [output_path+"quad4_thumbnail.pdf"], n_processes=1)
 
     print quad4_cat['mass'][quad4_cat['_idx']==quad4_cloud_idx]
     print quad4_cat['error_mass_plus'][quad4_cat['_idx']==quad4_cloud_idx]
@@ -17,6 +17,7 @@ import astropy.units as u
 from wcsaxes import WCSAxes
 
 from dendrogal.production.dame_color_dict import dame_cmap
+from dendrogal.production.moment_maps import moment_maps_for
 
 colorbrewer_red = '#e41a1c' 
 colorbrewer_blue = '#377eb8'
@@ -58,9 +59,13 @@ class IntegratedMapFigure(object):
 
     def __init__(self, datacube, wcs_object,  
                  aspect_in_units=5*(u.km/u.s)/u.deg, cmap=dame_cmap,
-                 integration_limits=(-1,1), figsize=(10,9), vmin=None, vmax=None):
+                 integration_limits=(-1,1), figsize=(10,9), vmin=None, vmax=None,
+                 moment_maps=None):
 
         self.datacube = datacube
+        if moment_maps is None:
+            moment_maps = moment_maps_for(datacube)
+        self.moment_maps = moment_maps
         self.wcs = wcs_object
 
         self.fig = plt.figure(figsize=figsize)
@@ -74,9 +79,7 @@ class IntegratedMapFigure(object):
 
         min_b_px, max_b_px = latitude_world2pix(self.wcs, integration_limits)
 
-        array_lv = np.nansum(self.datacube[:,min_b_px:max_b_px,:], axis=1)
-        array_lv[(array_lv < 0) | np.isinf(array_lv) | np.isnan(array_lv)] = 0
-        self.array_lv = array_lv
+        self.array_lv = self.moment_maps.lv((min_b_px, max_b_px))
 
         self.spatial_scale = np.abs(self.wcs.wcs.cdelt[0]) * u.deg
         self.velocity_scale = np.abs(self.wcs.wcs.cdelt[2]) * u.km/u.s
@@ -107,12 +110,14 @@ class IntegratedMapFigure(object):
 
 
 def integrated_map_axes_lb(fig, ax_limits, datacube, wcs_object, integration_limits,
-                           cmap=dame_cmap ):
+                           cmap=dame_cmap, moment_maps=None):
     """ 
     Hackish way of exporting the above behavior to an ax object.
 
     But it's actually on-the-sky.
 
+    `moment_maps` defaults to the shared `moment_maps_for(datacube)`.
+
     """
 
     ax = WCSAxes(fig, ax_limits, wcs=wcs_object, 
@@ -122,8 +127,9 @@ def integrated_map_axes_lb(fig, ax_limits, datacube, wcs_object, integration_lim
     min_v_px, max_v_px = velocity_world2pix(wcs_object, integration_limits)
     min_v_px, max_v_px = sanitize_integration_limits((min_v_px, max_v_px), datacube, axis=0)
 
-    array_lb = np.nansum(datacube[min_v_px:max_v_px,:,:], axis=0)
-    array_lb[(array_lb < 0) | np.isinf(array_lb) | np.isnan(array_lb)] = 0
+    if moment_maps is None:
+        moment_maps = moment_maps_for(datacube)
+    array_lb = moment_maps.lb((min_v_px, max_v_px))
 
     ax.spatial_scale = np.abs(wcs_object.wcs.cdelt[0]) * u.deg
     ax.velocity_scale = np.abs(wcs_object.wcs.cdelt[2]) * u.km/u.s    
@@ -136,10 +142,12 @@ def integrated_map_axes_lb(fig, ax_limits, datacube, wcs_object, integration_lim
 
 def integrated_map_axes_lv(fig, ax_limits, datacube, wcs_object, integration_limits,
                            aspect_in_units=5*(u.km/u.s)/u.deg, latitude_px_override=None,
-                           cmap=dame_cmap):
+                           cmap=dame_cmap, moment_maps=None):
     """ 
     Hackish way of exporting the above behavior to an ax object.
 
+    `moment_maps` defaults to the shared `moment_maps_for(datacube)`.
+
     """
 
     ax = WCSAxes(fig, ax_limits, wcs=wcs_object, 
@@ -152,8 +160,9 @@ def integrated_map_axes_lv(fig, ax_limits, datacube, wcs_object, integration_lim
     else:
         min_b_px, max_b_px = latitude_px_override
         
-    array_lv = np.nansum(datacube[:,min_b_px:max_b_px,:], axis=1)
-    array_lv[(array_lv < 0) | np.isinf(array_lv) | np.isnan(array_lv)] = 0
+    if moment_maps is None:
+        moment_maps = moment_maps_for(datacube)
+    array_lv = moment_maps.lv((min_b_px, max_b_px))
 
     ax.spatial_scale = np.abs(wcs_object.wcs.cdelt[0]) * u.deg
     ax.velocity_scale = np.abs(wcs_object.wcs.cdelt[2]) * u.km/u.s
@@ -6,6 +6,7 @@ from __future__ import division
 
 import pickle
 import datetime
+from collections import OrderedDict
 import numpy as np
 
 import astropy
@@ -70,9 +71,17 @@ def permute_data_to_standard_order(datacube, header, permute_tuple=(2,0,1)):
 
     """
 
-    pt = permute_tuple
+    new_datacube = datacube.transpose(permute_tuple)
+
+    new_header = permute_header(header, permute_tuple)
+
+    return new_datacube, new_header
+
 
-    new_datacube = datacube.transpose(pt)
+def permute_header(header, permute_tuple=(2,0,1)):
+    """ Permutes the axes' properties in a header, as `permute_data_to_standard_order` does. """
+
+    pt = permute_tuple
 
     new_header = header.copy()
 
@@ -82,7 +91,214 @@ def permute_data_to_standard_order(datacube, header, permute_tuple=(2,0,1)):
             # replace each keyword's value at `i+1` with its value at `pt[i]+1`.
             new_header['{0}{1}'.format(keyword, pt[i]+1)] = header['{0}{1}'.format(keyword, i+1)]
 
-    return new_datacube, new_header
+    return new_header
+
+
+class CubeView(object):
+    """
+    A lazily-permuted, chunked view of a (memory-mapped) datacube.
+
+    Transposing a memmapped cube is free, but anything that then needs
+    contiguous data (astrodendro, `np.nansum` over a non-contiguous axis)
+    ends up copying it -- often all of it. A CubeView instead hands out
+    contiguous chunks of the permuted cube, copying only those, and keeps
+    the most recently used chunks up to `cache_bytes`. Anything that needs
+    the whole cube gets a full copy, which is reported.
+
+    Chunks are cut along the file's slowest-varying axis by default (the
+    permuted axis 1, latitude, for the default `permute_tuple`), so that
+    each is read from one contiguous block of the file and permuted in
+    memory. Cut along any other axis, every chunk would stride through
+    the whole file.
+
+    Parameters
+    ----------
+    datacube : np.ndarray
+        The cube in file order; usually a memmap from `load_data`.
+    header : astropy.io.fits.header.Header
+        The header in file order.
+    permute_tuple : 3-element tuple, default: (2,0,1)
+        As in `permute_data_to_standard_order`.
+    chunk_size : int, optional
+        Planes per chunk along `chunk_axis`.
+    cache_bytes : int, optional
+        Bound on the memory held by cached chunks.
+    verbose : bool, optional
+        Whether to report full copies.
+    chunk_axis : int, optional
+        The permuted axis to cut chunks along; by default, the one that
+        is the file's first (slowest-varying) axis.
+
+    Examples
+    --------
+    >>> view = load_cube_view("DHT17_Quad2_bw_mom.fits")
+    >>> channel_map = view[120]
+    >>> integrated_map = view.reduce(np.nansum, axis=0)
+
+    """
+
+    def __init__(self, datacube, header, permute_tuple=(2,0,1), chunk_size=32,
+                 cache_bytes=256*1024**2, verbose=True, chunk_axis=None):
+
+        self._datacube = datacube
+        self._permuted = datacube.transpose(permute_tuple)
+        self.permute_tuple = permute_tuple
+        self.header = permute_header(header, permute_tuple)
+
+        if chunk_axis is None:
+            chunk_axis = list(permute_tuple).index(0)
+        self.chunk_axis = chunk_axis
+
+        self.chunk_size = chunk_size
+        self.cache_bytes = cache_bytes
+        self.verbose = verbose
+
+        self._cache = OrderedDict()
+        self.n_full_copies = 0
+
+    @property
+    def shape(self):
+        return self._permuted.shape
+
+    @property
+    def ndim(self):
+        return self._permuted.ndim
+
+    @property
+    def dtype(self):
+        return self._permuted.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def wcs(self):
+        return wcs.WCS(self.header)
+
+    @property
+    def n_chunks(self):
+        return -(-self.shape[self.chunk_axis] // self.chunk_size)
+
+    def _read_chunk(self, start):
+        """ Planes [start, start+chunk_size) along `chunk_axis`, as a contiguous array. """
+
+        slices = [slice(None)] * self.ndim
+        slices[self.chunk_axis] = slice(start, start + self.chunk_size)
+
+        return np.ascontiguousarray(self._permuted[tuple(slices)])
+
+    def chunk(self, i):
+        """ Returns chunk `i` (a contiguous array) of the permuted cube, via the cache. """
+
+        if i in self._cache:
+            self._cache[i] = self._cache.pop(i)
+            return self._cache[i]
+
+        chunk = self._read_chunk(i * self.chunk_size)
+
+        self._cache[i] = chunk
+        while len(self._cache) > 1 and sum(x.nbytes for x in self._cache.values()) > self.cache_bytes:
+            self._cache.popitem(last=False)
+
+        return chunk
+
+    def chunks(self):
+        """ Yields (start, chunk) pairs covering the permuted cube along `chunk_axis`, without caching them. """
+
+        for start in range(0, self.shape[self.chunk_axis], self.chunk_size):
+            yield start, self._read_chunk(start)
+
+    def __getitem__(self, key):
+        """ Indexes the permuted cube, copying only the chunks that `key` touches. """
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        simple = (Ellipsis not in key and len(key) <= self.ndim and
+                  all(isinstance(x, (int, np.integer, slice)) for x in key))
+        if not simple:
+            return self.materialize()[key]
+
+        key = key + (slice(None),) * (self.ndim - len(key))
+        axis = self.chunk_axis
+        n = self.shape[axis]
+
+        def chunk_key(local):
+            return key[:axis] + (local,) + key[axis+1:]
+
+        if isinstance(key[axis], (int, np.integer)):
+            index = key[axis] + n if key[axis] < 0 else key[axis]
+            if not 0 <= index < n:
+                raise IndexError("index {0} is out of bounds for axis {1} with size {2}".format(key[axis], axis, n))
+            return self.chunk(index // self.chunk_size)[chunk_key(index % self.chunk_size)]
+
+        start, stop, step = key[axis].indices(n)
+        planes = np.arange(start, stop, step)
+        if len(planes) == 0:
+            return self._permuted[key]
+
+        # runs of consecutive planes from the same chunk, in order
+        chunk_ids = planes // self.chunk_size
+        runs = np.split(np.arange(len(planes)), np.flatnonzero(np.diff(chunk_ids)) + 1)
+
+        pieces = []
+        for run in runs:
+            i = chunk_ids[run[0]]
+            # a slice rather than an index array, so that the chunk axis
+            # stays put however the other axes are indexed
+            first, last = planes[run[[0, -1]]] - i * self.chunk_size
+            local_stop = last + (1 if step > 0 else -1)
+            local = slice(first, local_stop if local_stop >= 0 else None, step)
+            pieces.append(self.chunk(i)[chunk_key(local)])
+
+        # integer indices before the chunk axis drop out of the result
+        result_axis = axis - sum(isinstance(x, (int, np.integer)) for x in key[:axis])
+        return np.concatenate(pieces, axis=result_axis)
+
+    def reduce(self, function, axis=0):
+        """
+        Applies a NumPy reduction (e.g. `np.nansum`, `np.nanmax`) chunk by chunk.
+
+        Along `chunk_axis`, `function` must be associative, since it
+        combines the per-chunk results; mean-like reductions should be
+        built from sums.
+
+        """
+
+        results = [function(chunk, axis=axis) for start, chunk in self.chunks()]
+
+        if axis == self.chunk_axis:
+            return function(np.array(results), axis=0)
+        else:
+            return np.concatenate(results, axis=self.chunk_axis - (axis < self.chunk_axis))
+
+    def materialize(self):
+        """ Returns the whole permuted cube as a contiguous array (a full copy). """
+
+        self.n_full_copies += 1
+        if self.verbose:
+            print "CubeView: making a full copy of a {0} cube ({1:.1f} MB)".format(
+                self.shape, self._permuted.nbytes / 1024**2)
+
+        return np.ascontiguousarray(self._permuted)
+
+    def __array__(self, dtype=None):
+
+        if dtype is None:
+            return self.materialize()
+        return self.materialize().astype(dtype)
+
+
+def load_cube_view(filename, data_path=data_path, permute_tuple=(2,0,1), **kwargs):
+    """
+    Memory-maps a datacube from disk and wraps it in a `CubeView`.
+
+    Keyword arguments are passed to `CubeView`.
+
+    """
+
+    return CubeView(*load_data(filename, data_path=data_path, memmap=True),
+                    permute_tuple=permute_tuple, **kwargs)
 
 
 def interpolate_data():
@@ -0,0 +1,244 @@
+"""
+Fits truncated and non-truncated power laws to cloud mass spectra, in Python.
+
+This is meant to replace the round trip through IDL's `mspecfit` (see
+`mspecfit_wrapper.py`). Following Rosolowsky (2005), it fits the
+cumulative mass distribution N(M' > M) by maximum likelihood, allowing
+for uncertainties in both the masses and (Poisson) the numbers. It has
+only been validated on synthetic spectra drawn from known power laws
+(see the tests); no IDL result was available to compare it against.
+
+Each cloud i, of mass M_i with uncertainty s_i, is the point
+(M_i, N_i) of the cumulative distribution, N_i being its rank by mass.
+Its residual from a model N(M) is taken along both axes at once,
+
+    r_i = (N(M_i) - N_i) / sqrt(N_i + (dN/dM(M_i) * s_i)**2)
+
+(the "effective variance" of the point), and the fit maximizes the
+likelihood prod(exp(-r_i**2 / 2)).
+
+The models are those of `catalog_measurement`:
+
+    truncated:      N(M' > M) = N_0 * ((M / M_0)**(gamma+1) - 1)
+    non-truncated:  N(M' > M) = (M / M_0)**(gamma+1)
+
+Bootstrap resamples of the catalog are all fitted together: the
+Levenberg-Marquardt iterations below run on a stack of problems at once,
+so a few hundred resamples cost about as much numpy work as a few
+hundred clouds more.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from .catalog_measurement import truncated_cloudmass_function, powerlaw_cloudmass_function
+
+
+def _unpack(parameters, truncated):
+    """ (M_0, N_0, gamma) arrays from fitted parameter rows (log10 M_0, [log10 N_0,] gamma). """
+
+    M_0 = 10**parameters[..., 0]
+    if truncated:
+        N_0 = 10**parameters[..., 1]
+        gamma = parameters[..., 2]
+    else:
+        N_0 = np.zeros_like(M_0)
+        gamma = parameters[..., 1]
+
+    return M_0, N_0, gamma
+
+
+def _residuals(parameters, masses, mass_errors, ranks, truncated):
+    """
+    Effective-variance residuals of each cloud, for a stack of problems.
+
+    parameters is (n_problems, n_parameters); the data are (n_problems, n_clouds).
+
+    """
+
+    M_0, N_0, gamma = [x[:, np.newaxis] for x in _unpack(parameters, truncated)]
+
+    with np.errstate(all='ignore'):
+        scaled = (masses / M_0)**(gamma+1)
+        if truncated:
+            model = truncated_cloudmass_function([M_0, N_0, gamma], masses)
+            slope = N_0 * (gamma+1) * scaled / masses
+        else:
+            model = powerlaw_cloudmass_function([M_0, gamma], masses)
+            slope = (gamma+1) * scaled / masses
+
+        return (model - ranks) / np.sqrt(ranks + (slope * mass_errors)**2)
+
+
+def _cost(parameters, data, truncated):
+
+    cost = np.sum(_residuals(parameters, *data, truncated=truncated)**2, axis=1)
+    cost[~np.isfinite(cost)] = np.inf
+
+    return cost
+
+
+def _initial_parameters(masses, truncated):
+    """
+    Starting points: the (error-free) maximum-likelihood power law, and a cutoff at the largest mass.
+
+    Rows whose masses are all equal have no power law to start from, and
+    get NaN parameters (which the fit leaves alone).
+
+    """
+
+    n_clouds = masses.shape[1]
+    min_mass = masses.min(axis=1)
+
+    log_ratios = np.sum(np.log(masses / min_mass[:, np.newaxis]), axis=1)
+    with np.errstate(divide='ignore'):
+        gamma = np.where(log_ratios > 0, -1 - n_clouds / log_ratios, np.nan)
+
+    if truncated:
+        M_0 = 1.1 * masses.max(axis=1)
+        N_0 = n_clouds / ((min_mass / M_0)**(gamma+1) - 1)
+        return np.array([np.log10(M_0), np.log10(N_0), gamma]).T
+    else:
+        M_0 = min_mass * n_clouds**(-1 / (gamma+1))
+        return np.array([np.log10(M_0), gamma]).T
+
+
+def _levenberg_marquardt(parameters, data, truncated, max_iterations=200, tolerance=1e-10, step=1e-6):
+    """
+    Minimizes the summed squared residuals of every problem in the stack at once.
+
+    Each problem has its own damping, and stops updating once its cost
+    no longer improves by more than `tolerance` (relative).
+
+    """
+
+    parameters = parameters.copy()
+    n_problems, n_parameters = parameters.shape
+
+    residuals = _residuals(parameters, *data, truncated=truncated)
+    cost = _cost(parameters, data, truncated)
+    damping = np.full(n_problems, 1e-3)
+    active = np.isfinite(cost)
+
+    for iteration in range(max_iterations):
+        if not np.any(active):
+            break
+
+        # only the problems still converging are worked on
+        idx = np.where(active)[0]
+        active_data = [x[idx] for x in data]
+        active_residuals = residuals[idx]
+
+        # forward-difference Jacobian, (n_problems, n_clouds, n_parameters)
+        jacobian = np.empty(active_residuals.shape + (n_parameters,))
+        for j in range(n_parameters):
+            shifted = parameters[idx]
+            shifted[:, j] += step
+            jacobian[..., j] = (_residuals(shifted, *active_data, truncated=truncated) - active_residuals) / step
+
+        jacobian[~np.isfinite(jacobian)] = 0
+        JTJ = np.einsum('pci,pcj->pij', jacobian, jacobian)
+        JTr = np.einsum('pci,pc->pi', jacobian, np.where(np.isfinite(active_residuals), active_residuals, 0))
+
+        diagonal = np.arange(n_parameters)
+        damped = JTJ.copy()
+        damped[:, diagonal, diagonal] += damping[idx, np.newaxis] * (JTJ[:, diagonal, diagonal] + 1e-12)
+
+        try:
+            delta = -np.linalg.solve(damped, JTr[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            delta = -np.array([np.linalg.lstsq(a, b, rcond=None)[0] for a, b in zip(damped, JTr)])
+
+        trial = parameters[idx] + delta
+        trial_residuals = _residuals(trial, *active_data, truncated=truncated)
+        with np.errstate(invalid='ignore'):
+            trial_cost = np.sum(trial_residuals**2, axis=1)
+        trial_cost[~np.isfinite(trial_cost)] = np.inf
+
+        better = trial_cost < cost[idx]
+        converged = better & ((cost[idx] - trial_cost) <= tolerance * cost[idx])
+
+        parameters[idx[better]] = trial[better]
+        residuals[idx[better]] = trial_residuals[better]
+        cost[idx[better]] = trial_cost[better]
+
+        damping[idx[better]] /= 3
+        damping[idx[~better]] *= 4
+
+        # done when the cost stops improving, or no step size helps any more
+        active[idx[converged]] = False
+        active &= damping < 1e12
+
+    return parameters
+
+
+def _sorted_data(masses, mass_errors):
+    """ Sorts each row by decreasing mass and pairs it with its cumulative ranks. """
+
+    order = np.argsort(-masses, axis=1, kind='mergesort')
+    rows = np.arange(masses.shape[0])[:, np.newaxis]
+    ranks = np.broadcast_to(np.arange(1, masses.shape[1] + 1, dtype=float), masses.shape)
+
+    return masses[rows, order], mass_errors[rows, order], ranks
+
+
+def fit_mass_spectrum(mass, mass_error, truncated=True, n_bootstrap=0, seed=None):
+    """
+    Fits a cumulative mass spectrum with a (truncated) power law.
+
+    Parameters
+    ----------
+    mass, mass_error : array_like
+        Cloud masses and their uncertainties (Msun).
+    truncated : bool, optional
+        Fit the truncated power law (N_0, M_0, gamma) rather than the
+        plain one (M_0, gamma).
+    n_bootstrap : int, optional
+        Number of bootstrap resamples to estimate uncertainties from.
+    seed : int, optional
+        Seeds the bootstrap resampling.
+
+    Returns
+    -------
+    fit : dict
+        'N_0', 'M_0' and 'gamma', as returned by `mspecfit_wrapper` (N_0
+        is 0 for the non-truncated power law). With `n_bootstrap`, also
+        'error_N_0', 'error_M_0' and 'error_gamma' (standard deviations
+        over the resamples) and 'bootstrap', an (n_bootstrap, 3) array of
+        the resampled (N_0, M_0, gamma).
+
+    """
+
+    mass = np.asarray(mass, dtype=float)
+    mass_error = np.asarray(mass_error, dtype=float)
+
+    if len(mass) < 3:
+        raise ValueError("Need at least 3 clouds to fit a mass spectrum.")
+    if mass.max() == mass.min():
+        raise ValueError("All clouds have the same mass; there is no spectrum to fit.")
+
+    masses = mass[np.newaxis, :]
+    mass_errors = mass_error[np.newaxis, :]
+
+    if n_bootstrap > 0:
+        random_state = np.random.RandomState(seed)
+        resamples = random_state.randint(0, len(mass), size=(n_bootstrap, len(mass)))
+        masses = np.vstack([masses, mass[resamples]])
+        mass_errors = np.vstack([mass_errors, mass_error[resamples]])
+
+    data = _sorted_data(masses, mass_errors)
+
+    initial = _initial_parameters(data[0], truncated)
+    parameters = _levenberg_marquardt(initial, data, truncated)
+
+    M_0, N_0, gamma = _unpack(parameters, truncated)
+
+    fit = {'N_0': N_0[0], 'M_0': M_0[0], 'gamma': gamma[0]}
+
+    if n_bootstrap > 0:
+        fit['bootstrap'] = np.array([N_0[1:], M_0[1:], gamma[1:]]).T
+        fit['error_N_0'], fit['error_M_0'], fit['error_gamma'] = np.std(fit['bootstrap'], axis=0)
+
+    return fit
@@ -0,0 +1,359 @@
+"""
+Integrated (moment-0) l-b and l-v maps over any velocity or latitude range.
+
+Every viewer, figure and thumbnail integrates the same (v, b, l) cube,
+just over different ranges. So instead of summing the cube each time, we
+take cumulative sums along v and along b once; the map integrated over
+pixels [v1, v2) is then `cumulative_v[v2] - cumulative_v[v1]`, which
+costs one pass over a map rather than over the cube.
+
+The sums are accumulated in float64 but stored as float32, so each
+costs about as much memory as a float32 cube; the sums along b are only
+taken once an l-v map is first asked for. For a cube that came out of
+the dendrogram cache, the cumulative sums are saved as `.npy` files in
+its cache entry (and memory-mapped when read back), so they are only
+ever computed once per cube.
+
+"""
+
+from __future__ import division
+
+import os
+import weakref
+import tempfile
+
+import numpy as np
+
+cumulative_filenames = {'v': "moment_maps_v.npy",
+                        'b': "moment_maps_b.npy",
+                        'infinite': "moment_maps_infinite.npy"}
+
+
+def clean_map(array):
+    """ Zeroes negative, infinite and NaN pixels of an integrated map, in place. """
+
+    array[(array < 0) | np.isinf(array) | np.isnan(array)] = 0
+
+    return array
+
+
+def _pixel_range(pixel_range, n):
+    """ Clips a (low, high) pixel range to [0, n], truncating floats like a slice would. """
+
+    if pixel_range is None:
+        return 0, n
+
+    low = min(max(int(pixel_range[0]), 0), n)
+    high = min(max(int(pixel_range[1]), low), n)
+
+    return low, high
+
+
+def _save_array(path, name, array):
+    """ Writes one array into `path` under a temporary name and renames it into place. """
+
+    filename = os.path.join(path, cumulative_filenames[name])
+
+    if array is None:
+        if os.path.exists(filename):
+            os.remove(filename)
+        return
+
+    f, temporary_filename = tempfile.mkstemp(prefix='.tmp-', suffix='.npy', dir=path)
+    with os.fdopen(f, 'wb') as f:
+        np.save(f, array)
+    os.rename(temporary_filename, filename)
+
+
+def _clean_slab(slab):
+    """ `slab` in float64, with NaNs and infinities zeroed. """
+
+    slab = np.asarray(slab, dtype=np.float64)
+
+    return np.where(np.isfinite(slab), slab, 0)
+
+
+class MomentMaps(object):
+    """
+    Cumulative sums of a (v, b, l) datacube along v and along b.
+
+    NaNs count as zero, as in `np.nansum`. Infinite pixels are listed
+    separately (`infinite_pixels`, or None for a cube without any), so
+    that a map pixel whose range takes in one comes out as zero, just as
+    cleaning a `np.nansum` map would make it.
+
+    Parameters
+    ----------
+    cumulative_v : np.ndarray
+        (n_v+1, n_b, n_l) array; `cumulative_v[k]` sums planes [0, k).
+    cumulative_b : np.ndarray or None
+        (n_v, n_b+1, n_l) array; `cumulative_b[:, k]` sums rows [0, k).
+        If None, it is computed from `datacube` when first needed.
+    infinite_pixels : np.ndarray or None, optional
+        (n, 3) array of the (v, b, l) indices of infinite pixels.
+    datacube : np.ndarray, optional
+        The datacube, for computing `cumulative_b` later. Only a weak
+        reference is kept.
+    path : str, optional
+        Directory to save `cumulative_b` into once it is computed.
+
+    """
+
+    def __init__(self, cumulative_v, cumulative_b=None, infinite_pixels=None, datacube=None, path=None):
+
+        self.cumulative_v = cumulative_v
+        self.cumulative_b = cumulative_b
+        self.infinite_pixels = infinite_pixels
+        self.path = path
+        self._datacube = None if datacube is None else weakref.ref(datacube)
+
+    @property
+    def shape(self):
+        """ Shape of the datacube these maps integrate. """
+        return (self.cumulative_v.shape[0] - 1,) + self.cumulative_v.shape[1:]
+
+    @property
+    def cumulative_b_shape(self):
+        """ Shape `cumulative_b` has (or will have). """
+        n_v, n_b, n_l = self.shape
+        return (n_v, n_b + 1, n_l)
+
+    @classmethod
+    def compute(cls, datacube, slab_size=64, lv=False, verbose=False):
+        """
+        Takes the cumulative sums of `datacube`, `slab_size` velocity planes at a time.
+
+        `datacube` may be a memmap (or anything that slices like an array);
+        only one slab of it is in memory at once. The sums along b are
+        taken now only if `lv`; otherwise, when `lv` is first called.
+
+        """
+
+        n_v, n_b, n_l = datacube.shape
+
+        cumulative_v = np.zeros((n_v + 1, n_b, n_l), dtype=np.float32)
+        infinite_pixels = []
+
+        # carried in float64, so that rounding doesn't build up from slab to slab
+        running_sum = np.zeros((n_b, n_l))
+
+        for start in range(0, n_v, slab_size):
+            stop = min(start + slab_size, n_v)
+
+            if verbose:
+                print "Integrating planes {0}-{1} of {2}".format(start, stop, n_v)
+
+            slab = np.asarray(datacube[start:stop])
+            infinite = np.argwhere(np.isinf(slab))
+            if len(infinite):
+                infinite[:, 0] += start
+                infinite_pixels.append(infinite)
+
+            slab_sums = running_sum + np.cumsum(_clean_slab(slab), axis=0)
+            cumulative_v[start+1:stop+1] = slab_sums
+            running_sum = slab_sums[-1]
+
+        infinite_pixels = np.concatenate(infinite_pixels) if infinite_pixels else None
+
+        moment_maps = cls(cumulative_v, None, infinite_pixels, datacube=datacube)
+        if lv:
+            moment_maps.cumulative_b = moment_maps._compute_cumulative_b(datacube, slab_size, verbose)
+
+        return moment_maps
+
+    @staticmethod
+    def _compute_cumulative_b(datacube, slab_size=64, verbose=False):
+
+        n_v, n_b, n_l = datacube.shape
+
+        cumulative_b = np.zeros((n_v, n_b + 1, n_l), dtype=np.float32)
+
+        for start in range(0, n_v, slab_size):
+            stop = min(start + slab_size, n_v)
+
+            if verbose:
+                print "Integrating planes {0}-{1} of {2} along b".format(start, stop, n_v)
+
+            cumulative_b[start:stop, 1:] = np.cumsum(_clean_slab(datacube[start:stop]), axis=1)
+
+        return cumulative_b
+
+    def _get_cumulative_b(self):
+
+        if self.cumulative_b is None:
+            datacube = None if self._datacube is None else self._datacube()
+            if datacube is None:
+                raise ValueError("These moment maps have no l-v sums, and their datacube is gone.")
+
+            self.cumulative_b = self._compute_cumulative_b(datacube)
+            if self.path is not None and os.path.isdir(self.path):
+                _save_array(self.path, 'b', self.cumulative_b)
+
+        return self.cumulative_b
+
+    def save(self, path):
+        """
+        Writes the cumulative sums into directory `path` (e.g. a cache entry).
+
+        Each file is written under a temporary name and renamed into place,
+        so a reader never sees a partial file. Sums along b not taken yet
+        are saved into `path` once they are.
+
+        """
+
+        _save_array(path, 'v', self.cumulative_v)
+        _save_array(path, 'b', self.cumulative_b)
+        _save_array(path, 'infinite', self.infinite_pixels)
+
+        self.path = path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r', datacube=None):
+        """
+        Reads maps saved by `save`, memory-mapping them by default.
+
+        `datacube` is needed if the sums along b weren't saved.
+
+        """
+
+        arrays = {}
+        for name, filename in cumulative_filenames.items():
+            filename = os.path.join(path, filename)
+            if name != 'v' and not os.path.exists(filename):
+                arrays[name] = None
+            else:
+                arrays[name] = np.load(filename, mmap_mode=None if name == 'infinite' else mmap_mode)
+
+        return cls(arrays['v'], arrays['b'], arrays['infinite'], datacube=datacube, path=path)
+
+    def _zero_infinite(self, array, axis, pixel_range, window):
+        """ Zeroes the pixels of a map integrated over `pixel_range` along `axis` that take in an infinite pixel. """
+
+        if self.infinite_pixels is None:
+            return
+
+        low, high = pixel_range
+        infinite_pixels = self.infinite_pixels[(self.infinite_pixels[:, axis] >= low) &
+                                               (self.infinite_pixels[:, axis] < high)]
+        map_pixels = np.delete(infinite_pixels, axis, axis=1)
+
+        # into the window's coordinates
+        map_shape = np.delete(np.array(self.shape), axis)
+        for i, window_slice in enumerate(window):
+            start, stop, step = window_slice.indices(map_shape[i])
+            if step != 1:
+                raise ValueError("`window` slices must have a step of 1.")
+            in_window = (map_pixels[:, i] >= start) & (map_pixels[:, i] < stop)
+            map_pixels = map_pixels[in_window]
+            map_pixels[:, i] -= start
+
+        array[tuple(map_pixels.T)] = 0
+
+    def lb(self, velocity_px_range=None, window=(slice(None), slice(None))):
+        """
+        The l-b map integrated over velocity pixels [v1, v2).
+
+        Equivalent to cleaning `np.nansum(datacube[v1:v2], axis=0)` with
+        `clean_map`; the whole velocity axis by default. `window`, a
+        (b, l) tuple of slices, crops the map (only the cropped part of
+        the cumulative sums is read).
+
+        """
+
+        v1, v2 = _pixel_range(velocity_px_range, self.cumulative_v.shape[0] - 1)
+        window = tuple(window)
+
+        array_lb = self.cumulative_v[(v2,) + window] - self.cumulative_v[(v1,) + window]
+        self._zero_infinite(array_lb, 0, (v1, v2), window)
+
+        return clean_map(array_lb)
+
+    def lv(self, latitude_px_range=None, window=(slice(None), slice(None))):
+        """
+        The l-v map integrated over latitude pixels [b1, b2).
+
+        Equivalent to cleaning `np.nansum(datacube[:, b1:b2], axis=1)` with
+        `clean_map`; the whole latitude axis by default. `window`, a
+        (v, l) tuple of slices, crops the map. The first call takes the
+        cumulative sums along b, if they weren't already.
+
+        """
+
+        cumulative_b = self._get_cumulative_b()
+
+        b1, b2 = _pixel_range(latitude_px_range, cumulative_b.shape[1] - 1)
+        v_window, l_window = window
+
+        array_lv = cumulative_b[v_window, b2, l_window] - cumulative_b[v_window, b1, l_window]
+        self._zero_infinite(array_lv, 1, (b1, b2), (v_window, l_window))
+
+        return clean_map(array_lv)
+
+
+# One entry per datacube in use: id(datacube) -> [weakref to datacube, path, MomentMaps].
+# Held by id because arrays can't be dict keys, and by weak reference so
+# that a discarded cube (and its maps) can be freed.
+_moment_maps_registry = {}
+
+
+def _registry_entry(datacube):
+
+    for key, entry in list(_moment_maps_registry.items()):
+        if entry[0]() is None:
+            del _moment_maps_registry[key]
+
+    entry = _moment_maps_registry.get(id(datacube))
+    if entry is None or entry[0]() is not datacube:
+        entry = [weakref.ref(datacube), None, None]
+        _moment_maps_registry[id(datacube)] = entry
+
+    return entry
+
+
+def register_moment_maps_path(datacube, path):
+    """
+    Tells `moment_maps_for` where the maps of `datacube` live (or should be saved).
+
+    `path` is a directory, typically the datacube's dendrogram cache entry.
+
+    """
+
+    _registry_entry(datacube)[1] = path
+
+
+def moment_maps_for(datacube, verbose=False):
+    """
+    Returns the `MomentMaps` of `datacube`, computing them at most once.
+
+    If a path was registered for `datacube` (see `register_moment_maps_path`),
+    the maps are read from there, or computed and saved there if absent
+    (the sums along b once an l-v map is first made). Otherwise they are
+    computed in memory and kept for as long as `datacube` is.
+
+    """
+
+    entry = _registry_entry(datacube)
+
+    if entry[2] is None:
+        path = entry[1]
+        moment_maps = None
+
+        if path is not None:
+            try:
+                moment_maps = MomentMaps.load(path, datacube=datacube)
+                if moment_maps.shape != datacube.shape:
+                    moment_maps = None
+                elif (moment_maps.cumulative_b is not None and
+                      moment_maps.cumulative_b.shape != moment_maps.cumulative_b_shape):
+                    moment_maps = None
+            except (IOError, OSError, ValueError):
+                moment_maps = None
+
+        if moment_maps is None:
+            moment_maps = MomentMaps.compute(datacube, verbose=verbose)
+            if path is not None and os.path.isdir(path):
+                moment_maps.save(path)
+
+        entry[2] = moment_maps
+
+    return entry[2]
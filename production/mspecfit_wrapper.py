@@ -1,6 +1,10 @@
 """
 Takes a given catalog and returns the mass spectrum fits.
 
+`get_mspec_fit` fits in Python (see `mass_spectrum_fit.py`); the IDL
+`mspecfit` round trip is kept as `get_idl_mspec_fit`, to check the two
+against each other.
+
 """
 
 from __future__ import division
@@ -10,6 +14,16 @@ import subprocess
 import numpy as np
 
 from dendrogal.production.config import idl_code_path, idl_executable
+from dendrogal.production.mass_spectrum_fit import fit_mass_spectrum
+
+
+def catalog_masses(catalog):
+    """ Cloud masses and their (geometric mean) uncertainties. """
+
+    mass = np.asarray(catalog['mass'])
+    mass_err = np.sqrt(catalog['error_mass_plus']*catalog['error_mass_minus'])
+
+    return mass, np.asarray(mass_err)
 
 
 def prepare_stuff_for_mspecfit(catalog, name):
@@ -18,8 +32,7 @@ def prepare_stuff_for_mspecfit(catalog, name):
 
     """
 
-    mass = catalog['mass']
-    mass_err = np.sqrt(catalog['error_mass_plus']*catalog['error_mass_minus'])
+    mass, mass_err = catalog_masses(catalog)
 
     fname_mass = os.path.join(idl_code_path, name+'mass.txt')
     fname_err = os.path.join(idl_code_path, name+'err.txt')
@@ -63,7 +76,7 @@ def parse_idl_output(output):
     return output_dict
 
 
-def get_mspec_fit(catalog, name, notrunc=1):
+def get_idl_mspec_fit(catalog, name, notrunc=1):
     """ Combines the above helper functions. """
 
     # first - make the files
@@ -75,3 +88,20 @@ def get_mspec_fit(catalog, name, notrunc=1):
     # finally - parse it and return the values as a dict
     return parse_idl_output(output)
 
+
+
+def get_mspec_fit(catalog, name=None, notrunc=1, n_bootstrap=0, seed=None):
+    """
+    Fits the mass spectrum of `catalog`, without going through IDL.
+
+    Takes the same arguments as `get_idl_mspec_fit` (`name` is only kept
+    for compatibility; no files are written) and returns a dict of the
+    same form. `n_bootstrap` and `seed` are passed on to
+    `fit_mass_spectrum`, adding bootstrap uncertainties to the dict.
+
+    """
+
+    mass, mass_err = catalog_masses(catalog)
+
+    return fit_mass_spectrum(mass, mass_err, truncated=not notrunc,
+                             n_bootstrap=n_bootstrap, seed=seed)
@@ -0,0 +1,81 @@
+"""
+Adds reproducible Gaussian noise to datacubes, in place.
+
+Noise is drawn from a `np.random.RandomState` seeded explicitly (never
+the global RNG), so a trial's noise is fixed by its (noise level, seed)
+pair and can be replayed exactly. It is drawn and added one slab of
+planes at a time, so the only temporary is one slab of noise rather
+than a cube of it -- and since the slabs are drawn in order along the
+first axis, the noise doesn't depend on the slab size either.
+
+(`np.random.Generator`, with its float32 draws, needs numpy >= 1.17,
+which doesn't support Python 2; RandomState draws each slab in float64,
+which is then added into the float32 cube.)
+
+"""
+
+from __future__ import division
+
+import os
+
+import numpy as np
+
+
+def new_seed():
+    """ A fresh random seed (from the OS), for trials not given one. """
+
+    return int(np.frombuffer(os.urandom(4), dtype=np.uint32)[0])
+
+
+def add_noise(datacube, noise_level, seed, slab_size=16):
+    """
+    Adds Gaussian noise to `datacube` in place.
+
+    Parameters
+    ----------
+    datacube : np.ndarray
+        Modified in place; keeps its dtype (e.g. float32).
+    noise_level : float
+        Standard deviation of the noise.
+    seed : int
+        Seeds the noise; the same seed and noise level always add the
+        same noise to a cube of the same shape.
+    slab_size : int, optional
+        Planes (along the first axis) of noise drawn at a time.
+
+    Returns
+    -------
+    datacube : np.ndarray
+
+    """
+
+    random_state = np.random.RandomState(seed)
+
+    for start in range(0, datacube.shape[0], slab_size):
+        slab = datacube[start:start+slab_size]
+        np.add(slab, random_state.normal(scale=noise_level, size=slab.shape), out=slab, casting='unsafe')
+
+    return datacube
+
+
+def noise_added_copy(datacube, noise_level, seed, dtype=np.float32, slab_size=16):
+    """
+    Returns a copy of `datacube` (as `dtype`) with noise added by `add_noise`.
+
+    This is the one cube-sized allocation a noise trial needs.
+
+    """
+
+    return add_noise(np.array(datacube, dtype=dtype), noise_level, seed, slab_size=slab_size)
+
+
+def noise_record(noise_level, seed):
+    """ The metadata that lets `replay_noise` regenerate a noise trial's cube. """
+
+    return {'noise_level': noise_level, 'noise_seed': seed}
+
+
+def replay_noise(datacube, record, dtype=np.float32):
+    """ Regenerates the noise-added cube described by `record` (see `noise_record`). """
+
+    return noise_added_copy(datacube, record['noise_level'], record['noise_seed'], dtype=dtype)
@@ -0,0 +1,231 @@
+"""
+Runs independent Monte Carlo trials over a process pool, with resumable output.
+
+Each trial is identified by a key (e.g. noise level and trial number) and
+gets its own random seed, derived from that key and a base seed, so a
+trial's result doesn't depend on which process ran it or in what order.
+
+Results are appended to a tab-separated table as each trial finishes,
+one flushed line per trial. If a run is interrupted, running it again
+with the same output file skips every trial already in the table.
+
+The data that every trial starts from (e.g. the base datacube) is read
+once, into shared memory, and inherited by the worker processes rather
+than re-loaded or pickled over to each of them.
+
+"""
+
+from __future__ import division
+
+import os
+import hashlib
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+import astropy.table
+
+# what the worker processes run; set in the parent before the pool forks
+_trial_state = {}
+
+
+def shared_array(array):
+    """
+    Copies `array` into shared memory.
+
+    Returns
+    -------
+    shared : np.ndarray
+        Same shape, dtype and contents as `array`, but backed by a
+        `multiprocessing.RawArray`, which forked processes share
+        rather than copy.
+
+    """
+
+    array = np.asarray(array)
+
+    buffer = multiprocessing.RawArray('b', max(array.nbytes, 1))
+    shared = np.frombuffer(buffer, dtype=array.dtype, count=array.size).reshape(array.shape)
+    shared[...] = array
+
+    return shared
+
+
+def trial_seed(base_seed, key):
+    """
+    Derives a 32-bit seed for the trial identified by `key`.
+
+    The same `base_seed` and `key` always give the same seed, and
+    different keys give unrelated ones.
+
+    """
+
+    sha = hashlib.sha1()
+    sha.update("{0!r};".format(base_seed).encode())
+    for x in key:
+        sha.update("{0!r};".format(x).encode())
+
+    return int(sha.hexdigest()[:8], 16)
+
+
+def _format_value(value):
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    return str(value)
+
+
+def read_completed_keys(output_filename, key_names, column_names):
+    """
+    Finds the trials already recorded in `output_filename`.
+
+    A last line left incomplete by a crash is dropped from the file. A
+    file written with fewer result columns (by an older version of the
+    trial function) is rewritten with `column_names`, the missing values
+    of its trials set to nan.
+
+    Returns
+    -------
+    completed : set of tuple
+        Keys of the completed trials (as floats).
+
+    """
+
+    if not os.path.exists(output_filename):
+        return set()
+
+    with open(output_filename) as f:
+        content = f.read()
+
+    # every complete line ends in a newline; anything after the last one
+    # was cut off mid-write
+    lines = content.split('\n')[:-1]
+    rewrite = not content.endswith('\n')
+
+    file_columns = lines[0].split('\t') if lines else []
+    if (len(lines) == 0 or not set(file_columns) <= set(column_names) or
+            not set(key_names) <= set(file_columns)):
+        raise ValueError("{0} doesn't hold the expected columns.".format(output_filename))
+
+    if file_columns != list(column_names):
+        rows = [dict(zip(file_columns, line.split('\t'))) for line in lines[1:]]
+        lines = ['\t'.join(column_names)] + ['\t'.join(row.get(x, 'nan') for x in column_names) for row in rows]
+        rewrite = True
+
+    completed = set()
+    for line in lines[1:]:
+        values = line.split('\t')
+        completed.add(tuple(float(values[column_names.index(x)]) for x in key_names))
+
+    if rewrite:
+        # rewrite the lines kept, then move into place
+        f, temporary_filename = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(os.path.abspath(output_filename)))
+        with os.fdopen(f, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.rename(temporary_filename, output_filename)
+
+    return completed
+
+
+def read_trial_table(output_filename):
+    """ Reads the output of `run_trials` as an astropy Table. """
+
+    return astropy.table.Table.read(output_filename, format='ascii.tab')
+
+
+def _run_trial(task):
+    """ Runs one trial in a worker; returns (key, seed, result or None, error message). """
+
+    key, seed = task
+
+    try:
+        result = _trial_state['function'](_trial_state['data'], key, seed)
+        return key, seed, result, None
+    except Exception as e:
+        return key, seed, None, "{0}: {1}".format(type(e).__name__, e)
+
+
+def run_trials(trial_function, trial_keys, key_names, result_names, output_filename,
+               data=None, base_seed=0, n_processes=None, verbose=True):
+    """
+    Runs `trial_function` once per key, across a process pool.
+
+    Parameters
+    ----------
+    trial_function : function
+        Called as `trial_function(data, key, seed)`; returns a dict
+        holding (at least) every name in `result_names`. It must not
+        modify `data`, which all trials share.
+    trial_keys : list of tuple
+        One key per trial.
+    key_names : list of str
+        Column names for the elements of each key.
+    result_names : list of str
+        Column names for the results.
+    output_filename : str
+        Tab-separated table to append results to. Trials whose keys are
+        already in it are skipped.
+    data : optional
+        Passed to every trial; typically the output of `shared_array`.
+    base_seed : int, optional
+        Combined with each key (see `trial_seed`) into the trial's seed.
+    n_processes : int, optional
+        Size of the process pool. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    table : astropy.table.Table
+        Every completed trial in `output_filename`: the key columns,
+        'seed', and the result columns.
+
+    """
+
+    column_names = list(key_names) + ['seed'] + list(result_names)
+
+    completed = read_completed_keys(output_filename, key_names, column_names)
+    tasks = [(tuple(key), trial_seed(base_seed, key)) for key in trial_keys
+             if tuple(float(x) for x in key) not in completed]
+
+    if verbose:
+        print "{0} trials to run ({1} already done)".format(len(tasks), len(trial_keys) - len(tasks))
+
+    if not os.path.exists(output_filename):
+        with open(output_filename, 'w') as f:
+            f.write('\t'.join(column_names) + '\n')
+
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    n_processes = max(min(n_processes, len(tasks)), 1)
+
+    _trial_state['function'] = trial_function
+    _trial_state['data'] = data
+
+    pool = None
+    try:
+        if n_processes > 1:
+            pool = multiprocessing.Pool(n_processes)
+            results = pool.imap_unordered(_run_trial, tasks)
+        else:
+            results = (_run_trial(task) for task in tasks)
+
+        with open(output_filename, 'a') as f:
+            for key, seed, result, error in results:
+                if error is not None:
+                    print " *** Trial {0} failed (it will be retried on resuming): {1}".format(key, error)
+                    continue
+
+                row = list(key) + [seed] + [result[name] for name in result_names]
+                f.write('\t'.join(_format_value(x) for x in row) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+                if verbose:
+                    print "Finished trial {0}".format(key)
+    finally:
+        # every result has been read by now (or we're bailing out)
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        _trial_state.clear()
+
+    return read_trial_table(output_filename)
@@ -5,46 +5,36 @@ Here is a function that reduces a selection to its principal branches.
 
 import numpy as np
 
-def remove_degenerate_structures(structures):
+from .ancestry_index import AncestryIndex, ancestry_index
+
+def remove_degenerate_structures(structures, index=None):
     """
     Remove all degenerate structures in a list 
 
     (i.e., structures that are descendants of other structures) 
 
-    """
-
-    structure_set = set(structures)
-
-    # sort by size
-    structures_by_descendants = sorted(structures, key=lambda k: len(k.descendants))
+    Parameters
+    ----------
+    structures : list of astrodendro.structure.Structure
+    index : ancestry_index.AncestryIndex, optional
+        An index covering `structures`. If not given, one is built over 
+        the trees that `structures` belong to.
 
-    # from smallest to largest:
-    for little_struct, i in zip(structures_by_descendants, range(len(structures_by_descendants))):
+    """
 
-        # ask from largest to smallest:
-        for big_struct in structures_by_descendants[:i:-1]: # backwards, and skip everyone smaller than little_struct
+    if len(structures) == 0:
+        return []
 
-            # "are you my ancestor?" (# wait, why isn't there an "ancestors" property?)
-            if little_struct in big_struct.descendants: 
+    if index is None:
+        index = AncestryIndex(set(struct.ancestor for struct in structures))
 
-                # if so, remove the little guy
-                structure_set.remove(little_struct)
-                # and stop asking
-                break 
+    principal_idx = set(index.principal_branches([struct.idx for struct in structures]))
 
-    return list(structure_set)
+    return [struct for struct in structures if struct.idx in principal_idx]
 
 def reduce_catalog(d, catalog):
 
-    # first, get a list of structures by harvesting a catalog
-    struct_list = []
-    for row in catalog:
-        struct_list.append(d[row['_idx']])
-
-    smaller_struct_list = remove_degenerate_structures(struct_list)
-
-    # now harvest the id's and rebuild the catalog
-    smaller_idx_list = [struct.idx for struct in smaller_struct_list]
+    smaller_idx_list = ancestry_index(d).principal_branches(catalog['_idx'])
 
     smaller_catalog = catalog[np.in1d(catalog['_idx'], smaller_idx_list)]
 
@@ -62,9 +52,10 @@ def selection_from_catalog(d, catalog, subtree=False):
     struct_list = [d[idx] for idx in catalog['_idx']]
 
     if subtree:
+        index = ancestry_index(d)
         substructure_list = []
-        for struct in struct_list:
-            substructure_list.extend(struct.descendants)
+        for idx in catalog['_idx']:
+            substructure_list.extend(d[x] for x in index.descendants(idx))
 
         struct_list.extend(substructure_list)
 
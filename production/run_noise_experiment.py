@@ -29,8 +29,12 @@ from dendrogal.production.compute_dendrogram_and_catalog import compute_dendrogr
 from dendrogal.production.cloud_extractor_q1 import first_quad_cloud_catalog, compile_firstquad_catalog
 
 from dendrogal.production.catalog_measurement import size_linewidth_slope
+from dendrogal.production.size_linewidth_fit import size_linewidth_fits
 from dendrogal.production.mspecfit_wrapper import get_mspec_fit
 
+from dendrogal.production.noise_trial_scheduler import run_trials, shared_array
+from dendrogal.production.noise_injection import add_noise, noise_added_copy, noise_record, new_seed
+
 from dendrogal.production.config import data_path
 
 # these are hard-coded because reasons.
@@ -48,32 +52,52 @@ raw_filename = "DHT08_Quad1_raw.fits"
 
 # so for the "part 2" thing above... we'll have to take the INTERPOLATED data and moment-mask it manually yeah?
 
-def compute_noise_added_processed_dendrogram(noise_added=0, original_noise=0.18, smoothed_rms_noise=None):
+def dendrogram_noise_added_cube(noise_added_cube, header, noise_added, original_noise=0.18, smoothed_rms_noise=None):
+    """ Moment-masks a cube that has had noise added, then dendrograms & catalogs it. """
+
+    # moment-mask it
+    print "moment-masking data..."
+    total_noise = (noise_added**2+original_noise**2)**(1/2) # unused, I think
+
+    if smoothed_rms_noise is None:
+        smoothed_rms_noise = 0.05
+
+    moment_masked_cube = moment_mask(noise_added_cube, total_noise, velocity_smoothing=3, smoothed_rms_noise=smoothed_rms_noise)
+
+    # now we'll dendrogram it
+    print "dendrogramming data..."
+    d = compute_dendrogram(moment_masked_cube, header, min_value=min_value, min_delta=min_delta, min_npix=min_npix)
+    catalog, metadata = compute_catalog(d, header)
+
+    return d, catalog
+
+
+def compute_noise_added_processed_dendrogram(noise_added=0, original_noise=0.18, smoothed_rms_noise=None, seed=None):
+    """
+    Dendrograms the first quadrant with `noise_added` K of extra noise.
+
+    The noise is seeded by `seed` (a fresh one if not given), which is
+    recorded, with the noise level, in the output catalog's `meta`.
+
+    """
 
     if noise_added > 0:
 
+        if seed is None:
+            seed = new_seed()
+
         # get some data
         print "loading data..."
         datacube, header = load_permute_data(data_filename, memmap=False)
 
         # add some noise to it
-        print "adding noise to data..."
-        noise_cube = np.random.normal(scale=noise_added, size=datacube.shape)
-        noise_added_cube = datacube + noise_cube
-
-        # moment-mask it
-        print "moment-masking data..."
-        total_noise = (noise_added**2+original_noise**2)**(1/2) # unused, I think
+        print "adding noise to data (seed {0})...".format(seed)
+        noise_added_cube = add_noise(np.asarray(datacube, dtype=np.float32), noise_added, seed)
+        del datacube
 
-        if smoothed_rms_noise is None:
-            smoothed_rms_noise = 0.05
-
-        moment_masked_cube = moment_mask(noise_added_cube, total_noise, velocity_smoothing=3, smoothed_rms_noise=smoothed_rms_noise)
-
-        # now we'll dendrogram it
-        print "dendrogramming data..."
-        d = compute_dendrogram(moment_masked_cube, header, min_value=min_value, min_delta=min_delta, min_npix=min_npix)
-        catalog, metadata = compute_catalog(d, header)
+        d, catalog = dendrogram_noise_added_cube(noise_added_cube, header, noise_added, 
+                                                 original_noise=original_noise, smoothed_rms_noise=smoothed_rms_noise)
+        catalog.meta.update(noise_record(noise_added, seed))
 
         return d, catalog
 
@@ -83,7 +107,15 @@ def compute_noise_added_processed_dendrogram(noise_added=0, original_noise=0.18,
 
         return d, catalog
 
-def extract_properties_from_dendrogram_catalog(dendrogram, raw_catalog, i=0):
+def extract_properties_from_dendrogram_catalog(dendrogram, raw_catalog, i=0, mspec_prefix=''):
+    """
+    Measures the cloud population of a first-quadrant dendrogram.
+
+    `mspec_prefix` is prepended to the names of the files handed to the
+    mass spectrum fitter, so that concurrent trials don't overwrite
+    each other's.
+
+    """
 
     # we want to extract the following:
 
@@ -141,15 +173,23 @@ def extract_properties_from_dendrogram_catalog(dendrogram, raw_catalog, i=0):
     larson_dict['outer_larson_beta'] = outer_larson_output.beta[1]
     larson_dict['outer_larson_A'] = outer_larson_output.beta[0]
 
+    # the log-space (Deming) fit, whose bootstrap gives a single trial error bars
+    larson_fits = size_linewidth_fits({'inner': inner_catalog, 'outer': outer_catalog}, seed=0)
+
+    for name in ['inner', 'outer']:
+        larson_dict[name+'_larson_deming_A'] = larson_fits[name]['A']
+        larson_dict[name+'_larson_deming_beta'] = larson_fits[name]['B']
+        larson_dict[name+'_larson_deming_beta_error'] = larson_fits[name]['error_B']
+
     output_dict['larson'] = larson_dict
 
     # feed stuff to Mass function
 
     # inner : truncated
-    inner_mspec = get_mspec_fit(vetted_inner_catalog, 'inner_', notrunc=0)
+    inner_mspec = get_mspec_fit(vetted_inner_catalog, mspec_prefix+'inner_', notrunc=0)
 
     # outer : non-truncated
-    outer_mspec = get_mspec_fit(vetted_outer_catalog, 'outer_', notrunc=1)
+    outer_mspec = get_mspec_fit(vetted_outer_catalog, mspec_prefix+'outer_', notrunc=1)
 
     mspec_dict = {}
 
@@ -166,14 +206,8 @@ def extract_properties_from_dendrogram_catalog(dendrogram, raw_catalog, i=0):
     return output_dict
 
 
-def inspect_noise_in_first_quadrant_smoothed_cube_before_masking(noise_added=0):
-
-    print "loading data..."
-    datacube, header = load_permute_data(data_filename, memmap=False)
-
-    if noise_added > 0:
-
-        datacube += np.random.normal(scale=noise_added, size=datacube.shape)
+def smoothed_cube_rms(datacube):
+    """ Measures the rms noise of a first-quadrant cube after smoothing, at a few emission-free spots. """
 
     velocity_smoothing=4
     spatial_smoothing=2
@@ -207,34 +241,101 @@ def inspect_noise_in_first_quadrant_smoothed_cube_before_masking(noise_added=0):
     return np.mean(smooth_rmss)
 
 
-def multiple_noise_trials_experiment():
+def inspect_noise_in_first_quadrant_smoothed_cube_before_masking(noise_added=0, seed=None):
 
-    # first get the expected noise to use for moment-masking
-    # then do the whole shebang and get your d, catalog
+    print "loading data..."
+    datacube, header = load_permute_data(data_filename, memmap=False)
+
+    if noise_added > 0:
 
-    noise_levels = [0.045, 0.09, 0.18, 0.27, 0.36]
+        if seed is None:
+            seed = new_seed()
+        print "adding noise to data (seed {0})...".format(seed)
 
-    n_times_per_noise_level = 5
+        datacube = add_noise(np.asarray(datacube, dtype=np.float32), noise_added, seed)
 
-    output_dict = {}
+    return smoothed_cube_rms(datacube)
 
-    for i, noise_level in enumerate(noise_levels):
 
-        smoothed_rms_noise = inspect_noise_in_first_quadrant_smoothed_cube_before_masking(noise_added=noise_level)
+noise_trial_result_names = ['smoothed_rms_noise', 'n_clouds', 'total_mass',
+                            'inner_larson_A', 'inner_larson_beta', 'outer_larson_A', 'outer_larson_beta',
+                            'inner_larson_deming_A', 'inner_larson_deming_beta', 'inner_larson_deming_beta_error',
+                            'outer_larson_deming_A', 'outer_larson_deming_beta', 'outer_larson_deming_beta_error',
+                            'inner_M0', 'inner_N0', 'inner_gamma', 'outer_M0', 'outer_N0', 'outer_gamma']
 
-        for i in range(n_times_per_noise_level):
 
-            d, catalog = compute_noise_added_processed_dendrogram(
-                noise_added=noise_level, smoothed_rms_noise=smoothed_rms_noise)
+def run_noise_trial(data, key, seed):
+    """
+    One noise trial: adds noise to the base cube and measures the clouds that come out.
 
-            extract_result = extract_properties_from_dendrogram_catalog(d, catalog, i)
-            n_clouds, mass = extract_result['n_clouds'], extract_result['total_mass']
+    Parameters
+    ----------
+    data : (np.ndarray, astropy.io.fits.Header)
+        The (shared) base datacube and its header; not modified.
+    key : (float, int)
+        The noise level added (K) and the trial number.
+    seed : int
+        Seeds the noise; `noise_injection.replay_noise` regenerates the
+        trial's cube from the noise level and seed in its output row.
 
-            mass_spectrum_dict = {}
+    Returns
+    -------
+    result : dict
+        Keyed by `noise_trial_result_names`.
 
-            output_dict['{0}:{1}'.format(noise_level, i)] = (i, noise_level, n_clouds, mass, extract_result['larson'], extract_result['mspec'])
+    """
 
-    return output_dict
+    base_cube, header = data
+    noise_level, trial_number = key
+
+    noise_added_cube = noise_added_copy(base_cube, noise_level, seed)
+
+    # the smoothed noise, for moment-masking, is measured on this very cube
+    smoothed_rms_noise = smoothed_cube_rms(noise_added_cube)
+
+    d, catalog = dendrogram_noise_added_cube(noise_added_cube, header, noise_level, 
+                                             smoothed_rms_noise=smoothed_rms_noise)
+    catalog.meta.update(noise_record(noise_level, seed))
+    del noise_added_cube
+
+    extract_result = extract_properties_from_dendrogram_catalog(
+        d, catalog, trial_number, mspec_prefix="{0}_{1}_{2}_".format(noise_level, trial_number, seed))
+
+    result = {'smoothed_rms_noise': smoothed_rms_noise, 
+              'n_clouds': extract_result['n_clouds'],
+              'total_mass': extract_result['total_mass']}
+    result.update(extract_result['larson'])
+    result.update(extract_result['mspec'])
+
+    return result
+
+
+def multiple_noise_trials_experiment(output_filename="noise_trials.txt", noise_levels=(0.045, 0.09, 0.18, 0.27, 0.36),
+                                     n_times_per_noise_level=5, n_processes=None, base_seed=0):
+    """
+    Runs noise trials at each noise level over a process pool.
+
+    The base cube is loaded once and shared between the trials. Each
+    trial's row is written to `output_filename` as soon as it finishes;
+    re-running with the same `output_filename` (e.g. after a crash, or
+    with a larger `n_times_per_noise_level`) only runs the missing trials.
+
+    Returns
+    -------
+    output_table : astropy.table.Table
+        One row per trial, as read by `plot_noise_experiment`.
+
+    """
+
+    print "loading data..."
+    datacube, header = load_permute_data(data_filename, memmap=False)
+    base_cube = shared_array(np.asarray(datacube, dtype=np.float32))
+    del datacube
+
+    trial_keys = [(noise_level, i) for noise_level in noise_levels for i in range(n_times_per_noise_level)]
+
+    return run_trials(run_noise_trial, trial_keys, ['noise_added', 'trial_number'], noise_trial_result_names,
+                      output_filename, data=(base_cube, header), base_seed=base_seed, n_processes=n_processes)
 
 
 def compare_first_quadrant_moment_masking(smoothed_rms_noise):
@@ -251,14 +352,15 @@ def compare_first_quadrant_moment_masking(smoothed_rms_noise):
     return moment_masked_cube, actual_moment_masked_cube
 
 
-reference_cube, reference_header = load_permute_data("DHT08_Quad1_mom.fits", memmap=False)
-
-raw_cube, raw_header = load_permute_data(raw_filename, memmap=False)
-
+def moment_masking_comparison_diagnostic(smoothed_rms_noise=0.05, reference_cube=None, data_cube=None):
 
-def moment_masking_comparison_diagnostic(smoothed_rms_noise=0.05, reference_cube=reference_cube, data_cube=raw_cube):
+    # loaded here rather than at import, so that importing this module is cheap
+    if reference_cube is None:
+        reference_cube, reference_header = load_permute_data("DHT08_Quad1_mom.fits", memmap=False)
+    if data_cube is None:
+        data_cube, raw_header = load_permute_data(raw_filename, memmap=False)
 
-    moment_cube = moment_mask(raw_cube, rms_noise=0.18, smoothed_rms_noise=smoothed_rms_noise, velocity_smoothing=3, spatial_smoothing=2)
+    moment_cube = moment_mask(data_cube, rms_noise=0.18, smoothed_rms_noise=smoothed_rms_noise, velocity_smoothing=3, spatial_smoothing=2)
 
     diff_cube = np.abs(reference_cube - moment_cube)
 
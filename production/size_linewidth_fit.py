@@ -0,0 +1,194 @@
+"""
+Fits the size-linewidth relation, with bootstrap or jackknife uncertainties.
+
+The relation sigma_v = A * R**B is fit as a line in log space,
+
+    log10(sigma_v) = log10(A) + B * log10(R),
+
+by orthogonal (Deming) regression: the fit minimizes the scatter
+perpendicular to the line, with `error_ratio` the ratio of the variance of
+the scatter in log10(sigma_v) to that in log10(R) (1 for plain
+orthogonal regression). That has a closed form in the means, variances
+and covariance of the points, so a resample of the catalog only needs
+its own sums of them: every bootstrap resample is a row of a
+(n_resamples, n_clouds) matrix of how many times each cloud is drawn,
+and all their sums come from a few matrix products at once.
+
+`odr_reference_fit` does the same fit with `scipy.odr`, for checking
+against (see also `catalog_measurement.size_linewidth_slope`, which fits
+the power law itself, in linear space).
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from scipy.odr import RealData, Model, ODR
+
+
+def _log_size_linewidth(size, v_rms):
+    """ log10 of the sizes and linewidths, keeping only clouds where both are positive and finite. """
+
+    size = np.asarray(size, dtype=np.float64)
+    v_rms = np.asarray(v_rms, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        usable = (size > 0) & (v_rms > 0) & np.isfinite(size) & np.isfinite(v_rms)
+
+    return np.log10(size[usable]), np.log10(v_rms[usable])
+
+
+def _deming_fit(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, error_ratio):
+    """
+    The Deming regression line from (arrays of) the sums of the points.
+
+    Returns
+    -------
+    intercept, slope : np.ndarray
+
+    """
+
+    mean_x = sum_x / n
+    mean_y = sum_y / n
+    s_xx = sum_xx / n - mean_x**2
+    s_yy = sum_yy / n - mean_y**2
+    s_xy = sum_xy / n - mean_x * mean_y
+
+    difference = s_yy - error_ratio * s_xx
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (difference + np.sqrt(difference**2 + 4 * error_ratio * s_xy**2)) / (2 * s_xy)
+
+    return mean_y - slope * mean_x, slope
+
+
+def _bootstrap_counts(n_clouds, n_resamples, random_state):
+    """ (n_resamples, n_clouds) matrix of how many times each cloud is drawn, per resample. """
+
+    draws = random_state.randint(0, n_clouds, size=(n_resamples, n_clouds))
+    draws += n_clouds * np.arange(n_resamples)[:, np.newaxis]
+
+    return np.bincount(draws.ravel(), minlength=n_resamples*n_clouds).reshape(n_resamples, n_clouds)
+
+
+def fit_size_linewidth(size, v_rms, n_resamples=1000, method='bootstrap', error_ratio=1,
+                       seed=None, max_elements=2**22):
+    """
+    Fits sigma_v = A * R**B, with uncertainties from resampling the clouds.
+
+    Parameters
+    ----------
+    size, v_rms : array_like
+        Cloud sizes and linewidths. Clouds without a positive, finite
+        value of both are left out.
+    n_resamples : int, optional
+        Bootstrap resamples to draw (ignored for the jackknife, which
+        has one resample per cloud).
+    method : 'bootstrap' or 'jackknife', optional
+    error_ratio : float, optional
+        Variance of the scatter in log10(v_rms) over that in log10(size).
+    seed : int, optional
+        Seeds the bootstrap.
+    max_elements : int, optional
+        Largest (resamples x clouds) count matrix held at once.
+
+    Returns
+    -------
+    fit : dict
+        'A' and 'B', fit to all the clouds; 'samples', the
+        (n_resamples, 2) fitted (A, B) of each resample; 'covariance',
+        the 2x2 covariance matrix of (A, B) from the resamples; and
+        'error_A' and 'error_B', the square roots of its diagonal.
+
+    """
+
+    x, y = _log_size_linewidth(size, v_rms)
+    n = len(x)
+
+    if n < 3:
+        raise ValueError("Need at least 3 clouds to fit the size-linewidth relation.")
+
+    # centering first keeps the variances from cancelling out
+    x0, y0 = x.mean(), y.mean()
+    x = x - x0
+    y = y - y0
+    point_terms = np.array([x, y, x*x, y*y, x*y]).T
+
+    def unshift(intercept, slope):
+        # back from the centered line to sigma_v = A * R**B
+        return 10**(y0 + intercept - slope * x0), slope
+
+    A, B = unshift(*_deming_fit(n, *(list(point_terms.sum(axis=0)) + [error_ratio])))
+
+    if method == 'bootstrap':
+        random_state = np.random.RandomState(seed)
+        resample_sums = []
+        chunk_size = max(max_elements // n, 1)
+        for start in range(0, n_resamples, chunk_size):
+            counts = _bootstrap_counts(n, min(chunk_size, n_resamples - start), random_state)
+            resample_sums.append(np.dot(counts, point_terms))
+        resample_sums = np.vstack(resample_sums)
+        n_per_resample = n
+    elif method == 'jackknife':
+        # leaving out cloud i just takes its terms out of the sums
+        resample_sums = point_terms.sum(axis=0) - point_terms
+        n_per_resample = n - 1
+    else:
+        raise ValueError("`method` must be 'bootstrap' or 'jackknife'")
+
+    samples = np.array(unshift(*_deming_fit(n_per_resample, *(list(resample_sums.T) + [error_ratio])))).T
+
+    covariance = np.cov(samples, rowvar=False)
+    if method == 'jackknife':
+        covariance *= (n - 1)**2 / n
+
+    return {'A': A, 'B': B, 'samples': samples, 'covariance': covariance,
+            'error_A': np.sqrt(covariance[0, 0]), 'error_B': np.sqrt(covariance[1, 1])}
+
+
+def size_linewidth_fits(catalogs, seed=None, **kwargs):
+    """
+    `fit_size_linewidth` for each of several catalogs at once.
+
+    Parameters
+    ----------
+    catalogs : dict
+        Name -> astropy Table with 'size' and 'v_rms' columns, e.g.
+        {'inner': inner_catalog, 'outer': outer_catalog}.
+    seed : int, optional
+        Seeds the bootstrap of every catalog (each its own stream).
+
+    Returns
+    -------
+    fits : dict
+        Name -> the output of `fit_size_linewidth`.
+
+    """
+
+    fits = {}
+
+    for i, name in enumerate(sorted(catalogs)):
+        catalog_seed = None if seed is None else seed + i
+        fits[name] = fit_size_linewidth(catalogs[name]['size'], catalogs[name]['v_rms'],
+                                        seed=catalog_seed, **kwargs)
+
+    return fits
+
+
+def odr_reference_fit(size, v_rms, error_ratio=1):
+    """
+    The fit `fit_size_linewidth` makes, done iteratively with scipy.odr.
+
+    Returns
+    -------
+    A, B : float
+
+    """
+
+    x, y = _log_size_linewidth(size, v_rms)
+
+    data = RealData(x, y, sx=np.ones_like(x), sy=np.sqrt(error_ratio) * np.ones_like(y))
+    line = Model(lambda beta, x: beta[0] + beta[1] * x)
+    output = ODR(data, line, beta0=[0., 0.5]).run()
+
+    return 10**output.beta[0], output.beta[1]
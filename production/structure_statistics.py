@@ -0,0 +1,212 @@
+"""
+Computes per-structure scalars for a whole dendrogram as NumPy arrays.
+
+Looking these up structure-by-structure (`d[i].vmin`, `d[i].get_npix()`)
+costs a Python call per structure and, for subtree quantities, walks each
+structure's pixel lists. Here we gather them for every structure at once
+from a single pass over `d.index_map`.
+
+All arrays are indexed by structure idx, so `array[catalog['_idx']]`
+lines them up with a catalog.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+def structure_parents(d):
+    """ 
+    Returns an array of each structure's parent idx (-1 for the trunk). 
+
+    Only needs `d` to yield its structures and each structure to know 
+    its `idx` and `children`.
+
+    """
+
+    try:
+        structures = list(d._structures_dict.values())
+    except AttributeError:
+        structures = list(d)
+
+    n_structures = max(x.idx for x in structures) + 1 if len(structures) > 0 else 0
+    parents = -np.ones(n_structures, dtype=int)
+
+    for struct in structures:
+        for child in struct.children:
+            parents[child.idx] = struct.idx
+
+    return parents
+
+
+def structure_children(parents):
+    """
+    Inverts `parents` into flat child lists.
+
+    Returns
+    -------
+    children : np.ndarray
+        Every structure with a parent, grouped by parent.
+    first_child : np.ndarray
+        `children[first_child[i]:first_child[i]+n_children[i]]` are the
+        children of structure i.
+    n_children : np.ndarray
+
+    """
+
+    children = np.where(parents > -1)[0]
+    children = children[np.argsort(parents[children], kind='mergesort')]
+
+    n_children = np.bincount(parents[children], minlength=len(parents))
+    first_child = np.concatenate(([0], np.cumsum(n_children)[:-1]))
+
+    return children, first_child, n_children
+
+
+def structure_levels(parents):
+    """
+    Returns each structure's level (0 for the trunk), given `parents`.
+
+    Walks all structures up the tree together, so the Python-level cost
+    scales with the tree's depth rather than its size.
+
+    """
+
+    levels = np.zeros(len(parents), dtype=int)
+    ancestors = parents.copy()
+
+    while np.any(ancestors > -1):
+        has_ancestor = ancestors > -1
+        levels[has_ancestor] += 1
+        ancestors[has_ancestor] = parents[ancestors[has_ancestor]]
+
+    return levels
+
+
+def accumulate_over_subtrees(quantity, parents, levels=None, ufunc=np.add):
+    """
+    Reduces `quantity` over each structure and all of its descendants.
+
+    Parameters
+    ----------
+    quantity : np.ndarray
+        One value (or row of values) per structure, indexed by idx.
+    parents : np.ndarray
+        Output of `structure_parents`.
+    levels : np.ndarray, optional
+        Output of `structure_levels`; computed if not given.
+    ufunc : np.ufunc, optional
+        How to combine a child's value into its parent's:
+        np.add for totals, np.minimum / np.maximum for extremes.
+
+    Returns
+    -------
+    subtree_quantity : np.ndarray
+
+    """
+
+    if levels is None:
+        levels = structure_levels(parents)
+
+    subtree_quantity = np.array(quantity, copy=True)
+
+    # deepest structures first, so each child is complete before it is
+    # folded into its parent
+    for level in range(levels.max() if len(levels) else 0, 0, -1):
+        at_level = np.where(levels == level)[0]
+        ufunc.at(subtree_quantity, parents[at_level], subtree_quantity[at_level])
+
+    return subtree_quantity
+
+
+def structure_scalars(d):
+    """
+    Extracts an array of scalars per structure property, for every structure in `d`.
+
+    This needs one loop over the structures (to read off the tree) and one
+    scan of `d.index_map`; subtree quantities are then built up level by
+    level from the deepest structures to the trunk.
+
+    Parameters
+    ----------
+    d : astrodendro.dendrogram.Dendrogram
+
+    Returns
+    -------
+    scalars : dict of np.ndarray
+        Keyed by:
+        'parent' : idx of the parent structure, or -1
+        'level' : as `Structure.level`
+        'n_descendants' : as `len(Structure.descendants)`
+        'is_leaf' : as `Structure.is_leaf`
+        'fractional_gain' : n_descendants over the parent's n_descendants
+            (NaN in the trunk)
+        'npix_self' : as `Structure.get_npix(subtree=False)`
+        'npix' : as `Structure.get_npix()`, i.e. including the subtree
+        'vmin' : as `Structure.vmin`
+        'vmax' : as `Structure.vmax`
+        'bbox_min', 'bbox_max' : (n_structures, ndim) arrays bounding the
+            pixel indices of each structure and its subtree
+        'on_edge' : whether the bounding box touches an edge of the data
+
+    """
+
+    parents = structure_parents(d)
+    levels = structure_levels(parents)
+    n_structures = len(parents)
+    shape = d.index_map.shape
+
+    # one scan of the index map: group every assigned pixel by structure
+    flat_index_map = d.index_map.ravel()
+    assigned = np.where(flat_index_map > -1)[0]
+    pixel_idx = flat_index_map[assigned]
+    order = np.argsort(pixel_idx, kind='mergesort')
+
+    pixel_idx = pixel_idx[order]
+    assigned = assigned[order]
+    pixel_values = np.asarray(d.data).ravel()[assigned]
+
+    npix_self = np.bincount(pixel_idx, minlength=n_structures)
+    present = npix_self > 0
+    starts = np.concatenate(([0], np.cumsum(npix_self)[:-1]))[present]
+
+    vmin = np.full(n_structures, np.nan)
+    vmax = np.full(n_structures, np.nan)
+    # structures without pixels of their own (there are none in a freshly
+    # computed dendrogram) get an empty box that any child overrides
+    bbox_min = np.tile(np.array(shape), (n_structures, 1))
+    bbox_max = -np.ones((n_structures, len(shape)), dtype=int)
+
+    if len(pixel_values) > 0:
+        vmin[present] = np.minimum.reduceat(pixel_values, starts)
+        vmax[present] = np.maximum.reduceat(pixel_values, starts)
+
+        for axis, coordinates in enumerate(np.unravel_index(assigned, shape)):
+            bbox_min[present, axis] = np.minimum.reduceat(coordinates, starts)
+            bbox_max[present, axis] = np.maximum.reduceat(coordinates, starts)
+
+    bbox_min = accumulate_over_subtrees(bbox_min, parents, levels, ufunc=np.minimum)
+    bbox_max = accumulate_over_subtrees(bbox_max, parents, levels, ufunc=np.maximum)
+
+    n_descendants = accumulate_over_subtrees(np.ones(n_structures, dtype=int), parents, levels) - 1
+
+    fractional_gain = np.full(n_structures, np.nan)
+    has_parent = parents > -1
+    fractional_gain[has_parent] = n_descendants[has_parent] / n_descendants[parents[has_parent]]
+
+    scalars = {}
+    scalars['parent'] = parents
+    scalars['level'] = levels
+    scalars['n_descendants'] = n_descendants
+    scalars['is_leaf'] = np.bincount(parents[has_parent], minlength=n_structures) == 0
+    scalars['fractional_gain'] = fractional_gain
+    scalars['npix_self'] = npix_self
+    scalars['npix'] = accumulate_over_subtrees(npix_self, parents, levels)
+    scalars['vmin'] = vmin
+    scalars['vmax'] = vmax
+    scalars['bbox_min'] = bbox_min
+    scalars['bbox_max'] = bbox_max
+    scalars['on_edge'] = np.any((bbox_min == 0) | (bbox_max == np.array(shape) - 1), axis=1)
+
+    return scalars
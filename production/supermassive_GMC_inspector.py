@@ -11,7 +11,6 @@ from __future__ import division
 import os.path
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 from dendrogal.production.cloud_catalog_combiner import (extract_and_combine_catalogs, 
     export_firstquad_catalog, export_fourthquad_catalog, export_secondquad_catalog, 
@@ -21,7 +20,7 @@ from dendrogal.production.cloud_extractor_q2 import d as quad2_d
 from dendrogal.production.cloud_extractor_q3 import d as quad3_d
 from dendrogal.production.cloud_extractor_carina import d as carina_d
 from dendrogal.production.cloud_extractor_q4 import d as quad4_d
-from dendrogal.production.map_dendrogram_thumbnail_figure import make_thumbnail_dendro_figure
+from dendrogal.production.batch_thumbnails import render_thumbnails
 
 super_directory = os.path.expanduser("~/Dropbox/Grad School/Research/Milkyway/supermassive3/")
 massive_directory = os.path.expanduser("~/Dropbox/Grad School/Research/Milkyway/massive3/")
@@ -52,42 +51,33 @@ survey_cat_map = {8. : cat1,
                   36. : cat4}
 
 
-for row in supermassive_cat:
-
-    idx = row['_idx']
-    d = survey_d_map[row['survey']]
-    cat = survey_cat_map[row['survey']]
-
-    fig = make_thumbnail_dendro_figure(d, cat, idx)
-    catalog_properties = """
+def supermassive_annotation(row):
+    return """
     D: {0} +{1} -{2} kpc
     KDA: {5}
     p_near/far: {6:.3f} _ {7:.3f} 
     M: {3}x10^{4} Msun 
     """.format(row['distance'], row['error_distance_plus'], row['error_distance_minus'], str(row['mass'])[0], 
         int(np.floor(np.log10(row['mass']))), row['KDA_resolution'], row['p_near'], row['p_far'] )
-    fig.text(0.2, -0.15, catalog_properties)
-
-    fig.savefig(super_directory+"{0}.pdf".format(idx), bbox_inches='tight')
-    print idx
-    
-
-for row in massive_cat:
 
-    idx = row['_idx']
-    d = survey_d_map[row['survey']]
-    cat = survey_cat_map[row['survey']]
 
-    fig = make_thumbnail_dendro_figure(d, cat, idx)
-
-    catalog_properties = """
+def massive_annotation(row):
+    return """
     D: {0} +{1} -{2} kpc
     KDA: {5}
     M: {3}x10^{4} Msun 
     """.format(row['distance'], row['error_distance_plus'], row['error_distance_minus'], str(row['mass'])[0], 
         int(np.floor(np.log10(row['mass']))), row['KDA_resolution'] )
-    fig.text(0.2, -0.15, catalog_properties)
 
 
-    fig.savefig(massive_directory+"{0}.pdf".format(idx), bbox_inches='tight')    
+# one batch per survey, each rendered across a process pool
+for catalog, directory, annotation in [(supermassive_cat, super_directory, supermassive_annotation),
+                                       (massive_cat, massive_directory, massive_annotation)]:
+
+    for survey in np.unique(catalog['survey']):
+
+        rows = catalog[catalog['survey'] == survey]
 
+        render_thumbnails(survey_d_map[survey], survey_cat_map[survey], rows['_idx'],
+                          [directory+"{0}.pdf".format(idx) for idx in rows['_idx']],
+                          annotations=[annotation(row) for row in rows])
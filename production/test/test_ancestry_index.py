@@ -0,0 +1,92 @@
+"""
+Tests for ancestry_index.py
+
+should run with py.test
+
+"""
+
+from numpy.testing import assert_equal
+import numpy as np
+
+from astropy.table import Table
+from astrodendro import Dendrogram
+
+from ..ancestry_index import AncestryIndex, ancestry_index
+from ..remove_degenerate_structures import reduce_catalog, selection_from_catalog
+
+def make_test_dendrogram():
+
+    np.random.seed(1)
+    data = np.random.random((6, 8, 12))
+    data[1:4, 2:6, 2:7] += 2
+    data[2:5, 1:3, 6:9] += 1.5
+    data[1:3, 4:7, 9:11] += 1
+
+    return Dendrogram.compute(data, min_value=0.5, min_delta=0.05, min_npix=2)
+
+def brute_force_lca(a, b):
+
+    ancestors_of_a = [a]
+    while ancestors_of_a[-1].parent is not None:
+        ancestors_of_a.append(ancestors_of_a[-1].parent)
+
+    struct = b
+    while struct is not None:
+        if struct in ancestors_of_a:
+            return struct.idx
+        struct = struct.parent
+
+    return -1
+
+def test_ancestry_queries():
+
+    d = make_test_dendrogram()
+    assert len(d) > 10 and len(d.trunk) > 1
+
+    index = AncestryIndex(d.trunk)
+
+    for a in d:
+        descendants = a.descendants
+
+        assert_equal(sorted(index.descendants(a.idx)), sorted(x.idx for x in descendants))
+
+        for b in d:
+            assert_equal(index.is_ancestor(a.idx, b.idx), b in descendants)
+            assert_equal(index.lowest_common_ancestor(a.idx, b.idx), brute_force_lca(a, b))
+
+    # vectorized queries agree with scalar ones
+    all_a, all_b = np.meshgrid(np.arange(len(d)), np.arange(len(d)))
+    lca = index.lowest_common_ancestor(all_a.ravel(), all_b.ravel())
+    assert_equal(lca, [index.lowest_common_ancestor(a, b) for a, b in zip(all_a.ravel(), all_b.ravel())])
+
+def test_principal_branches():
+
+    d = make_test_dendrogram()
+
+    np.random.seed(2)
+    for trial in range(20):
+        selection = np.random.choice(len(d), size=8)
+
+        # brute force: keep those with no selected ancestor
+        expected = [idx for idx in selection
+                    if not any(d[idx] in d[other].descendants for other in selection)]
+        # duplicates survive only once
+        expected = [x for i, x in enumerate(expected) if x not in expected[:i]]
+
+        catalog = Table()
+        catalog['_idx'] = selection
+
+        assert_equal(sorted(set(ancestry_index(d).principal_branches(selection))), sorted(expected))
+        assert_equal(sorted(reduce_catalog(d, catalog)['_idx']),
+                     sorted(x for x in selection if x in expected))
+
+def test_selection_from_catalog_subtree():
+
+    d = make_test_dendrogram()
+
+    catalog = Table()
+    catalog['_idx'] = [x.idx for x in d.trunk]
+
+    selection = selection_from_catalog(d, catalog, subtree=True)
+
+    assert_equal(sorted(x.idx for x in selection), range(len(d)))
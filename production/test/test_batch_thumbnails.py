@@ -0,0 +1,71 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import astropy.wcs
+import astropy.table
+import astrodendro
+
+from ..batch_thumbnails import ThumbnailTemplate, render_thumbnails
+
+
+def make_test_dendrogram_and_catalog():
+
+    np.random.seed(0)
+    datacube = np.random.random((30, 20, 40))
+    v, b, l = np.indices(datacube.shape)
+    for v0, b0, l0 in [(10, 8, 10), (20, 12, 30)]:
+        datacube += 5 * np.exp(-((v-v0)**2/8 + (b-b0)**2/4 + (l-l0)**2/8))
+
+    wcs = astropy.wcs.WCS(naxis=3)
+    wcs.wcs.ctype = ['GLON-CAR', 'GLAT-CAR', 'VOPT']
+    wcs.wcs.cdelt = [0.125, 0.125, 1.3]
+    wcs.wcs.crpix = [1, 10, 15]
+    wcs.wcs.crval = [30, 0, 50]
+    wcs.wcs.cunit = ['deg', 'deg', 'km/s']
+
+    d = astrodendro.Dendrogram.compute(datacube, min_value=2, min_delta=1, min_npix=10, wcs=wcs)
+
+    idx = [x.idx for x in d.trunk]
+    world = wcs.wcs_pix2world([[d[i].indices()[2][0], d[i].indices()[1][0], d[i].indices()[0][0]] for i in idx], 0)
+    catalog = astropy.table.Table(
+        [idx, world[:, 0], world[:, 1], world[:, 2], [2., 2.], [0.3, 0.3],
+         [0.4, 0.4], [0.2, 0.2], [30., 0.]],
+        names=['_idx', 'x_cen', 'y_cen', 'v_cen', 'v_rms', 'radius',
+               'major_sigma', 'minor_sigma', 'position_angle'])
+
+    return d, catalog
+
+
+def test_render_thumbnails(tmpdir):
+
+    d, catalog = make_test_dendrogram_and_catalog()
+    filenames = [str(tmpdir.join("{0}.png".format(idx))) for idx in catalog['_idx']]
+
+    output = render_thumbnails(d, catalog, catalog['_idx'], filenames,
+                               annotations=["first", "second"], n_processes=2, verbose=False)
+
+    assert_equal(output, filenames)
+    for filename in filenames:
+        assert tmpdir.join(filename.split('/')[-1]).size() > 0
+
+
+def test_template_is_restored_after_each_cloud(tmpdir):
+
+    d, catalog = make_test_dendrogram_and_catalog()
+    template = ThumbnailTemplate(d, catalog)
+
+    n_artists = [len(ax.artists) + len(ax.collections) for ax in template.fig.axes]
+    n_texts = len(template.fig.texts)
+
+    for idx in catalog['_idx']:
+        template.render(idx, str(tmpdir.join("{0}.png".format(idx))), annotation="M")
+
+    assert_equal([len(ax.artists) + len(ax.collections) for ax in template.fig.axes], n_artists)
+    assert_equal(len(template.fig.texts), n_texts)
@@ -13,7 +13,10 @@ import numpy as np
 import astropy.table
 import astropy.units as u
 
-from ..calculate_distance_dependent_properties import compute_galactic_coordinates, assign_size_with_uncertainties
+from ..calculate_distance_dependent_properties import (compute_galactic_coordinates, assign_size_with_uncertainties,
+                                                       assign_mass_with_uncertainties, assign_alpha_with_uncertainties,
+                                                       assign_pressure_with_uncertainties, assign_properties,
+                                                       assign_nearfar_properties, raw_distance_dependent_properties)
 
 def test_compute_galactic_coordinates():
 
@@ -76,3 +79,99 @@ def test_size():
     assert_allclose(catalog['error_size_plus'][0], expected_error_size_plus)
     assert_allclose(catalog['error_size_minus'][0], expected_error_size_minus)
 
+
+def test_assign_nearfar_properties():
+    """
+    Should agree with `assign_properties` run at each of the three distances.
+
+    """
+
+    catalog = astropy.table.Table()
+
+    catalog['distance'] = u.Quantity([np.nan, 3, 5], unit=u.kpc)
+    catalog['error_distance_plus'] = u.Quantity([np.nan, 0.3, 0.5], unit=u.kpc)
+    catalog['error_distance_minus'] = u.Quantity([np.nan, 0.2, 0.4], unit=u.kpc)
+    catalog['near_distance'] = u.Quantity([2, 3, 5], unit=u.kpc)
+    catalog['error_near_distance_plus'] = u.Quantity([0.1, 0.3, 0.5], unit=u.kpc)
+    catalog['error_near_distance_minus'] = u.Quantity([0.2, 0.2, 0.4], unit=u.kpc)
+    catalog['far_distance'] = u.Quantity([10, 3, 5], unit=u.kpc)
+    catalog['error_far_distance_plus'] = u.Quantity([0.6, 0.3, 0.5], unit=u.kpc)
+    catalog['error_far_distance_minus'] = u.Quantity([0.7, 0.2, 0.4], unit=u.kpc)
+
+    catalog['flux_true'] = [1, 2, 3]
+    catalog['flux_true'].unit = 'K km sr / s'
+    catalog['radius'] = [0.015, 0.003, 0.1]
+    catalog['radius'].unit = u.deg
+    catalog['v_rms'] = [1, 2, 5]
+    catalog['v_rms'].unit = u.km/u.s
+    catalog['x_cen'] = [30, 45, 320]
+    catalog['y_cen'] = [0, -0.5, 1]
+
+    expected = {}
+    for prefix in ['', 'near_', 'far_']:
+        expected_catalog = catalog.copy(copy_data=True)
+        for column in ['distance', 'error_distance_plus', 'error_distance_minus']:
+            expected_catalog[column] = catalog[column.replace('distance', prefix+'distance')]
+        assign_properties(expected_catalog)
+        expected[prefix] = expected_catalog
+
+    assign_nearfar_properties(catalog, nearfar_columns=None)
+
+    assert_equal(catalog.colnames[:len(expected[''].colnames)], expected[''].colnames)
+
+    for prefix, expected_catalog in expected.items():
+        for name in ['size', 'error_size_plus', 'mass', 'error_mass_minus', 'virial_alpha',
+                     'error_virial_alpha_plus', 'pressure', 'error_pressure_minus',
+                     'x_sol', 'z_sol', 'y_gal', 'z_gal', 'R_gal', 'phi_gal']:
+            column = catalog[prefix + name]
+            assert column.unit == expected_catalog[name].unit
+            assert_allclose(column, expected_catalog[name], rtol=1e-12)
+
+
+def test_assign_properties_matches_quantity_calculation():
+    """
+    The raw-float engine should reproduce the `u.Quantity` calculations.
+
+    """
+
+    np.random.seed(0)
+    n = 50
+
+    catalog = astropy.table.Table()
+    catalog['distance'] = u.Quantity(np.random.uniform(0.5, 15, n), unit=u.kpc)
+    catalog['error_distance_plus'] = u.Quantity(np.random.uniform(0.1, 1, n), unit=u.kpc)
+    catalog['error_distance_minus'] = u.Quantity(np.random.uniform(0.1, 1, n), unit=u.kpc)
+    catalog['flux_true'] = np.random.uniform(0.01, 10, n)
+    catalog['flux_true'].unit = 'K km sr / s'
+    catalog['radius'] = np.random.uniform(0.01, 0.5, n)
+    catalog['radius'].unit = u.deg
+    catalog['v_rms'] = np.random.uniform(0.5, 10, n)
+    catalog['v_rms'].unit = u.km/u.s
+    catalog['x_cen'] = np.random.uniform(0, 360, n)
+    catalog['y_cen'] = np.random.uniform(-1, 1, n)
+
+    expected = catalog.copy(copy_data=True)
+    assign_size_with_uncertainties(expected)
+    assign_mass_with_uncertainties(expected)
+    assign_alpha_with_uncertainties(expected)
+    assign_pressure_with_uncertainties(expected)
+
+    lrad = (catalog['x_cen'] * u.deg).to(u.rad).value
+    brad = (catalog['y_cen'] * u.deg).to(u.rad).value
+    solar_cart, gal_cart, gal_cyl = compute_galactic_coordinates(lrad, brad, u.Quantity(catalog['distance']))
+    for name, value in zip(['x_sol', 'y_sol', 'z_sol', 'x_gal', 'y_gal', 'z_gal'], solar_cart + gal_cart):
+        expected[name] = value.to(u.kpc)
+    expected['R_gal'] = gal_cyl[0].to(u.kpc)
+    expected['phi_gal'] = gal_cyl[1].to(u.deg)
+
+    assign_properties(catalog)
+
+    assert_equal(catalog.colnames, expected.colnames)
+    for name in expected.colnames:
+        assert catalog[name].unit == expected[name].unit
+        assert_allclose(catalog[name], expected[name], rtol=1e-12)
+
+    # and the engine broadcasts over stacks of distances
+    stacked = raw_distance_dependent_properties(1.0, 1.0, 1.0, 30, 0, np.array([[1.], [2.]]), 0.1, 0.1)
+    assert_equal(stacked['mass'].shape, (2, 1))
+    assert_allclose(stacked['mass'][1] / stacked['mass'][0], 4)
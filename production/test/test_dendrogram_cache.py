@@ -0,0 +1,141 @@
+"""
+Tests for dendrogram_cache.py
+
+should run with py.test
+
+"""
+
+import os
+import shutil
+import tempfile
+
+from numpy.testing import assert_equal, assert_array_equal, assert_raises
+import numpy as np
+
+from astropy.table import Table
+from astropy.io.fits import Header, writeto
+import astropy.units as u
+from astrodendro import Dendrogram
+
+from ..dendrogram_cache import DendrogramCache, cache_key, file_digest
+
+def make_silly_output():
+
+    data = np.zeros((3,3,3))
+    data[1,1,1] = 1
+    d = Dendrogram.compute(data, min_value=0)
+
+    catalog = Table()
+    catalog['test_column'] = np.zeros(10)
+
+    header = Header()
+    header['ctype1'] = 'GLON-CAR'
+    header['ctype2'] = 'GLAT-CAR'
+    header['ctype3'] = 'VELO-LSR'
+
+    metadata = {}
+    metadata['data_unit'] = u.K
+
+    return d, catalog, header, metadata
+
+def test_cache_key():
+
+    tempdir = tempfile.mkdtemp()
+    filename = os.path.join(tempdir, "cube.fits")
+
+    try:
+        # 1. no filename gives an error
+        assert_raises(ValueError, cache_key, None)
+
+        writeto(filename, np.zeros((4,5,6)))
+        key_1 = cache_key(filename, min_value=1, min_delta=2, min_npix=3)
+
+        # 2. keys are deterministic and sensitive to every parameter
+        assert_equal(cache_key(filename, min_value=1, min_delta=2, min_npix=3), key_1)
+        assert key_1 != cache_key(filename, min_value=1, min_delta=2, min_npix=4)
+        assert key_1 != cache_key(filename, min_value=0.1*3, min_delta=2, min_npix=3)
+        assert (cache_key(filename, min_value=0.1*3, min_delta=2, min_npix=3) !=
+                cache_key(filename, min_value=0.3, min_delta=2, min_npix=3))
+
+        # 3. regenerating the file under the same name changes the key
+        os.remove(filename)
+        writeto(filename, np.ones((4,5,6)))
+        os.utime(filename, (0, 0))
+        assert key_1 != cache_key(filename, min_value=1, min_delta=2, min_npix=3)
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_cache_roundtrip_and_stats():
+
+    tempdir = tempfile.mkdtemp()
+
+    try:
+        cache = DendrogramCache(cache_path=os.path.join(tempdir, "cache"))
+        d, catalog, header, metadata = make_silly_output()
+
+        assert cache.get('abc') is None
+        cache.put('abc', d, catalog, header, metadata)
+
+        d2, catalog2, header2, metadata2 = cache.get('abc')
+
+        assert_equal(d2.index_map, d.index_map)
+        assert_array_equal(catalog2, catalog)
+        assert_equal(header2['ctype3'], header['ctype3'])
+        assert_equal(metadata2, metadata)
+
+        stats = cache.stats()
+        assert_equal(stats['hits'], 1)
+        assert_equal(stats['misses'], 1)
+        assert_equal(stats['entries'], 1)
+
+        # no temporary directories are left behind
+        assert_equal(os.listdir(cache.cache_path), ['abc'])
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_cache_integrity_check():
+
+    tempdir = tempfile.mkdtemp()
+
+    try:
+        cache = DendrogramCache(cache_path=os.path.join(tempdir, "cache"))
+        cache.put('abc', *make_silly_output())
+
+        # corrupt the stored catalog
+        with open(os.path.join(cache.entry_path('abc'), "catalog.fits"), 'ab') as f:
+            f.write(b'garbage')
+
+        assert cache.get('abc') is None
+        assert_equal(cache.stats()['entries'], 0)
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_cache_lru_eviction():
+
+    tempdir = tempfile.mkdtemp()
+
+    try:
+        cache = DendrogramCache(cache_path=os.path.join(tempdir, "cache"))
+        output = make_silly_output()
+
+        cache.put('first', *output)
+        entry_size = cache.stats()['bytes']
+        cache.max_bytes = 2.5 * entry_size
+
+        cache.put('second', *output)
+        os.utime(os.path.join(cache.entry_path('first'), "manifest.p"), (1, 1))
+        os.utime(os.path.join(cache.entry_path('second'), "manifest.p"), (2, 2))
+
+        # touching 'first' makes 'second' the least-recently-used entry
+        cache.get('first')
+        cache.put('third', *output)
+
+        assert_equal(sorted(cache.entries()), ['first', 'third'])
+        assert_equal(cache.stats()['evictions'], 1)
+
+        # an entry bigger than the whole cache is still kept
+        cache.max_bytes = 0
+        cache.put('fourth', *output)
+        assert_equal(cache.entries(), ['fourth'])
+    finally:
+        shutil.rmtree(tempdir)
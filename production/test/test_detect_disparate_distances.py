@@ -0,0 +1,45 @@
+"""
+Tests for detect_disparate_distances.py
+
+should run with py.test
+
+"""
+
+from numpy.testing import assert_equal, assert_raises
+import numpy as np
+
+from astropy.table import Table
+from astrodendro import Dendrogram
+
+from ..detect_disparate_distances import detect_disparate_distances
+
+def test_detect_disparate_distances():
+
+    np.random.seed(4)
+    data = np.random.random((6, 8, 12))
+    data[1:4, 2:6, 2:7] += 2
+    data[2:5, 1:3, 6:9] += 1.5
+    d = Dendrogram.compute(data, min_value=0.5, min_delta=0.05, min_npix=2)
+
+    catalog = Table()
+    catalog['_idx'] = np.arange(len(d))
+    catalog['n_descendants'] = [len(d[i].descendants) for i in range(len(d))]
+
+    assert_raises(ValueError, detect_disparate_distances, d, catalog)
+
+    # mostly similar distances, with a few outliers
+    distance = np.random.uniform(2, 3, len(d))
+    distance[np.random.choice(len(d), 3, replace=False)] = 8
+    catalog['distance'] = distance
+
+    disparate = detect_disparate_distances(d, catalog)
+
+    def fails_itself(struct):
+        distances = [distance[x.idx] for x in struct.descendants]
+        return len(distances) > 0 and max(distances) >= 2*min(distances)
+
+    for struct in d:
+        expected_fail = fails_itself(struct) or any(fails_itself(x) for x in struct.descendants)
+        assert_equal(disparate[struct.idx], 0 if expected_fail else 1)
+
+    assert 0 < np.sum(disparate) < len(d)
@@ -16,6 +16,7 @@ import astropy.table
 from ..distance_disambiguate import (p_given_sigmas, p_from_size_linewidth,
                                      p_from_latitude, calculate_p_nearfar,
                                      distance_disambiguator)
+from ..calculate_distance_dependent_properties import assign_properties
 
 
 def test_p_given_sigmas():
@@ -80,11 +81,7 @@ def test_p_from_latitude():
     assert p_near > p_far
 
 
-def test_distance_disambiguator():
-    """
-    Makes sure that we can determine near/far/ambiguous properly.
-
-    """
+def make_mock_catalog():
 
     mock_catalog = astropy.table.Table()
 
@@ -114,6 +111,47 @@ def test_distance_disambiguator():
     mock_catalog['x_cen'] = [30]*3
     mock_catalog['y_cen'] = [0, 0, 1]
 
+    return mock_catalog
+
+
+def test_calculate_p_nearfar_matches_assign_properties():
+    """
+    The direct size & z_gal kernel should agree with running
+    `assign_properties` at each distance.
+
+    """
+
+    mock_catalog = make_mock_catalog()
+    mock_catalog['x_cen'] = [30, 45, -20]
+    mock_catalog['y_cen'] = [0.3, -0.5, 1]
+
+    near_output, far_output = calculate_p_nearfar(mock_catalog, return_intermediates=True,
+                                                  A_coefficient=1, B_coefficient=1)
+
+    for output, column in [(near_output, 'near_distance'), (far_output, 'far_distance')]:
+        catalog = mock_catalog.copy(copy_data=True)
+        catalog['distance'] = mock_catalog[column]
+        assign_properties(catalog)
+
+        properties, p_larson, p_latitude, p = output
+
+        assert_allclose(properties['size'], catalog['size'].to(u.pc).value)
+        assert_allclose(properties['z_gal'], catalog['z_gal'].to(u.pc).value)
+        assert_allclose(p_larson, p_from_size_linewidth(catalog['size'], catalog['v_rms'], 1, 1, 0.5))
+        assert_allclose(p, p_larson * p_from_latitude(catalog['z_gal'].to(u.pc)))
+
+    # the catalog itself is left alone
+    assert 'size' not in mock_catalog.colnames
+
+
+def test_distance_disambiguator():
+    """
+    Makes sure that we can determine near/far/ambiguous properly.
+
+    """
+
+    mock_catalog = make_mock_catalog()
+
     A_coefficient=1
     B_coefficient=1
 
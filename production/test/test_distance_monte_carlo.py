@@ -0,0 +1,127 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+
+import astropy.table
+import astropy.units as u
+
+from ..calculate_distance_dependent_properties import assign_properties, raw_distance_dependent_properties
+from ..distance_monte_carlo import (sample_split_normal, monte_carlo_properties, assign_monte_carlo_properties,
+                                    _cloud_distances, _sample_chunk, _raw_catalog_columns)
+
+
+def make_catalog(error=0.5):
+
+    catalog = astropy.table.Table()
+
+    catalog['distance'] = u.Quantity([2, 5, np.nan, 8], unit=u.kpc)
+    catalog['error_distance_plus'] = u.Quantity([error]*4, unit=u.kpc)
+    catalog['error_distance_minus'] = u.Quantity([error]*4, unit=u.kpc)
+    catalog['near_distance'] = u.Quantity([2, 5, 3, 8], unit=u.kpc)
+    catalog['far_distance'] = u.Quantity([12, 9, 11, 8], unit=u.kpc)
+    for prefix in ['near', 'far']:
+        for sign in ['plus', 'minus']:
+            catalog['error_{0}_distance_{1}'.format(prefix, sign)] = u.Quantity([error]*4, unit=u.kpc)
+    catalog['p_near'] = [1, 0, 0.5, 0]
+    catalog['p_far'] = [0, 1, 0.5, 0]
+
+    catalog['flux_true'] = [1, 2, 3, 4]
+    catalog['flux_true'].unit = 'K km sr / s'
+    catalog['radius'] = [0.015, 0.003, 0.1, 0.05]
+    catalog['radius'].unit = u.deg
+    catalog['v_rms'] = [1, 2, 5, 3]
+    catalog['v_rms'].unit = u.km/u.s
+    catalog['x_cen'] = [30, 45, 320, 300]
+    catalog['y_cen'] = [0, -0.5, 1, 0.2]
+
+    return catalog
+
+
+def test_sample_split_normal():
+
+    samples = sample_split_normal(1.0, 2.0, 0.5, np.random.RandomState(0), (200000,))
+
+    # the normal below 1 - 2 sigma is cut away, and the rest rescaled
+    truncated = 0.02275
+    assert samples.min() > 0
+    assert_allclose(np.mean(samples < 1), (0.5 - truncated) / (1 - truncated), atol=0.005)
+    assert_allclose(np.mean(samples < 0.5), (0.15866 - truncated) / (1 - truncated), atol=0.005)
+    assert_allclose(np.mean(samples > 3), 0.15866 / (1 - truncated), atol=0.005)
+
+
+def test_zero_errors_reproduce_assign_properties():
+
+    catalog = make_catalog(error=0)
+    expected = catalog.copy(copy_data=True)
+    assign_properties(expected)
+
+    percentile_values = monte_carlo_properties(catalog, n_samples=10, properties=['mass', 'z_gal', 'R_gal'])
+
+    for name in ['mass', 'z_gal', 'R_gal']:
+        assert percentile_values[name].unit == expected[name].unit
+        for values in percentile_values[name]:
+            assert_allclose(values, expected[name])
+
+
+def test_monotonic_shortcut_matches_sampling():
+    """ Percentiles taken through the distance percentiles should match those of the samples. """
+
+    catalog = make_catalog()
+    catalog['distance'][2] = 3
+
+    n_samples = 2000
+    percentiles = [5, 16, 50, 84, 95]
+    names = ['size', 'mass', 'virial_alpha', 'pressure', 'x_gal', 'z_gal']
+
+    percentile_values = monte_carlo_properties(catalog, n_samples=n_samples, percentiles=percentiles,
+                                               properties=names, seed=3)
+
+    distance = _sample_chunk(_cloud_distances(catalog, False), slice(0, len(catalog)),
+                             n_samples, np.random.RandomState(3))
+    sampled = raw_distance_dependent_properties(distance=distance, error_distance_plus=None,
+                                                error_distance_minus=None,
+                                                **_raw_catalog_columns(catalog, 'flux_true'))
+
+    for name in names:
+        assert_allclose(percentile_values[name].value, np.percentile(sampled[name], percentiles, axis=0),
+                        rtol=1e-4)
+
+
+def test_nearfar_weighting():
+
+    catalog = make_catalog(error=0)
+
+    percentile_values = monte_carlo_properties(catalog, n_samples=4000, percentiles=[25, 75],
+                                               properties=['size'], nearfar=True, seed=0)
+    size = percentile_values['size'].to(u.pc).value
+
+    near = catalog.copy(copy_data=True)
+    near['distance'] = catalog['near_distance']
+    assign_properties(near)
+    far = catalog.copy(copy_data=True)
+    far['distance'] = catalog['far_distance']
+    assign_properties(far)
+
+    # all near; all far; half and half; one distance, so no mixture
+    assert_allclose(size[:, 0], near['size'][0])
+    assert_allclose(size[:, 1], far['size'][1])
+    assert_allclose(size[:, 2], [near['size'][2], far['size'][2]])
+    assert_allclose(size[:, 3], near['size'][3])
+
+
+def test_assign_monte_carlo_properties():
+
+    catalog = make_catalog()
+
+    assign_monte_carlo_properties(catalog, n_samples=100, seed=0, max_elements=150)
+
+    assert_equal(catalog['mass_p16'].unit, u.solMass)
+    assert np.all(catalog['mass_p16'][[0, 1, 3]] < catalog['mass_p50'][[0, 1, 3]])
+    assert np.all(catalog['virial_alpha_p16'][[0, 1, 3]] < catalog['virial_alpha_p84'][[0, 1, 3]])
+    assert np.isnan(catalog['mass_p50'][2])
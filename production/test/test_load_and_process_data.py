@@ -63,3 +63,72 @@ def test_permute_data_to_standard_order():
 
 
 
+def test_cube_view():
+
+    from ..load_and_process_data import load_cube_view
+
+    datacube, header = permute_data_to_standard_order(*load_data("test_data.fits", data_path="production/test/"))
+
+    # chunks of 2 planes along latitude, the file's first axis, so 2 chunks; room to cache 1
+    view = load_cube_view("test_data.fits", data_path="production/test/", chunk_size=2, 
+                          cache_bytes=6*2*5*8, verbose=False)
+
+    assert_equal(view.shape, datacube.shape)
+    assert_equal(view.header, header)
+    assert_equal(view.chunk_axis, 1)
+
+    # each chunk is a block of the file, permuted
+    assert_equal(view.chunk(1), view._datacube[2:4].transpose(2, 0, 1))
+
+    keys = [0, -1, 5, (2, 1), (3, slice(None), 2), slice(None), slice(1, 6), slice(None, None, -2), 
+            (slice(2, 5), 0), (slice(None), slice(1, 3), slice(2, None)), (slice(None), -1),
+            (4, slice(None, None, -1), 1), (slice(None), slice(0, 4, 3))]
+
+    for key in keys:
+        assert_equal(view[key], datacube[key])
+
+    assert len(view._cache) == 1
+    assert_equal(view.n_full_copies, 0)
+
+    for axis in range(3):
+        assert_equal(view.reduce(np.nansum, axis=axis), np.nansum(datacube, axis=axis))
+        assert_equal(view.reduce(np.nanmax, axis=axis), np.nanmax(datacube, axis=axis))
+    assert_equal(view.n_full_copies, 0)
+
+    # chunks can also be cut along another axis
+    velocity_view = load_cube_view("test_data.fits", data_path="production/test/", chunk_size=4,
+                                   chunk_axis=0, verbose=False)
+    for key in keys:
+        assert_equal(velocity_view[key], datacube[key])
+    assert_equal(velocity_view.reduce(np.nansum, axis=2), np.nansum(datacube, axis=2))
+
+    # things that need the whole cube get (and count) a full copy
+    assert_equal(np.asarray(view), datacube)
+    assert_equal(view.n_full_copies, 1)
+    assert np.asarray(view).flags['C_CONTIGUOUS']
+
+
+def test_cube_view_key_patterns():
+
+    import itertools
+
+    from ..load_and_process_data import CubeView
+
+    datacube = np.arange(4*6*8.).reshape(4, 6, 8)
+    header = load_data("test_data.fits", data_path="production/test/")[1]
+    permute_tuple = (2, 0, 1)
+    permuted = datacube.transpose(permute_tuple)
+
+    indices = [0, -1, 3, slice(None), slice(0, 4), slice(1, 5), slice(None, None, -2), slice(5, 0, -3)]
+
+    for chunk_axis in range(3):
+        view = CubeView(datacube, header, permute_tuple, chunk_size=2, chunk_axis=chunk_axis, verbose=False)
+
+        for n_indices in range(1, 4):
+            for key in itertools.product(indices, repeat=n_indices):
+                # skip ints out of range for a short axis
+                if any(isinstance(x, int) and x >= permuted.shape[i] for i, x in enumerate(key)):
+                    continue
+                assert_equal(view[key], permuted[key])
+
+        assert_equal(view.n_full_copies, 0)
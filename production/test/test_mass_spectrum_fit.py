@@ -0,0 +1,72 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+import pytest
+
+from ..mass_spectrum_fit import fit_mass_spectrum
+
+
+def sample_truncated_powerlaw(n, min_mass, M_0, gamma, seed):
+    """ Draws masses with dN/dM ~ M**gamma between min_mass and M_0. """
+
+    a = gamma + 1
+    u = np.random.RandomState(seed).rand(n)
+
+    return (min_mass**a + u * (M_0**a - min_mass**a))**(1/a)
+
+
+def test_fit_truncated_powerlaw():
+
+    mass = sample_truncated_powerlaw(2000, 1e5, 5e6, -1.7, seed=1)
+
+    fit = fit_mass_spectrum(mass, 0.1*mass)
+
+    assert_allclose(fit['gamma'], -1.7, atol=0.1)
+    assert_allclose(fit['M_0'], 5e6, rtol=0.15)
+    assert fit['N_0'] > 0
+
+
+def test_fit_powerlaw():
+
+    mass = sample_truncated_powerlaw(2000, 1e5, 1e12, -2.0, seed=2)
+
+    fit = fit_mass_spectrum(mass, 0.1*mass, truncated=False)
+
+    assert_allclose(fit['gamma'], -2.0, atol=0.1)
+    assert_equal(fit['N_0'], 0)
+
+
+def test_bootstrap_fits_match_individual_fits():
+
+    mass = sample_truncated_powerlaw(200, 1e5, 5e6, -1.7, seed=3)
+    mass_error = 0.2*mass
+
+    fit = fit_mass_spectrum(mass, mass_error, n_bootstrap=5, seed=4)
+    assert_equal(fit['bootstrap'].shape, (5, 3))
+    assert_allclose(fit['error_gamma'], np.std(fit['bootstrap'][:, 2]))
+
+    # the main fit is unaffected by fitting the resamples alongside it
+    assert_equal(fit['gamma'], fit_mass_spectrum(mass, mass_error)['gamma'])
+
+    resamples = np.random.RandomState(4).randint(0, len(mass), size=(5, len(mass)))
+    for resample, (N_0, M_0, gamma) in zip(resamples, fit['bootstrap']):
+        single = fit_mass_spectrum(mass[resample], mass_error[resample])
+        assert_allclose([single['N_0'], single['M_0'], single['gamma']], [N_0, M_0, gamma], rtol=1e-4)
+
+
+def test_too_few_clouds():
+
+    with pytest.raises(ValueError):
+        fit_mass_spectrum([1e5, 2e5], [1e4, 2e4])
+
+
+def test_equal_masses():
+
+    with pytest.raises(ValueError):
+        fit_mass_spectrum([1e5]*5, [1e4]*5)
@@ -0,0 +1,87 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+
+from ..moment_maps import (MomentMaps, clean_map, moment_maps_for, register_moment_maps_path,
+                           cumulative_filenames)
+
+
+def make_test_cube(seed=0):
+
+    np.random.seed(seed)
+    datacube = np.random.randn(20, 7, 9).astype(np.float32)
+    datacube[np.random.rand(*datacube.shape) < 0.1] = np.nan
+
+    return datacube
+
+
+def test_moment_maps_match_nansum():
+
+    datacube = make_test_cube()
+    datacube[3, 2, 4] = np.inf
+
+    moment_maps = MomentMaps.compute(datacube, slab_size=6)
+
+    for v1, v2 in [(0, 20), (0, 4), (3, 17), (5, 5), (-2, 30)]:
+        expected = clean_map(np.nansum(datacube[max(v1, 0):v2], axis=0))
+        assert_allclose(moment_maps.lb((v1, v2)), expected, atol=1e-5)
+
+    for b1, b2 in [(0, 7), (2, 3), (1, 6)]:
+        expected = clean_map(np.nansum(datacube[:, b1:b2], axis=1))
+        assert_allclose(moment_maps.lv((b1, b2)), expected, atol=1e-5)
+
+    assert_allclose(moment_maps.lb(), clean_map(np.nansum(datacube, axis=0)), atol=1e-5)
+    assert_equal(moment_maps.lb()[2, 4], 0)
+
+    # cropped maps zero the infinite pixel in the window's coordinates
+    window = (slice(1, 5), slice(3, None))
+    assert_allclose(moment_maps.lb((2, 6), window=window),
+                    clean_map(np.nansum(datacube[2:6, 1:5, 3:], axis=0)), atol=1e-5)
+    assert_allclose(moment_maps.lv((2, 3), window=(slice(2, 8), slice(4, 5))),
+                    clean_map(np.nansum(datacube[2:8, 2:3, 4:5], axis=1)), atol=1e-5)
+
+
+def test_moment_maps_memory():
+
+    datacube = make_test_cube()
+    datacube[3, 2, 4] = np.inf
+
+    moment_maps = MomentMaps.compute(datacube, slab_size=6)
+
+    assert moment_maps.cumulative_v.dtype == np.float32
+    assert_equal(moment_maps.infinite_pixels, [[3, 2, 4]])
+
+    # the sums along b wait for an l-v map
+    assert moment_maps.cumulative_b is None
+    moment_maps.lv()
+    assert moment_maps.cumulative_b.dtype == np.float32
+    assert moment_maps.cumulative_b.shape == moment_maps.cumulative_b_shape
+
+
+def test_moment_maps_persist(tmpdir):
+
+    datacube = make_test_cube(seed=1)
+    path = str(tmpdir)
+
+    register_moment_maps_path(datacube, path)
+    moment_maps = moment_maps_for(datacube)
+
+    assert moment_maps_for(datacube) is moment_maps
+    assert moment_maps.infinite_pixels is None
+    assert not tmpdir.join(cumulative_filenames['infinite']).check()
+
+    # the sums along b are saved once they're taken
+    assert not tmpdir.join(cumulative_filenames['b']).check()
+    moment_maps.lv()
+    assert tmpdir.join(cumulative_filenames['b']).check()
+
+    reloaded = MomentMaps.load(path)
+    assert isinstance(reloaded.cumulative_v, np.memmap)
+    assert_equal(reloaded.lv((1, 5)), moment_maps.lv((1, 5)))
+    assert_allclose(reloaded.lv((1, 5)), clean_map(np.nansum(datacube[:, 1:5], axis=1)), atol=1e-5)
@@ -0,0 +1,44 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_equal, assert_allclose
+
+from ..noise_injection import add_noise, noise_added_copy, noise_record, replay_noise
+
+
+def test_add_noise_is_seeded_and_slab_independent():
+
+    datacube = np.arange(5*6*7, dtype=np.float32).reshape(5, 6, 7)
+
+    expected = (datacube + np.random.RandomState(12).normal(scale=0.3, size=datacube.shape)).astype(np.float32)
+
+    for slab_size in [1, 2, 16]:
+        noisy = add_noise(datacube.copy(), 0.3, 12, slab_size=slab_size)
+        assert_equal(noisy.dtype, np.float32)
+        assert_equal(noisy, expected)
+
+    other = noise_added_copy(datacube, 0.3, 13)
+    assert np.any(other != expected)
+
+
+def test_add_noise_is_in_place():
+
+    datacube = np.zeros((4, 3, 3), dtype=np.float32)
+    output = add_noise(datacube, 1.0, 0)
+
+    assert output is datacube
+    assert_allclose(datacube.std(), 1.0, atol=0.3)
+
+
+def test_replay_noise():
+
+    datacube = np.ones((3, 4, 4))
+
+    noisy = noise_added_copy(datacube, 0.5, 99)
+    assert_equal(replay_noise(datacube, noise_record(0.5, 99)), noisy)
+    assert_equal(datacube, 1)
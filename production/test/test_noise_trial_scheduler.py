@@ -0,0 +1,95 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_equal
+
+from ..noise_trial_scheduler import run_trials, shared_array, trial_seed, read_trial_table
+
+
+def noisy_mean_trial(data, key, seed):
+
+    noise_level, trial_number = key
+    if noise_level < 0:
+        raise ValueError("negative noise")
+
+    random_state = np.random.RandomState(seed)
+    noisy = data + random_state.normal(scale=noise_level, size=data.shape)
+
+    return {'mean': noisy.mean(), 'data_sum': data.sum()}
+
+
+def test_trial_seed():
+
+    assert_equal(trial_seed(0, (0.1, 3)), trial_seed(0, (0.1, 3)))
+    assert trial_seed(0, (0.1, 3)) != trial_seed(0, (0.1, 4))
+    assert trial_seed(0, (0.1, 3)) != trial_seed(1, (0.1, 3))
+
+
+def test_run_trials_parallel_matches_serial_and_resumes(tmpdir):
+
+    data = shared_array(np.arange(60, dtype=np.float32).reshape(3, 4, 5))
+    keys = [(noise, i) for noise in [0.1, 0.5] for i in range(4)]
+    names = (['noise_added', 'trial_number'], ['mean', 'data_sum'])
+
+    serial_file = str(tmpdir.join('serial.txt'))
+    parallel_file = str(tmpdir.join('parallel.txt'))
+
+    serial = run_trials(noisy_mean_trial, keys, *names, output_filename=serial_file,
+                        data=data, n_processes=1, verbose=False)
+    parallel = run_trials(noisy_mean_trial, keys, *names, output_filename=parallel_file,
+                          data=data, n_processes=3, verbose=False)
+
+    assert_equal(len(serial), 8)
+    assert_equal(set(serial['data_sum']), set([data.sum()]))
+    serial.sort(['noise_added', 'trial_number'])
+    parallel.sort(['noise_added', 'trial_number'])
+    assert_equal(np.array(serial['mean']), np.array(parallel['mean']))
+    assert_equal(np.array(serial['seed']), np.array(parallel['seed']))
+
+    # simulate a crash: two rows lost, and the last one cut off mid-write
+    lines = open(serial_file).read().split('\n')
+    with open(serial_file, 'w') as f:
+        f.write('\n'.join(lines[:-4]) + '\n' + lines[-4][:5])
+
+    resumed = run_trials(noisy_mean_trial, keys + [(0.5, 4)], *names, output_filename=serial_file,
+                         data=data, n_processes=2, verbose=False)
+    assert_equal(len(resumed), 9)
+
+    resumed.sort(['noise_added', 'trial_number'])
+    assert_equal(np.array(resumed['mean'][:-1]), np.array(serial['mean']))
+    assert_equal(len(read_trial_table(serial_file)), 9)
+
+
+def test_failed_trials_are_not_recorded(tmpdir):
+
+    data = shared_array(np.ones((2, 2)))
+    output_file = str(tmpdir.join('trials.txt'))
+
+    table = run_trials(noisy_mean_trial, [(-1, 0), (0.2, 0)], ['noise_added', 'trial_number'], ['mean'],
+                       output_file, data=data, n_processes=1, verbose=False)
+
+    assert_equal(list(table['noise_added']), [0.2])
+
+
+def test_older_output_gains_new_columns(tmpdir):
+
+    data = shared_array(np.arange(6.))
+    output_file = str(tmpdir.join('trials.txt'))
+    keys = [(0.1, 0), (0.1, 1)]
+
+    # written when trials only returned 'mean'
+    run_trials(noisy_mean_trial, keys[:1], ['noise_added', 'trial_number'], ['mean'],
+               output_file, data=data, n_processes=1, verbose=False)
+
+    table = run_trials(noisy_mean_trial, keys, ['noise_added', 'trial_number'], ['mean', 'data_sum'],
+                       output_file, data=data, n_processes=1, verbose=False)
+
+    assert_equal(table.colnames, ['noise_added', 'trial_number', 'seed', 'mean', 'data_sum'])
+    table.sort('trial_number')
+    assert np.isnan(table['data_sum'][0])
+    assert_equal(table['data_sum'][1], 15)
@@ -0,0 +1,85 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+import pytest
+
+from astropy.table import Table
+
+from ..size_linewidth_fit import fit_size_linewidth, size_linewidth_fits, odr_reference_fit
+
+
+def mock_clouds(n, A=0.5, B=0.5, scatter=0.15, seed=0):
+
+    random_state = np.random.RandomState(seed)
+
+    size = 10**random_state.uniform(0, 2, n)
+    v_rms = A * size**B * 10**random_state.normal(0, scatter, n)
+
+    return size, v_rms
+
+
+def test_exact_power_law():
+
+    size = np.arange(1, 50)
+    v_rms = 5 * size**0.625
+
+    fit = fit_size_linewidth(size, v_rms, n_resamples=10, seed=0)
+
+    assert_allclose([fit['A'], fit['B']], [5, 0.625])
+    assert_allclose(fit['covariance'], 0, atol=1e-20)
+
+
+def test_matches_odr_reference():
+
+    size, v_rms = mock_clouds(500)
+
+    for error_ratio in [1, 0.2]:
+        fit = fit_size_linewidth(size, v_rms, n_resamples=10, error_ratio=error_ratio, seed=0)
+        assert_allclose([fit['A'], fit['B']], odr_reference_fit(size, v_rms, error_ratio=error_ratio), rtol=1e-4)
+
+
+def test_resampled_fits():
+
+    size, v_rms = mock_clouds(300)
+
+    fit = fit_size_linewidth(size, v_rms, n_resamples=50, seed=1, max_elements=1000)
+    assert_equal(fit['samples'].shape, (50, 2))
+
+    # each bootstrap sample is the fit to its own resample
+    random_state = np.random.RandomState(1)
+    for resample_fit in fit['samples'][:3]:
+        draws = random_state.randint(0, 300, size=(1, 300))[0]
+        assert_allclose(resample_fit, odr_reference_fit(size[draws], v_rms[draws]), rtol=1e-4)
+
+    # the chunking doesn't change the draws
+    unchunked = fit_size_linewidth(size, v_rms, n_resamples=50, seed=1)
+    assert_allclose(unchunked['samples'], fit['samples'])
+
+    jackknife = fit_size_linewidth(size, v_rms, method='jackknife')
+    assert_equal(jackknife['samples'].shape, (300, 2))
+    assert_allclose(jackknife['error_B'], fit['error_B'], rtol=0.5)
+
+
+def test_size_linewidth_fits():
+
+    catalogs = {}
+    for name, B in [('inner', 0.5), ('outer', 0.8)]:
+        catalogs[name] = Table()
+        catalogs[name]['size'], catalogs[name]['v_rms'] = mock_clouds(400, B=B)
+
+    fits = size_linewidth_fits(catalogs, n_resamples=200, seed=0)
+
+    assert_allclose(fits['inner']['B'], 0.5, atol=3*fits['inner']['error_B'] + 0.05)
+    assert_allclose(fits['outer']['B'], 0.8, atol=3*fits['outer']['error_B'] + 0.05)
+
+
+def test_too_few_clouds():
+
+    with pytest.raises(ValueError):
+        fit_size_linewidth([1, 2, np.nan], [1, 2, 3])
@@ -0,0 +1,66 @@
+"""
+Tests for structure_statistics.py
+
+should run with py.test
+
+"""
+
+from __future__ import division
+
+from numpy.testing import assert_allclose, assert_equal
+import numpy as np
+
+from astrodendro import Dendrogram
+
+from ..disqualify_edge_structures import on_edge
+from ..structure_statistics import structure_scalars, accumulate_over_subtrees, structure_levels
+
+def make_test_dendrogram():
+
+    np.random.seed(0)
+    data = np.random.random((6, 8, 10))
+    data[1:4, 2:6, 2:7] += 2
+    data[2:5, 1:3, 6:9] += 1.5
+
+    return Dendrogram.compute(data, min_value=0.5, min_delta=0.05, min_npix=2)
+
+def test_structure_scalars():
+
+    d = make_test_dendrogram()
+    assert len(d) > 10
+
+    scalars = structure_scalars(d)
+
+    for struct in d:
+        idx = struct.idx
+        expected_parent = struct.parent.idx if struct.parent is not None else -1
+
+        assert_equal(scalars['parent'][idx], expected_parent)
+        assert_equal(scalars['level'][idx], struct.level)
+        assert_equal(scalars['npix_self'][idx], struct.get_npix(subtree=False))
+        assert_equal(scalars['npix'][idx], struct.get_npix())
+        assert_equal(scalars['vmin'][idx], struct.vmin)
+        assert_equal(scalars['vmax'][idx], struct.vmax)
+
+        assert_equal(scalars['n_descendants'][idx], len(struct.descendants))
+        assert_equal(scalars['is_leaf'][idx], struct.is_leaf)
+        if struct.parent is not None:
+            assert_equal(scalars['fractional_gain'][idx], 
+                         len(struct.descendants) / len(struct.parent.descendants))
+        else:
+            assert np.isnan(scalars['fractional_gain'][idx])
+
+        indices = struct.indices()
+        assert_equal(scalars['bbox_min'][idx], [x.min() for x in indices])
+        assert_equal(scalars['bbox_max'][idx], [x.max() for x in indices])
+        assert_equal(scalars['on_edge'][idx], on_edge(struct, d.data.shape))
+
+def test_accumulate_over_subtrees():
+
+    # a little tree:   0 -> (1, 2), 2 -> (3, 4)
+    parents = np.array([-1, 0, 0, 2, 2])
+
+    assert_equal(structure_levels(parents), [0, 1, 1, 2, 2])
+    assert_allclose(accumulate_over_subtrees(np.ones(5), parents), [5, 1, 3, 1, 1])
+    assert_equal(accumulate_over_subtrees(np.array([3, 4, 2, 0, 5]), parents, ufunc=np.minimum), 
+                 [0, 4, 0, 0, 5])
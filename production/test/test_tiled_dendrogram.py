@@ -0,0 +1,109 @@
+"""
+Tests for tiled_dendrogram.py
+
+should run with py.test
+
+"""
+
+from numpy.testing import assert_equal
+import numpy as np
+
+from astrodendro import Dendrogram
+
+from ..load_and_process_data import load_data, permute_data_to_standard_order
+from ..tiled_dendrogram import assign_regions_to_tiles, compute_tiled_dendrogram, compute_stable_dendrogram
+
+def assert_dendrograms_identical(d1, d2):
+
+    assert_equal(len(d1), len(d2))
+    assert_equal(d1.index_map, d2.index_map)
+    assert_equal([x.idx for x in d1.trunk], [x.idx for x in d2.trunk])
+    assert_equal([x.idx for x in d1.all_structures], [x.idx for x in d2.all_structures])
+
+    for s1, s2 in zip(d1.all_structures, d2.all_structures):
+        assert_equal(s1.parent is None, s2.parent is None)
+        if s1.parent is not None:
+            assert_equal(s1.parent.idx, s2.parent.idx)
+        assert_equal([x.idx for x in s1.children], [x.idx for x in s2.children])
+        assert_equal(s1._indices, s2._indices)
+        assert_equal(s1._values, s2._values)
+        assert_equal(s1.get_npix(), s2.get_npix())
+        assert_equal(s1.level, s2.level)
+
+def make_clumpy_cube():
+
+    np.random.seed(42)
+    datacube = np.random.random((10, 12, 40))
+
+    # a few clumps, some of which share a longitude range
+    for v, b, l in [(3, 3, 4), (6, 8, 9), (5, 5, 20), (2, 9, 21), (7, 4, 33)]:
+        datacube[v-2:v+3, b-2:b+3, l-3:l+4] += 2 + np.random.random()
+
+    return datacube
+
+def test_assign_regions_to_tiles():
+
+    mask = np.zeros((2, 2, 10), dtype=bool)
+    mask[0, 0, 0:3] = True
+    mask[1, 1, 2:4] = True
+    mask[0, 0, 6:8] = True
+    mask[1, 1, 9] = True
+
+    labels, tiles = assign_regions_to_tiles(mask, 2)
+
+    assert_equal(labels.max(), 4)
+    assert_equal(len(tiles), 2)
+    # every region lands in exactly one tile
+    assert_equal(sorted(np.concatenate([x[2] for x in tiles])), [1, 2, 3, 4])
+    # tiles cover their regions' full longitude extent, and may overlap
+    assert_equal(tiles[0][:2], (0, 4))
+    assert_equal(tiles[1][:2], (6, 10))
+
+def test_tiled_dendrogram_matches_serial_test_data():
+
+    datacube, header = permute_data_to_standard_order(
+        *load_data("test_data.fits", data_path="production/test/"))
+
+    for min_value in [-1, 50, 100]:
+        d_serial = Dendrogram.compute(datacube, min_value=min_value, min_delta=1, min_npix=1)
+        d_tiled = compute_tiled_dendrogram(datacube, min_value, 1, 1, n_processes=2)
+
+        assert_dendrograms_identical(d_serial, d_tiled)
+
+def test_tiled_dendrogram_matches_serial_clumps():
+
+    datacube = make_clumpy_cube()
+
+    for (min_value, min_delta, min_npix) in [(1, 0.2, 5), (0.9, 0.05, 2), (2.5, 0.1, 3)]:
+        d_serial = Dendrogram.compute(datacube, min_value=min_value,
+                                      min_delta=min_delta, min_npix=min_npix)
+
+        for n_processes, n_tiles in [(1, 3), (2, None), (3, 10)]:
+            d_tiled = compute_tiled_dendrogram(datacube, min_value, min_delta, min_npix,
+                                               n_processes=n_processes, n_tiles=n_tiles)
+
+            assert_dendrograms_identical(d_serial, d_tiled)
+
+def test_tiled_dendrogram_matches_serial_quantized():
+
+    # rounding leaves many pixels of exactly equal value
+    datacube = np.round(make_clumpy_cube() * 4)
+
+    for min_value in [3, None]:
+        d_serial = compute_stable_dendrogram(datacube, min_value, 1, 3)
+
+        for n_tiles in [2, 4, 10]:
+            d_tiled = compute_tiled_dendrogram(datacube, min_value, 1, 3,
+                                               n_processes=1, n_tiles=n_tiles)
+
+            assert_dendrograms_identical(d_serial, d_tiled)
+
+def test_stable_dendrogram_matches_serial_without_ties():
+
+    datacube = make_clumpy_cube()
+
+    d_serial = Dendrogram.compute(datacube, min_value=1, min_delta=0.2, min_npix=5)
+    d_stable = compute_stable_dendrogram(datacube, 1, 0.2, 5)
+
+    assert_dendrograms_identical(d_serial, d_stable)
+    assert type(d_stable.data) is np.ndarray
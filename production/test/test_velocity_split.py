@@ -60,3 +60,36 @@ def test_calculate_velocity_split():
     excpected_max_split = [0, 0, 4, 0, 4]
     assert_equal(max_vsplit, excpected_max_split)
 
+
+
+def test_velocity_split_on_dendrogram():
+
+    from astrodendro import Dendrogram
+
+    np.random.seed(3)
+    data = np.random.random((6, 8, 12))
+    data[1:4, 2:6, 2:7] += 2
+    data[2:5, 1:3, 6:9] += 1.5
+    d = Dendrogram.compute(data, min_value=0.5, min_delta=0.05, min_npix=2)
+
+    test_catalog = astropy.table.Table()
+    test_catalog['_idx'] = np.arange(len(d))
+    test_catalog['v_cen'] = np.random.random(len(d)) * 10
+    test_catalog['n_descendants'] = [len(d[i].descendants) for i in range(len(d))]
+
+    velocity_split = calculate_velocity_split(d, test_catalog)
+    test_catalog['v_split'] = velocity_split
+    max_vsplit = descendants_max_vsplit(d, test_catalog)
+
+    for i in range(len(d)):
+        struct = d[i]
+        vcen = test_catalog['v_cen'][i]
+
+        if len(struct.children) == 2:
+            expected_split = min(abs(vcen - test_catalog['v_cen'][x.idx]) for x in struct.children)
+        else:
+            expected_split = 0
+        assert_allclose(velocity_split[i], expected_split)
+
+        expected_max = max([velocity_split[x.idx] for x in struct.descendants] + [velocity_split[i]])
+        assert_allclose(max_vsplit[i], expected_max)
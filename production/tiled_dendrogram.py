@@ -0,0 +1,285 @@
+"""
+Computes a dendrogram in longitude tiles across a pool of processes.
+
+A dendrogram only ever joins pixels that are adjacent and above `min_value`,
+so every tree in its trunk lives inside one connected region of the
+thresholded cube. We label those regions, deal them out into longitude
+tiles of roughly equal pixel count, compute each tile's sub-dendrogram in a
+separate process, and stitch the sub-trees back together.
+
+A tile's slab covers the full longitude extent of the regions assigned to
+it, so neighbouring slabs overlap; pixels of regions belonging to other
+tiles are blanked out within each slab. Because each region sees exactly
+the same sequence of pixel additions and merges as it would in the serial
+computation, the stitched dendrogram is identical to the serial one:
+same index map, same structure ids, parents, children, trunk order, and
+pixel ordering within each structure.
+
+That sequence depends on the order in which pixels of exactly equal value
+are added, which `Dendrogram.compute` leaves to an unstable `np.argsort`
+(and so to whatever else is in the array being sorted). Quantized cubes
+are full of such ties, so both the tiles and the serial reference
+(`compute_stable_dendrogram`) break them the same way: by flat (C-order)
+index, which orders any two pixels of a slab just as it orders them in
+the whole cube. Without ties, `compute_stable_dendrogram` is exactly
+`Dendrogram.compute`.
+
+"""
+
+from __future__ import division
+
+import multiprocessing
+
+import numpy as np
+from scipy import ndimage
+
+import astrodendro
+from astrodendro.structure import Structure
+
+# the cube is in (v, b, l) order by the time it reaches us
+longitude_axis = 2
+
+
+class _StableOrderArray(np.ndarray):
+    """
+    An array whose `argsort` is always stable.
+
+    `Dendrogram.compute` orders its pixels with `np.argsort(values)`, which
+    defers to this method, so equal values keep their flat-index order.
+
+    """
+
+    def argsort(self, axis=-1, kind=None, order=None):
+        return np.asarray(self).argsort(axis=axis, kind='mergesort', order=order)
+
+
+def resolve_min_value(datacube, min_value):
+    """ The numeric `min_value`, with None or "min" meaning just below the smallest finite value. """
+
+    if min_value is None or (isinstance(min_value, str) and min_value == "min"):
+        return np.min(datacube[np.isfinite(datacube)]) - 1
+
+    return min_value
+
+
+def compute_stable_dendrogram(datacube, min_value, min_delta, min_npix, wcs=None, verbose=False):
+    """
+    `astrodendro.Dendrogram.compute`, with ties between equal values broken by flat index.
+
+    This is the serial computation that `compute_tiled_dendrogram`
+    reproduces exactly, tied values or not.
+
+    """
+
+    d = astrodendro.Dendrogram.compute(datacube.view(_StableOrderArray),
+                                       min_value=resolve_min_value(datacube, min_value),
+                                       min_delta=min_delta, min_npix=min_npix,
+                                       wcs=wcs, verbose=verbose)
+    d.data = datacube
+
+    return d
+
+
+def assign_regions_to_tiles(mask, n_tiles):
+    """
+    Labels the connected regions of `mask` and groups them into longitude tiles.
+
+    Parameters
+    ----------
+    mask : np.ndarray of bool
+        Which pixels are above `min_value`, in (v, b, l) order.
+    n_tiles : int
+        Maximum number of tiles to produce.
+
+    Returns
+    -------
+    labels : np.ndarray of int
+        Connected-region labels of `mask` (0 where `mask` is False).
+    tiles : list of tuples
+        One (l_start, l_stop, region_labels) tuple per tile. Tiles are
+        ordered by longitude and hold roughly equal numbers of pixels.
+
+    """
+
+    # The default structuring element joins pixels that share a face,
+    # which is the same adjacency astrodendro uses.
+    labels, n_regions = ndimage.label(mask)
+
+    if n_regions == 0:
+        return labels, []
+
+    region_slices = ndimage.find_objects(labels)
+    region_sizes = np.bincount(labels.ravel(), minlength=n_regions+1)[1:]
+    region_starts = np.array([x[longitude_axis].start for x in region_slices])
+    region_stops = np.array([x[longitude_axis].stop for x in region_slices])
+
+    # deal out regions (sorted by their starting longitude) so each tile
+    # gets a roughly equal share of the pixels
+    order = np.argsort(region_starts, kind='mergesort')
+    cumulative_size = np.cumsum(region_sizes[order])
+    tile_of_region = np.minimum(
+        (n_tiles * (cumulative_size - region_sizes[order]) // cumulative_size[-1]).astype(int),
+        n_tiles - 1)
+
+    tiles = []
+    for tile in np.unique(tile_of_region):
+        members = order[tile_of_region == tile]
+        tiles.append((region_starts[members].min(),
+                      region_stops[members].max(),
+                      members + 1))
+
+    return labels, tiles
+
+
+def _compute_tile(args):
+    """
+    Computes the dendrogram of one slab and returns its structures as plain arrays.
+
+    Runs in a worker process, so it returns only picklable, non-recursive
+    records: (idx, parent_idx, children_idx, indices, values) per structure,
+    with `indices` shifted into the coordinates of the whole cube.
+
+    """
+
+    slab, l_offset, min_value, min_delta, min_npix = args
+
+    d = compute_stable_dendrogram(slab, min_value, min_delta, min_npix)
+
+    records = []
+    for struct in d._structures_dict.values():
+        # the private pixel lists keep the order in which pixels were added,
+        # which the public `indices()` method does not
+        indices = np.array(struct._indices, dtype=np.intp).reshape(-1, slab.ndim)
+        indices[:, longitude_axis] += l_offset
+        parent_idx = struct.parent.idx if struct.parent is not None else -1
+
+        records.append((struct.idx, parent_idx, [x.idx for x in struct.children],
+                        indices, np.array(struct._values)))
+
+    # trunk order, needed to keep the stitched trunk order identical
+    trunk_idx = [x.idx for x in d.trunk]
+
+    return records, trunk_idx
+
+
+def compute_tiled_dendrogram(datacube, min_value, min_delta, min_npix,
+                             wcs=None, n_processes=None, n_tiles=None,
+                             verbose=True):
+    """
+    Computes a dendrogram in longitude tiles, in parallel.
+
+    The result is identical to that of `compute_stable_dendrogram(datacube,
+    min_value, min_delta, min_npix, wcs=wcs)`, which is in turn identical
+    to `astrodendro.Dendrogram.compute` on cubes without tied values.
+
+    Parameters
+    ----------
+    datacube : np.ndarray
+        Data in (v, b, l) order.
+    min_value, min_delta, min_npix : float, float, int
+        Dendrogram parameters; see `compute_dendrogram`. A `min_value` of
+        None (or "min") keeps every finite pixel.
+    wcs : astropy.wcs.WCS, optional
+        Attached to the output dendrogram.
+    n_processes : int, optional
+        Size of the process pool. Defaults to the number of CPUs.
+    n_tiles : int, optional
+        Number of longitude tiles. Defaults to 4 per process,
+        which helps to balance the load.
+    verbose : bool, optional
+        Print a summary of the tiling.
+
+    Returns
+    -------
+    d : astrodendro.dendrogram.Dendrogram
+
+    """
+
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    if n_tiles is None:
+        n_tiles = 4 * n_processes
+
+    min_value = resolve_min_value(datacube, min_value)
+
+    labels, tiles = assign_regions_to_tiles(datacube > min_value, n_tiles)
+
+    if verbose:
+        print "Tiled dendrogram: {0} regions in {1} tiles over {2} processes".format(
+            labels.max(), len(tiles), n_processes)
+
+    if np.issubdtype(datacube.dtype, np.integer):
+        blank_value = np.floor(min_value)
+    else:
+        blank_value = np.nan
+
+    def tile_arguments():
+        for l_start, l_stop, region_labels in tiles:
+            slab = np.array(datacube[..., l_start:l_stop])
+            in_tile = np.in1d(labels[..., l_start:l_stop], region_labels).reshape(slab.shape)
+            slab[~in_tile] = blank_value
+            yield slab, l_start, min_value, min_delta, min_npix
+
+    if n_processes > 1 and len(tiles) > 1:
+        pool = multiprocessing.Pool(n_processes)
+        try:
+            tile_results = pool.map(_compute_tile, tile_arguments())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tile_results = [_compute_tile(x) for x in tile_arguments()]
+
+    return stitch_tiles(tile_results, datacube, min_value, min_delta, min_npix, wcs=wcs)
+
+
+def stitch_tiles(tile_results, datacube, min_value, min_delta, min_npix, wcs=None):
+    """
+    Assembles the output of `_compute_tile` into one dendrogram over `datacube`.
+
+    Structure ids are reassigned the way `Dendrogram.compute` assigns them
+    (in order of each structure's smallest pixel index), and trunk
+    structures are ordered by the C-order position of their first pixel,
+    again as in `Dendrogram.compute`.
+
+    """
+
+    d = astrodendro.Dendrogram()
+    d.data = datacube
+    d.n_dim = datacube.ndim
+    d.wcs = wcs
+    d.params = dict(min_npix=min_npix, min_value=min_value, min_delta=min_delta)
+    d.index_map = -np.ones(datacube.shape, dtype=np.int32)
+
+    structures = []
+    trunk = []
+    for records, trunk_idx in tile_results:
+        local = {}
+        for idx, parent_idx, children_idx, indices, values in records:
+            struct = Structure([tuple(x) for x in indices], list(values), dendrogram=d)
+            local[idx] = (struct, parent_idx, children_idx)
+            structures.append(struct)
+
+        for struct, parent_idx, children_idx in local.values():
+            struct.children = [local[x][0] for x in children_idx]
+            struct.parent = local[parent_idx][0] if parent_idx > -1 else None
+
+        trunk.extend(local[x][0] for x in trunk_idx)
+
+    # Within a tile, the trunk is already sorted by each trunk structure's
+    # first (seed) pixel; across tiles we merge on the same key.
+    trunk.sort(key=lambda x: x._indices[0])
+
+    d._structures_dict = {}
+    for idx, struct in enumerate(sorted(structures, key=lambda x: x.smallest_index)):
+        struct.idx = idx
+        d.index_map[tuple(np.array(struct._indices).T)] = idx
+        d._structures_dict[idx] = struct
+
+    d.trunk = trunk
+    for struct in d.trunk:
+        struct._level = 0
+
+    d._index()
+
+    return d
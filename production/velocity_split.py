@@ -9,36 +9,33 @@ from __future__ import division
 
 import numpy as np
 
+from .structure_statistics import structure_parents, structure_children, accumulate_over_subtrees
 
-def calculate_velocity_split(d, catalog):
-
-    velocity_split = np.zeros(len(catalog))
 
-    for i in range(len(catalog)):
+def calculate_velocity_split(d, catalog):
+    """
+    Assigns each structure with exactly two children its velocity split.
 
-        idx = catalog['_idx'][i]
-        vcen = catalog['v_cen'][i]
+    Everyone else gets zero.
 
-        struct = d[idx]
+    """
 
-        try:
-            child1, child2 = struct.children
-        except ValueError:
-            # velocity_split[i] gets zero by default, so just move on
-            continue
+    parents = structure_parents(d)
+    children, first_child, n_children = structure_children(parents)
 
-        idx1, idx2 = child1.idx, child2.idx
-        vcen1 = catalog['v_cen'][catalog['_idx']==idx1]
-        vcen2 = catalog['v_cen'][catalog['_idx']==idx2]
+    vcen_by_idx = np.zeros(len(parents)) * np.nan
+    vcen_by_idx[catalog['_idx']] = catalog['v_cen']
 
-        delta1 = np.abs(vcen - vcen1)
-        delta2 = np.abs(vcen - vcen2)
+    velocity_split_by_idx = np.zeros(len(parents))
 
-        split = min(delta1, delta2)
+    has_two_children = np.where(n_children == 2)[0]
+    vcen1 = vcen_by_idx[children[first_child[has_two_children]]]
+    vcen2 = vcen_by_idx[children[first_child[has_two_children] + 1]]
+    vcen = vcen_by_idx[has_two_children]
 
-        velocity_split[i] = split
+    velocity_split_by_idx[has_two_children] = np.minimum(np.abs(vcen - vcen1), np.abs(vcen - vcen2))
 
-    return velocity_split
+    return velocity_split_by_idx[catalog['_idx']]
 
 
 def descendants_max_vsplit(d, catalog):
@@ -47,24 +44,12 @@ def descendants_max_vsplit(d, catalog):
 
     """
 
-    unchecked = -1
-
-    max_vsplit = np.ones(len(catalog)) * unchecked
-
-    # if you're a single feature you get zero
-    max_vsplit[catalog['n_descendants'] == 0] = 0
-
-    for i, struct in enumerate(d):
-
-        if max_vsplit[struct.idx] == unchecked:
-
-            # probably hella slow. IDC.
-            descendant_idx_list = [x.idx for x in struct.descendants] + [struct.idx]
-            descendant_vsplit_list = catalog['v_split'][np.in1d(catalog['_idx'], descendant_idx_list)]
-
-            max_vsplit[struct.idx] = max(descendant_vsplit_list)
-
-    return max_vsplit
+    parents = structure_parents(d)
 
+    # structures missing from the catalog don't count
+    vsplit_by_idx = np.zeros(len(parents)) * np.nan
+    vsplit_by_idx[catalog['_idx']] = catalog['v_split']
 
+    max_vsplit_by_idx = accumulate_over_subtrees(vsplit_by_idx, parents, ufunc=np.fmax)
 
+    return max_vsplit_by_idx[catalog['_idx']]
@@ -1,98 +1,79 @@
 """
-Some python code to interface with Mark Reid's fortran tool.
+Assigns kinematic distances using the Reid et al. (2014) rotation curves.
 
-Hopefully I can figure out how to do this in a non-boneheaded way.
+By default, distances come from Mark Reid's Fortran tools. Passing
+`executable_path=None` computes them in-process with
+`rotation_curve_distance` instead, and passing a lookup table
+interpolates that in-process model. The in-process model does not yet reproduce the
+tools' recorded outputs (0.41 kpc for the flat curve's self-test source,
+where it gives 1.62 kpc; 14.92 kpc for the universal one's, where it
+gives 14.975 kpc), so the tools remain the default.
 
 """
 
 from __future__ import division
 
 import os
-import subprocess
-from subprocess import Popen, PIPE, STDOUT
+import shutil
+import tempfile
+from subprocess import Popen, PIPE
 
 import numpy as np
 
 import astropy.table
 from astropy.coordinates import Galactic
 import astropy.units as u
-import astropy.constants as c
+
+from .rotation_curve_distance import (kinematic_distance_table, lookup_distance_table, flat_rotation_curve,
+                                      universal_rotation_curve, reid2014_flat_parameters,
+                                      reid2014_universal_parameters)
 
 executable_path = os.path.expanduser('~/Documents/Code/mark_reid_kdist/revised_kinematic_distance')
 
 executable_path_universal = os.path.expanduser('~/Documents/Code/mark_reid_kdist/universal_sersic_kdist')
 
+nearfar_dict = {'near': 0,
+                'far': 1}
 
-def test_reid_distances(executable_path=executable_path, verbose=True):
-
-    test_string = "test    010203.04 121314.5 -10 1\n"
-
-    f = open('source_file.dat', 'w')
-    f.write(test_string)
-    f.close()
-
-    p = Popen(
-        [executable_path],
-        shell = False, stdin=PIPE, stdout=PIPE)
-
-    output, error = p.communicate()
-
-    if verbose:
-        print output
-        print error
-
-    lines_of_data = [x for x in output.split('\n') if '!' not in x and x != '']
-
-    kd_output = astropy.table.Table.read(lines_of_data, format='ascii')
-    
-    kd_output.rename_column('col1', 'Source')
-    kd_output.rename_column('col2', 'gal_long')
-    kd_output.rename_column('col3', 'gal_lat')
-    kd_output.rename_column('col4', 'V_lsr')
-    kd_output.rename_column('col5', 'V_rev')
-    kd_output.rename_column('col6', 'D_k')
-    kd_output.rename_column('col7', 'error_D_k_plus')
-    kd_output.rename_column('col8', 'error_D_k_minus')
-    
-    if verbose:
-        print kd_output, lines_of_data
-
-    return kd_output
 
-try:
-    reid_test_output = test_reid_distances(verbose=False)
+def run_kdist_executable(source_file_string, executable_path, working_directory=None):
+    """
+    Runs one of Mark Reid's kdist tools on a source file and parses its output.
 
-    assert type(reid_test_output) == astropy.table.table.Table
-    assert len(reid_test_output) == 1
-    assert len(reid_test_output.colnames) == 8
-    assert reid_test_output['D_k'][0] == 0.41
-except Exception, e:
-    print e
-    raise ImportError("Reid distances cannot be imported: unit tests failed! (Reid flat)")
+    The tools read `source_file.dat` in their working directory, which is
+    `working_directory` if given, and otherwise a temporary directory that
+    is removed afterwards.
 
+    """
 
-def test_universal_distances(executable_path=executable_path_universal, verbose=True):
+    temporary = working_directory is None
+    if temporary:
+        working_directory = tempfile.mkdtemp(prefix='kdist-')
 
-    test_string = "test    030.00 -01.00 -10 0\n"
+    try:
+        with open(os.path.join(working_directory, 'source_file.dat'), 'w') as f:
+            f.write(source_file_string)
 
-    f = open('source_file.dat', 'w')
-    f.write(test_string)
-    f.close()
+        p = Popen(
+            [executable_path],
+            shell = False, stdin=PIPE, stdout=PIPE, cwd=working_directory)
 
-    p = Popen(
-        [executable_path],
-        shell = False, stdin=PIPE, stdout=PIPE)
+        output, error = p.communicate()
+    finally:
+        if temporary:
+            shutil.rmtree(working_directory)
 
-    output, error = p.communicate()
+    lines_of_data = [x for x in output.split('\n') if '!' not in x and x != '']
 
-    if verbose:
-        print output
-        print error
+    # Sometimes the output is poorly formatted such that columns run up against each other. Let's sanitize those columns.
+    for i in range(len(lines_of_data)):
+        line = lines_of_data[i]
+        if len(line.split()) != 8:
+            tuple_split = tuple(line.split()[0:5])
+            lines_of_data[i] = "  {0} {1} {2}  {3} {4}    0.00   0.00  0.00".format(*tuple_split)
 
-    lines_of_data = [x for x in output.split('\n') if '!' not in x and x != '']
+    kd_output = astropy.table.Table.read(lines_of_data, format='ascii.no_header')
 
-    kd_output = astropy.table.Table.read(lines_of_data, format='ascii')
-    
     kd_output.rename_column('col1', 'Source')
     kd_output.rename_column('col2', 'gal_long')
     kd_output.rename_column('col3', 'gal_lat')
@@ -101,36 +82,39 @@ def test_universal_distances(executable_path=executable_path_universal, verbose=
     kd_output.rename_column('col6', 'D_k')
     kd_output.rename_column('col7', 'error_D_k_plus')
     kd_output.rename_column('col8', 'error_D_k_minus')
-    
-    if verbose:
-        print kd_output, lines_of_data
+
+    kd_output['gal_long'].unit = u.deg
+    kd_output['gal_lat'].unit = u.deg
+    kd_output['V_lsr'].unit = u.km/u.s
+    kd_output['V_rev'].unit = u.km/u.s
+    kd_output['D_k'].unit = u.kpc
+    kd_output['error_D_k_plus'].unit = u.kpc
+    kd_output['error_D_k_minus'].unit = u.kpc
 
     return kd_output
 
-try:
-    universal_test_output = test_universal_distances(verbose=False)
-
-    assert type(universal_test_output) == astropy.table.table.Table
-    assert len(universal_test_output) == 1
-    assert len(universal_test_output.colnames) == 8
-    assert universal_test_output['gal_long'] == 30
-    assert universal_test_output['gal_lat'] == -1
-    assert universal_test_output['D_k'][0] == 14.92
-except Exception, e:
-    print e
-    raise ImportError("Reid distances cannot be imported: unit tests failed! (Reid Universal)")
-    
 
-def make_reid_distance_column(catalog, nearfar='near', executable_path=executable_path):
+def make_reid_distance_column(catalog, nearfar='near', executable_path=executable_path, lookup_table=None):
     """ 
-    Makes a reid distance column. 
+    Makes a reid distance column, using the Reid et al. (2014) A5 rotation curve.
 
     Input: ppv_catalog output. 
 
+    Runs Mark Reid's `revised_kinematic_distance` tool at `executable_path`;
+    if `executable_path` is None, computes the distances in-process. If a
+    `distance_lookup_table.DistanceLookupTable` for the 'reid2014_flat'
+    model is given (any other raises a ValueError), distances are
+    interpolated from it; like the in-process solver it tabulates, it
+    doesn't reproduce the tool's output.
+
     """
 
-    nearfar_dict = {'near': 0,
-                    'far': 1}
+    if lookup_table is not None:
+        return lookup_distance_table(catalog, nearfar, lookup_table, 'reid2014_flat')
+
+    if executable_path is None:
+        return kinematic_distance_table(catalog, nearfar=nearfar, rotation_curve=flat_rotation_curve,
+                                        parameters=reid2014_flat_parameters)
 
     source_file_string = ''
     
@@ -154,62 +138,31 @@ def make_reid_distance_column(catalog, nearfar='near', executable_path=executabl
 
         source_file_string += row_string
 
-        # row_string.abcdasd()
+    return run_kdist_executable(source_file_string, executable_path)
 
-    f = open('source_file.dat', 'w')
-    f.write(source_file_string)
-    f.close()
 
-    p = Popen(
-        [executable_path],
-        shell = False, stdin=PIPE, stdout=PIPE)
-        
-    output, error = p.communicate()
-
-    lines_of_data = [x for x in output.split('\n') if '!' not in x and x != '']
-
-
-    # Sometimes the output is poorly formatted such that columns run up against each other. Let's sanitize those columns.
-    for i in range(len(lines_of_data)):
-        line = lines_of_data[i]
-        if len(line.split()) != 8:
-            tuple_split = tuple(line.split()[0:5])
-            lines_of_data[i] = "  {0} {1} {2}  {3} {4}    0.00   0.00  0.00".format(*tuple_split)
-
-    kd_output = astropy.table.Table.read(lines_of_data, format='ascii.no_header')
-    
-    kd_output.rename_column('col1', 'Source')
-    kd_output.rename_column('col2', 'gal_long')
-    kd_output.rename_column('col3', 'gal_lat')
-    kd_output.rename_column('col4', 'V_lsr')
-    kd_output.rename_column('col5', 'V_rev')
-    kd_output.rename_column('col6', 'D_k')
-    kd_output.rename_column('col7', 'error_D_k_plus')
-    kd_output.rename_column('col8', 'error_D_k_minus')
-    
-    kd_output['gal_long'].unit = u.deg
-    kd_output['gal_lat'].unit = u.deg
-    kd_output['V_lsr'].unit = u.km/u.s
-    kd_output['V_rev'].unit = u.km/u.s
-    kd_output['D_k'].unit = u.kpc
-    kd_output['error_D_k_plus'].unit = u.kpc
-    kd_output['error_D_k_minus'].unit = u.kpc
-
-    #    print kd_output
-
-    return kd_output
-
-
-def make_universal_distance_column(catalog, nearfar='near', executable_path=executable_path_universal):
+def make_universal_distance_column(catalog, nearfar='near', executable_path=executable_path_universal,
+                                   lookup_table=None):
     """ 
-    Makes a universal distance column. 
+    Makes a universal distance column, using the Reid et al. (2014) universal rotation curve.
 
     Input: ppv_catalog output. 
 
+    Runs Mark Reid's `universal_sersic_kdist` tool at `executable_path`;
+    if `executable_path` is None, computes the distances in-process. If a
+    `distance_lookup_table.DistanceLookupTable` for the 'reid2014_universal'
+    model is given (any other raises a ValueError), distances are
+    interpolated from it; like the in-process solver it tabulates, it
+    doesn't reproduce the tool's output.
+
     """
 
-    nearfar_dict = {'near': 0,
-                    'far': 1}
+    if lookup_table is not None:
+        return lookup_distance_table(catalog, nearfar, lookup_table, 'reid2014_universal')
+
+    if executable_path is None:
+        return kinematic_distance_table(catalog, nearfar=nearfar, rotation_curve=universal_rotation_curve,
+                                        parameters=reid2014_universal_parameters)
 
     source_file_string = ''
 
@@ -224,57 +177,13 @@ def make_universal_distance_column(catalog, nearfar='near', executable_path=exec
         
         lon_string = "{0:07.3f}".format(lon_column[i])
         lat_string = "{0:+07.3f}".format(lat_column[i])
-        # lat_string = "%+03i%02i%05.2f" % (ddd[i], np.abs(dmm)[i], np.abs(dss)[i])
         vstring = "%7.1f" % row['v_cen']
 
         row_string = name+" "+lon_string+" "+lat_string+" "+vstring+" "+fstring+"\n"
 
         source_file_string += row_string
 
-        # row_string.abcdasd()
-
-    f = open('source_file.dat', 'w')
-    f.write(source_file_string)
-    f.close()
-
-    p = Popen(
-        [executable_path],
-        shell = False, stdin=PIPE, stdout=PIPE)
-        
-    output, error = p.communicate()
-
-    lines_of_data = [x for x in output.split('\n') if '!' not in x and x != '']
-
-
-    # Sometimes the output is poorly formatted such that columns run up against each other. Let's sanitize those columns.
-    for i in range(len(lines_of_data)):
-        line = lines_of_data[i]
-        if len(line.split()) != 8:
-            tuple_split = tuple(line.split()[0:5])
-            lines_of_data[i] = "  {0} {1} {2}  {3} {4}    0.00   0.00  0.00".format(*tuple_split)
-
-    kd_output = astropy.table.Table.read(lines_of_data, format='ascii.no_header')
-    
-    kd_output.rename_column('col1', 'Source')
-    kd_output.rename_column('col2', 'gal_long')
-    kd_output.rename_column('col3', 'gal_lat')
-    kd_output.rename_column('col4', 'V_lsr')
-    kd_output.rename_column('col5', 'V_rev')
-    kd_output.rename_column('col6', 'D_k')
-    kd_output.rename_column('col7', 'error_D_k_plus')
-    kd_output.rename_column('col8', 'error_D_k_minus')
-    
-    kd_output['gal_long'].unit = u.deg
-    kd_output['gal_lat'].unit = u.deg
-    kd_output['V_lsr'].unit = u.km/u.s
-    kd_output['V_rev'].unit = u.km/u.s
-    kd_output['D_k'].unit = u.kpc
-    kd_output['error_D_k_plus'].unit = u.kpc
-    kd_output['error_D_k_minus'].unit = u.kpc
-
-    # print kd_output
-
-    return kd_output
+    return run_kdist_executable(source_file_string, executable_path)
 
 
 def distance_assigner_with_plusminus_errors(structure_catalog, kdist_catalog, distance_column_name='distance'):
@@ -0,0 +1,95 @@
+"""
+Downsamples datacubes by reducing blocks of pixels, and updates their headers to match.
+
+Blocks are reduced by stepping through the pixel offsets within a block
+and adding each strided view of the cube into output-sized accumulators,
+so nothing as large as the input cube is ever allocated.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+def block_reduce(array, factors, how='mean', dtype=np.float64):
+    """
+    Reduces non-overlapping blocks of `array`, ignoring NaNs.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+    factors : sequence of int
+        Block size along each axis. Trailing pixels that don't fill a
+        block are dropped.
+    how : 'mean' or 'sum', optional
+        How to combine the (non-NaN) pixels in a block. Blocks with no
+        non-NaN pixels come out NaN either way.
+    dtype : numpy.dtype, optional
+        Accumulator (and output) type; np.float32 halves the memory used.
+
+    Returns
+    -------
+    reduced_array : numpy.ndarray
+
+    """
+
+    if how not in ['mean', 'sum']:
+        raise ValueError("`how` must be 'mean' or 'sum'.")
+
+    if len(factors) != array.ndim:
+        raise ValueError("`factors` must match the array dimensions")
+
+    new_shape = [n // f for n, f in zip(array.shape, factors)]
+    trimmed = array[tuple(slice(0, n * f) for n, f in zip(new_shape, factors))]
+
+    total = np.zeros(new_shape, dtype=dtype)
+    count = np.zeros(new_shape, dtype=np.intp)
+
+    # trimmed[o0::f0, o1::f1, ...] holds pixel (o0, o1, ...) of every block
+    for offsets in np.ndindex(*factors):
+        plane = trimmed[tuple(slice(o, None, f) for o, f in zip(offsets, factors))]
+        finite = ~np.isnan(plane)
+        total[finite] += plane[finite]
+        count += finite
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if how == 'mean':
+            reduced_array = total / count
+        else:
+            reduced_array = total
+    reduced_array[count == 0] = np.nan
+
+    return reduced_array.astype(dtype, copy=False)
+
+
+def block_reduce_header(header, factors):
+    """
+    Updates a FITS header's WCS to describe `block_reduce(data, factors)`.
+
+    Each new pixel sits at the center of the block it was reduced from:
+    new pixel j (1-based) covers old pixels (j-1)*f+1 ... j*f, so an old
+    pixel coordinate p becomes (p - 0.5) / f + 0.5.
+
+    Parameters
+    ----------
+    header : astropy.io.fits.Header
+    factors : sequence of int
+        Block size along each data axis, in numpy order (i.e. the last
+        factor goes with NAXIS1).
+
+    Returns
+    -------
+    new_header : astropy.io.fits.Header
+
+    """
+
+    new_header = header.copy()
+
+    for i, factor in enumerate(reversed(factors)):
+        n = str(i + 1)
+        new_header['naxis'+n] = header['naxis'+n] // factor
+        new_header['cdelt'+n] = header['cdelt'+n] * factor
+        new_header['crpix'+n] = (header['crpix'+n] - 0.5) / factor + 0.5
+
+    return new_header
@@ -0,0 +1,357 @@
+"""
+Kinematic distances from the Reid et al. (2014) rotation curves, in NumPy.
+
+This replaces the round-trip through Mark Reid's Fortran tools
+(`revised_kinematic_distance` and `universal_sersic_kdist`): instead of
+writing a source file, spawning the binary and parsing its output, we
+model each source's LSR velocity as a function of distance and solve for
+the distance directly, for a whole catalog at once.
+
+The velocity model follows Reid et al. (2014):
+ - the Sun moves with the circular speed at R0 plus a peculiar motion
+   (U_sun, V_sun, W_sun);
+ - a source at Galactocentric radius R moves with the circular speed
+   Theta(R) plus an average peculiar motion (U_s toward the Galactic
+   Center, V_s in the direction of rotation);
+ - observed velocities are LSR velocities under the *standard* solar
+   motion (20 km/s toward RA=18h, Dec=+30 (1900)), so the model converts
+   back to that definition.
+
+Two rotation curves are available: the flat-ish linear curve of
+Reid et al.'s fit A5, and the "universal" (Persic, Salucci & Stel 1996)
+curve of their Table 5.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+import astropy.table
+import astropy.units as u
+
+# standard solar motion, as (U, V, W) in km/s
+standard_solar_motion = (10.27, 15.32, 7.74)
+
+# Reid et al. (2014), fit A5
+reid2014_flat_parameters = dict(R0=8.34, theta0=240., dtheta_dr=-0.2,
+                                U_sun=10.7, V_sun=15.6, W_sun=8.9,
+                                U_s=2.9, V_s=-1.5)
+
+# Reid et al. (2014), Table 5: universal rotation curve fit
+reid2014_universal_parameters = dict(R0=8.31, a1=241., a2=0.90, a3=1.46,
+                                     U_sun=10.5, V_sun=14.4, W_sun=8.9,
+                                     U_s=2.9, V_s=-1.6)
+
+# assumed uncertainty in a source's velocity, used for the +/- errors (km/s)
+default_velocity_uncertainty = 7.
+
+
+def flat_rotation_curve(R, parameters=reid2014_flat_parameters):
+    """ Theta(R) = Theta_0 + dTheta/dR * (R - R0), in km/s. """
+
+    return parameters['theta0'] + parameters['dtheta_dr'] * (R - parameters['R0'])
+
+
+def universal_rotation_curve(R, parameters=reid2014_universal_parameters):
+    """
+    The Persic, Salucci & Stel (1996) universal rotation curve, in km/s.
+
+    As parametrized by Reid et al. (2014): a1 is the circular speed at the
+    optical radius R_opt, a2 = R_opt / R0, and a3 = 1.5 (L/L*)^0.2.
+
+    """
+
+    a1, a2, a3 = parameters['a1'], parameters['a2'], parameters['a3']
+
+    luminosity_ratio = (a3 / 1.5)**5
+    beta = 0.72 + 0.44 * np.log10(luminosity_ratio)
+    x = R / (a2 * parameters['R0'])
+
+    disk = beta * 1.97 * x**1.22 / (x**2 + 0.78**2)**1.43
+    halo = (1 - beta) * x**2 * (1 + a3**2) / (x**2 + a3**2)
+
+    return a1 * np.sqrt(disk + halo)
+
+
+def model_lsr_velocity(distance, longitude, latitude,
+                       rotation_curve=universal_rotation_curve,
+                       parameters=reid2014_universal_parameters):
+    """
+    The LSR velocity (standard solar motion) of a source at a given distance.
+
+    Parameters
+    ----------
+    distance : np.ndarray
+        Heliocentric distance in kpc.
+    longitude, latitude : np.ndarray
+        Galactic coordinates in degrees. Broadcast against `distance`.
+    rotation_curve : function
+        Theta(R, parameters), in km/s.
+    parameters : dict
+        Rotation curve and solar/source motion parameters.
+
+    Returns
+    -------
+    velocity : np.ndarray
+        In km/s.
+
+    """
+
+    l = np.radians(longitude)
+    b = np.radians(latitude)
+    R0 = parameters['R0']
+
+    # unit vector along the line of sight, in (toward GC, rotation, up)
+    n_x = np.cos(b) * np.cos(l)
+    n_y = np.cos(b) * np.sin(l)
+    n_z = np.sin(b)
+
+    projected_distance = distance * np.cos(b)
+    x = projected_distance * np.cos(l)
+    y = projected_distance * np.sin(l)
+    R = np.sqrt(R0**2 + projected_distance**2 - 2 * R0 * x)
+
+    # unit vectors at the source: toward the GC, and along rotation
+    to_center_x = (R0 - x) / R
+    to_center_y = -y / R
+    rotation_x = -to_center_y
+    rotation_y = to_center_x
+
+    source_speed = rotation_curve(R, parameters) + parameters['V_s']
+    source_vx = parameters['U_s'] * to_center_x + source_speed * rotation_x
+    source_vy = parameters['U_s'] * to_center_y + source_speed * rotation_y
+
+    sun_vx = parameters['U_sun']
+    sun_vy = rotation_curve(R0, parameters) + parameters['V_sun']
+    sun_vz = parameters['W_sun']
+
+    heliocentric_velocity = ((source_vx - sun_vx) * n_x +
+                             (source_vy - sun_vy) * n_y -
+                             sun_vz * n_z)
+
+    U_std, V_std, W_std = standard_solar_motion
+
+    return heliocentric_velocity + U_std * n_x + V_std * n_y + W_std * n_z
+
+
+def revised_lsr_velocity(velocity, longitude, latitude,
+                         parameters=reid2014_universal_parameters):
+    """ Re-references a standard LSR velocity to the revised solar motion. """
+
+    l = np.radians(longitude)
+    b = np.radians(latitude)
+    n = (np.cos(b) * np.cos(l), np.cos(b) * np.sin(l), np.sin(b))
+
+    revised_solar_motion = (parameters['U_sun'], parameters['V_sun'], parameters['W_sun'])
+
+    return velocity + sum((new - old) * n_i for new, old, n_i
+                          in zip(revised_solar_motion, standard_solar_motion, n))
+
+
+def _solve_distance(longitude, latitude, velocity, nearfar, rotation_curve,
+                    parameters, distance_grid, grid_velocity, n_iterations=30):
+    """
+    Solves model_lsr_velocity(D) = velocity for D, for arrays of sources.
+
+    `grid_velocity` is the model velocity of each source on `distance_grid`;
+    it brackets the solutions, and the first (near) or last (far) bracket
+    is then refined by bisection.
+    Sources with no solution (velocities beyond the terminal velocity) get
+    the distance where the residual is smallest, i.e. the tangent point.
+
+    Returns
+    -------
+    distance : np.ndarray
+    has_solution : np.ndarray of bool
+
+    """
+
+    def residual(d, rows):
+        return (model_lsr_velocity(d, longitude[rows], latitude[rows], rotation_curve, parameters) -
+                velocity[rows])
+
+    grid_residual = grid_velocity - velocity[:, np.newaxis]
+
+    crossing = np.signbit(grid_residual[:, :-1]) != np.signbit(grid_residual[:, 1:])
+    has_solution = crossing.any(axis=1)
+
+    n_brackets = crossing.shape[1]
+    if nearfar == 'near':
+        bracket = np.argmax(crossing, axis=1)
+    else:
+        bracket = n_brackets - 1 - np.argmax(crossing[:, ::-1], axis=1)
+
+    # no solution: bracket the best grid point by its neighbours instead
+    best = np.argmin(np.abs(grid_residual), axis=1)
+    bracket = np.where(has_solution, bracket, np.clip(best - 1, 0, n_brackets - 1))
+
+    lo = distance_grid[bracket]
+    hi = np.where(has_solution, distance_grid[bracket + 1],
+                  distance_grid[np.clip(best + 1, 0, len(distance_grid) - 1)])
+
+    # bisection where there's a root
+    rows = np.where(has_solution)[0]
+    lo_residual = residual(lo[rows], rows)
+    for i in range(n_iterations):
+        mid = (lo[rows] + hi[rows]) / 2
+        mid_residual = residual(mid, rows)
+
+        root_in_lower_half = np.signbit(lo_residual) != np.signbit(mid_residual)
+        hi[rows] = np.where(root_in_lower_half, mid, hi[rows])
+        lo[rows] = np.where(root_in_lower_half, lo[rows], mid)
+        lo_residual = np.where(root_in_lower_half, lo_residual, mid_residual)
+
+    # where there isn't, keep the half holding the smallest |residual|
+    # (which is unimodal around the tangent point)
+    rows = np.where(~has_solution)[0]
+    for i in range(n_iterations):
+        width = hi[rows] - lo[rows]
+        minimum_in_lower_half = (np.abs(residual(lo[rows] + width / 4, rows)) <
+                                 np.abs(residual(lo[rows] + 3 * width / 4, rows)))
+        hi[rows] = np.where(minimum_in_lower_half, lo[rows] + width / 2, hi[rows])
+        lo[rows] = np.where(minimum_in_lower_half, lo[rows], lo[rows] + width / 2)
+
+    return (lo + hi) / 2, has_solution
+
+
+def kinematic_distance(longitude, latitude, velocity, nearfar='near',
+                       rotation_curve=universal_rotation_curve,
+                       parameters=reid2014_universal_parameters,
+                       velocity_uncertainty=default_velocity_uncertainty,
+                       max_distance=40, grid_spacing=0.1, chunk_size=2000):
+    """
+    Computes kinematic distances and their uncertainties for arrays of sources.
+
+    Parameters
+    ----------
+    longitude, latitude : array_like
+        Galactic coordinates in degrees.
+    velocity : array_like
+        LSR velocity (standard solar motion) in km/s.
+    nearfar : 'near' or 'far'
+        Which solution to return where the distance is ambiguous.
+    rotation_curve : function, optional
+        `universal_rotation_curve` (default) or `flat_rotation_curve`.
+    parameters : dict, optional
+        Parameters to go with `rotation_curve`.
+    velocity_uncertainty : float, optional
+        The +/- errors are the change in distance when `velocity` is
+        shifted by this much (km/s).
+    max_distance, grid_spacing : float, optional
+        Extent and resolution (kpc) of the grid used to bracket solutions.
+        Solutions themselves are refined well below `grid_spacing`.
+    chunk_size : int, optional
+        Sources solved at a time; bounds memory at chunk_size * grid size.
+
+    Returns
+    -------
+    distance, error_plus, error_minus, revised_velocity : np.ndarray
+        Distances and errors in kpc, revised velocity in km/s. As in the
+        output of Reid's tools, sources beyond the terminal velocity (with
+        no solution) get a distance and errors of 0. Error bounds that
+        fall beyond it are taken at the tangent point.
+
+    """
+
+    if nearfar not in ['near', 'far']:
+        raise ValueError("`nearfar` must be 'near' or 'far'.")
+
+    longitude, latitude, velocity = [np.atleast_1d(np.asarray(x, dtype=float))
+                                     for x in np.broadcast_arrays(longitude, latitude, velocity)]
+
+    distance_grid = np.arange(0, max_distance + grid_spacing, grid_spacing)
+
+    distance = np.zeros(len(velocity))
+    distance_a = np.zeros(len(velocity))
+    distance_b = np.zeros(len(velocity))
+    has_solution = np.zeros(len(velocity), dtype=bool)
+
+    for start in range(0, len(velocity), chunk_size):
+        chunk = slice(start, start + chunk_size)
+
+        # the expensive part, shared by the distance and its error bounds
+        grid_velocity = model_lsr_velocity(distance_grid[np.newaxis, :], longitude[chunk, np.newaxis],
+                                           latitude[chunk, np.newaxis], rotation_curve, parameters)
+
+        for output, velocity_offset in [(distance, 0),
+                                        (distance_a, velocity_uncertainty),
+                                        (distance_b, -velocity_uncertainty)]:
+            output[chunk], solved = _solve_distance(longitude[chunk], latitude[chunk],
+                                                    velocity[chunk] + velocity_offset, nearfar,
+                                                    rotation_curve, parameters, distance_grid, grid_velocity)
+            if velocity_offset == 0:
+                has_solution[chunk] = solved
+
+    error_plus = np.maximum(np.maximum(distance_a, distance_b), distance) - distance
+    error_minus = distance - np.minimum(np.minimum(distance_a, distance_b), distance)
+
+    for output in distance, error_plus, error_minus:
+        output[~has_solution] = 0
+
+    revised_velocity = revised_lsr_velocity(velocity, longitude, latitude, parameters)
+
+    return distance, error_plus, error_minus, revised_velocity
+
+
+def _distance_table(catalog, distance, error_plus, error_minus, revised_velocity):
+    """ Lays out distances in the table format of Reid's Fortran tools. """
+
+    kd_output = astropy.table.Table()
+    kd_output['Source'] = catalog['_idx']
+    kd_output['gal_long'] = np.asarray(catalog['x_cen'])
+    kd_output['gal_lat'] = np.asarray(catalog['y_cen'])
+    kd_output['V_lsr'] = np.asarray(catalog['v_cen'])
+    kd_output['V_rev'] = revised_velocity
+    kd_output['D_k'] = distance
+    kd_output['error_D_k_plus'] = error_plus
+    kd_output['error_D_k_minus'] = error_minus
+
+    kd_output['gal_long'].unit = u.deg
+    kd_output['gal_lat'].unit = u.deg
+    kd_output['V_lsr'].unit = u.km/u.s
+    kd_output['V_rev'].unit = u.km/u.s
+    kd_output['D_k'].unit = u.kpc
+    kd_output['error_D_k_plus'].unit = u.kpc
+    kd_output['error_D_k_minus'].unit = u.kpc
+
+    return kd_output
+
+
+def kinematic_distance_table(catalog, nearfar='near', **kwargs):
+    """
+    Makes a kinematic distance table from a ppv_catalog output.
+
+    The table has the same columns (and units) as the output of Mark
+    Reid's Fortran tools, as parsed by `reid_distance_assigner`.
+
+    """
+
+    distance, error_plus, error_minus, revised_velocity = kinematic_distance(
+        catalog['x_cen'], catalog['y_cen'], catalog['v_cen'], nearfar=nearfar, **kwargs)
+
+    return _distance_table(catalog, distance, error_plus, error_minus, revised_velocity)
+
+
+def lookup_distance_table(catalog, nearfar, lookup_table, model):
+    """
+    As `kinematic_distance_table`, but interpolating from a lookup table.
+
+    `lookup_table` is a `distance_lookup_table.DistanceLookupTable`, which
+    must be of `model` ('reid2014_flat' or 'reid2014_universal'); its
+    parameters give the revised velocities.
+
+    """
+
+    lookup_table.check_model(model)
+    parameters = {'reid2014_flat': reid2014_flat_parameters,
+                  'reid2014_universal': reid2014_universal_parameters}[model]
+
+    distance, error_plus, error_minus = lookup_table.lookup(
+        catalog['x_cen'], catalog['y_cen'], catalog['v_cen'], nearfar)
+
+    revised_velocity = revised_lsr_velocity(np.asarray(catalog['v_cen'], dtype=float),
+                                            np.asarray(catalog['x_cen'], dtype=float),
+                                            np.asarray(catalog['y_cen'], dtype=float), parameters)
+
+    return _distance_table(catalog, distance, error_plus, error_minus, revised_velocity)
@@ -0,0 +1,174 @@
+"""
+Processes datacubes too large for memory in slabs along one axis.
+
+Each slab is read together with a "halo" of neighbouring planes, wide
+enough for whatever the processing function needs to look at (e.g. a
+smoothing kernel), processed, trimmed back to its own planes and written
+into the output -- which can be a memory-mapped FITS file, so that
+neither the input nor the output ever needs to be in memory as a whole.
+Peak memory is then set by the slab size.
+
+The output may also be the input itself. A slab's result then isn't
+written until no later slab's halo still has to read the planes it
+overwrites.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+import astropy.io.fits as fits
+
+# keywords describing the data layout, which an output file sets for itself
+structural_keywords = ['SIMPLE', 'BITPIX', 'NAXIS', 'EXTEND', 'BSCALE', 'BZERO', 'BLANK']
+
+
+def process_in_slabs(function, data, output=None, axis=0, slab_size=64, halo=0,
+                     wrap=False, reduction=1, verbose=False):
+    """
+    Applies `function` to `data` one slab at a time along `axis`.
+
+    Parameters
+    ----------
+    function : function
+        Called as `function(slab, indices)`, where `slab` holds planes
+        `indices` of `data` along `axis`, and must return an array of the
+        same shape as `slab` -- or, if `reduction` > 1, with `axis` shrunk
+        by that factor. With `wrap`, `indices` may run off either end of
+        `data` (the planes there are wrapped around from the other end).
+    data : numpy.ndarray
+        Input; may be a memmap.
+    output : numpy.ndarray, optional
+        Where to write the result; may be a memmap, or `data` itself.
+        Allocated if not given.
+    axis : int, optional
+        The axis to cut into slabs.
+    slab_size : int, optional
+        Planes per slab, not counting the halo.
+    halo : int, optional
+        Extra planes read on either side of each slab, and discarded
+        after processing.
+    wrap : bool, optional
+        Whether halos at the ends of `data` wrap around to the other end
+        (for periodic operations) or are simply cut off.
+    reduction : int, optional
+        Block size, for functions that reduce each block of `reduction`
+        planes along `axis` to one (`halo` must be 0). Trailing planes
+        that don't fill a block are dropped.
+
+    Returns
+    -------
+    output : numpy.ndarray
+
+    """
+
+    if reduction > 1 and halo > 0:
+        raise ValueError("Reducing functions can't use a halo.")
+
+    n_planes = data.shape[axis] // reduction * reduction
+    # slabs of whole blocks
+    slab_size = max(slab_size // reduction, 1) * reduction
+
+    def slab_indices(start, stop):
+        indices = np.arange(start - halo, stop + halo)
+        if wrap:
+            return indices
+        return indices[(indices >= 0) & (indices < data.shape[axis])]
+
+    starts = range(0, n_planes, slab_size)
+
+    # the last slab to read each plane of `data`, after which it may be overwritten
+    last_read = np.full(data.shape[axis], -1, dtype=int)
+    for i, start in enumerate(starts):
+        last_read[slab_indices(start, min(start + slab_size, n_planes)) % data.shape[axis]] = i
+
+    in_place = output is not None and np.may_share_memory(data, output)
+    pending = []
+
+    for i, start in enumerate(starts):
+        stop = min(start + slab_size, n_planes)
+
+        indices = slab_indices(start, stop)
+        if wrap:
+            slab = np.take(data, indices % data.shape[axis], axis=axis)
+        else:
+            slab_slices = [slice(None)] * data.ndim
+            slab_slices[axis] = slice(indices[0], indices[-1] + 1)
+            slab = np.array(data[tuple(slab_slices)])
+
+        if verbose:
+            print "Processing planes {0}-{1} of {2}".format(start, stop, n_planes)
+
+        result = function(slab, indices)
+
+        # drop the halo
+        trim_slices = [slice(None)] * data.ndim
+        trim_slices[axis] = slice(start - indices[0], stop - indices[0])
+        result = result[tuple(trim_slices)]
+
+        if output is None:
+            output_shape = list(result.shape)
+            output_shape[axis] = n_planes // reduction
+            output = np.empty(output_shape, dtype=result.dtype)
+
+        pending.append((start, stop, result))
+
+        # write out every result whose planes no remaining slab will read
+        still_pending = []
+        for pending_start, pending_stop, pending_result in pending:
+            if in_place and last_read[pending_start:pending_stop].max() > i:
+                still_pending.append((pending_start, pending_stop, pending_result))
+                continue
+            output_slices = [slice(None)] * data.ndim
+            output_slices[axis] = slice(pending_start // reduction, pending_stop // reduction)
+            output[tuple(output_slices)] = pending_result
+        pending = still_pending
+
+    return output
+
+
+def create_memmapped_fits(filename, shape, dtype, header=None, clobber=False):
+    """
+    Creates a FITS file of a given data shape without holding its data in memory.
+
+    Parameters
+    ----------
+    filename : str
+    shape : tuple
+        Shape of the data, in numpy order.
+    dtype : numpy.dtype
+    header : astropy.io.fits.Header, optional
+        Non-structural cards (WCS etc.) are copied into the new header.
+    clobber : bool, optional
+        Whether to overwrite an existing file.
+
+    Returns
+    -------
+    hdulist : astropy.io.fits.HDUList
+        Opened in update mode; write into `hdulist[0].data` (a memmap) and
+        close it to flush.
+
+    """
+
+    # a placeholder array sets BITPIX; NAXISn are then set by hand
+    new_header = fits.PrimaryHDU(data=np.zeros((1,) * len(shape), dtype=dtype)).header
+    for axis_number, length in enumerate(reversed(shape)):
+        new_header['NAXIS{0}'.format(axis_number + 1)] = length
+
+    if header is not None:
+        for card in header.cards:
+            if card.keyword.rstrip('0123456789') in structural_keywords or card.keyword in ['', 'COMMENT', 'HISTORY']:
+                continue
+            new_header[card.keyword] = (card.value, card.comment)
+
+    new_header.tofile(filename, clobber=clobber)
+
+    # extend the file to its full (block-padded) size without writing the data
+    data_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    padded_data_bytes = -(-data_bytes // 2880) * 2880
+    with open(filename, 'rb+') as f:
+        f.seek(len(new_header.tostring()) + padded_data_bytes - 1)
+        f.write(b'\0')
+
+    return fits.open(filename, mode='update', memmap=True)
@@ -8,11 +8,45 @@ should run with py.test
 from __future__ import division
 
 import numpy as np
-from numpy.testing import assert_allclose
+from numpy.testing import assert_allclose, assert_array_equal
 
 from astropy.io.fits import getdata
 
-from ..dame_interpolation import interpolate_spectrum, interpolate_single, interpolate_double, interpolate_datacube
+from ..dame_interpolation import (interpolate_spectrum, interpolate_single, interpolate_double, interpolate_datacube,
+                                  shift_left, shift_right)
+
+def reference_interpolate_single(array):
+	""" The original one-nan-at-a-time implementation. """
+
+	new_array = np.copy(array)
+	nan_positions = np.where(np.isnan(array) & ~np.isnan(shift_right(array)) & ~np.isnan(shift_left(array)))
+	for i in nan_positions[0]:
+		new_array[i] = np.mean((new_array[i+1], new_array[i-1]))
+	return new_array
+
+def reference_interpolate_double(array):
+
+	new_array = np.copy(array)
+	nan_positions = np.where(np.isnan(array) & np.isnan(shift_left(array,1)) & ~np.isnan(shift_right(array,1)) & ~np.isnan(shift_left(array,2)))
+	for i in nan_positions[0]:
+		new_array[i] = (2/3 * new_array[i-1]) + (1/3 * new_array[i+2])
+		new_array[i+1] = (1/3 * new_array[i-1]) + (2/3 * new_array[i+2])
+	return new_array
+
+def reference_interpolate_datacube(data):
+	""" The original spectrum-by-spectrum, slice-by-slice implementation, for (b, l, v) cubes. """
+
+	new_data = np.copy(data)
+	for l_i in range(new_data.shape[1]):
+		for b_i in range(new_data.shape[0]):
+			new_data[b_i, l_i, :] = reference_interpolate_double(reference_interpolate_single(new_data[b_i, l_i, :]))
+	for v_i in range(new_data.shape[2]):
+		for b_i in range(new_data.shape[0]):
+			new_data[b_i, :, v_i] = reference_interpolate_single(new_data[b_i, :, v_i])
+	for v_i in range(new_data.shape[2]):
+		for l_i in range(new_data.shape[1]):
+			new_data[:, l_i, v_i] = reference_interpolate_single(new_data[:, l_i, v_i])
+	return new_data
 
 def test_interpolate_single():
 
@@ -84,3 +118,17 @@ def test_interpolation_against_data():
 	# tolerance chosen by trial-and-error
 	assert_allclose(dame_interpolated_data, my_interpolated_data, atol=1e-3)
 
+
+def test_interpolation_bit_identical_to_reference():
+
+	raw_data = getdata("test/DHT03_RCrA_raw.fits")
+
+	expected = reference_interpolate_datacube(raw_data)
+
+	assert_array_equal(interpolate_datacube(raw_data), expected)
+	assert_array_equal(interpolate_datacube(raw_data.astype(np.float64)), 
+	                   reference_interpolate_datacube(raw_data.astype(np.float64)))
+
+	# the same cube in another axis order, (v, b, l)
+	permuted = interpolate_datacube(raw_data.transpose(2, 0, 1), spectrum_axis=0, lon_axis=2, lat_axis=1)
+	assert_array_equal(permuted.transpose(1, 2, 0), expected)
@@ -0,0 +1,90 @@
+""" 
+Tests for dame_moment_masking.py 
+
+should run with py.test 
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from ..dame_moment_masking import moment_mask, dilate_mask, roll_cube, gsmooth_cube
+
+def reference_moment_mask(cube, rms_noise, velocity_smoothing=2, spatial_smoothing=2, clip_at_sigma=5):
+	""" The original roll-and-compare implementation, velocity axis first. """
+
+	velocity_sigma = velocity_smoothing/(2*np.sqrt(2*np.log(2)))
+	spatial_sigma = spatial_smoothing/(2*np.sqrt(2*np.log(2)))
+
+	smooth_cube = gsmooth_cube(cube, [velocity_sigma, spatial_sigma, spatial_sigma], kernelsize_mult=4)
+	smoothed_rms_noise = 1/np.sqrt(spatial_smoothing*spatial_smoothing*velocity_smoothing) * rms_noise
+	clipping_level = clip_at_sigma*smoothed_rms_noise
+
+	mask_cube = np.zeros_like(cube)
+	ns = spatial_smoothing
+	nv = velocity_smoothing
+	for dx in range(-ns+1, ns):
+		for dy in range(-ns+1, ns):
+			for dv in range(-nv+1, nv):
+				mask_cube[roll_cube(smooth_cube, (dv, dx, dy)) > clipping_level] = 1
+
+	return mask_cube * cube
+
+def make_test_cube(dtype=float):
+
+	np.random.seed(0)
+	cube = np.random.normal(size=(20, 15, 12))
+	cube[5:9, 4:8, 3:6] += 4
+	cube[12, 10, 9] += 20
+	cube[0, 0, 0] += 20
+
+	return cube.astype(dtype)
+
+def test_dilate_mask():
+
+	mask = np.zeros((5, 6, 7), dtype=bool)
+	mask[0, 3, 6] = True
+	mask[4, 0, 0] = True
+
+	expected = np.zeros_like(mask)
+	expected[0:2, 1:6, 5:7] = True
+	expected[3:5, 0:3, 0:2] = True
+
+	assert_array_equal(dilate_mask(mask, (1, 2, 1)), expected)
+
+def test_moment_mask_matches_reference():
+
+	cube = make_test_cube()
+
+	for velocity_smoothing, spatial_smoothing in [(2, 2), (3, 2), (4, 1)]:
+		expected = reference_moment_mask(cube, 1, velocity_smoothing, spatial_smoothing)
+		result = moment_mask(cube, 1, velocity_smoothing=velocity_smoothing,
+		                     spatial_smoothing=spatial_smoothing)
+
+		assert_array_equal(result, expected)
+
+def test_moment_mask_velocity_axis_and_in_place():
+
+	cube = make_test_cube(np.float32)
+	expected = moment_mask(cube, 1, velocity_smoothing=3)
+
+	# same cube with velocity last
+	transposed = np.ascontiguousarray(cube.transpose(1, 2, 0))
+	result = moment_mask(transposed, 1, velocity_smoothing=3, velocity_axis=2, in_place=True)
+
+	assert result is transposed
+	assert result.dtype == np.float32
+	assert_array_equal(result.transpose(2, 0, 1), expected)
+
+def test_moment_mask_in_place_in_slabs():
+
+	for seed in range(5):
+		cube = np.random.RandomState(seed).normal(size=(16, 23, 30)) + 1.2
+		expected = moment_mask(cube, 1)
+
+		for slab_size in [1, 4, 30]:
+			result = moment_mask(cube.copy(), 1, slab_size=slab_size, in_place=True)
+
+			assert_array_equal(result, expected)
@@ -0,0 +1,101 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import os
+import json
+import shutil
+import tempfile
+
+import pytest
+
+import astropy.table
+import numpy as np
+
+from .distance_lookup_table import DistanceLookupTable
+from .rotation_curve_distance import kinematic_distance
+from .reid_distance_assigner import make_universal_distance_column, make_reid_distance_column
+from .kinematic_distance import make_blitz_distance_column
+
+def make_test_table():
+
+    return DistanceLookupTable.build('reid2014_universal', longitude_axis=(25, 35, 0.5),
+                                     latitude_axis=(-1, 1, 1), velocity_axis=(-10, 100, 1),
+                                     tolerance=0.05, verbose=False)
+
+def test_lookup_within_tolerance():
+
+    table = make_test_table()
+
+    np.random.seed(0)
+    longitude = np.random.uniform(20, 40, 2000)
+    latitude = np.random.uniform(-1, 1, 2000)
+    velocity = np.random.uniform(-10, 110, 2000)
+
+    for nearfar in ['near', 'far']:
+        looked_up = np.array(table.lookup(longitude, latitude, velocity, nearfar))
+        exact = np.array(kinematic_distance(longitude, latitude, velocity, nearfar)[:3])
+
+        assert np.abs(looked_up - exact).max() <= table.tolerance
+
+        # outside the grid, lookups are solved exactly
+        outside = (longitude < 25) | (longitude > 35) | (velocity > 100)
+        np.testing.assert_array_equal(looked_up[:, outside], exact[:, outside])
+
+def test_save_and_load():
+
+    table = make_test_table()
+
+    path = os.path.join(tempfile.mkdtemp(), 'reid2014_universal')
+    try:
+        table.save(path)
+        loaded = DistanceLookupTable.load(path)
+
+        assert isinstance(loaded.values, np.memmap)
+        np.testing.assert_array_equal(loaded.values, table.values)
+        np.testing.assert_array_equal(loaded.accurate, table.accurate)
+
+        catalog = astropy.table.Table()
+        catalog['_idx'] = [0, 1]
+        catalog['x_cen'] = [30., 31.]
+        catalog['y_cen'] = [-1., 0.5]
+        catalog['v_cen'] = [-10., 40.]
+
+        looked_up = make_universal_distance_column(catalog, nearfar='far', lookup_table=loaded)
+        exact = make_universal_distance_column(catalog, nearfar='far', executable_path=None)
+        assert looked_up.colnames == exact.colnames
+        np.testing.assert_allclose(looked_up['D_k'], exact['D_k'], atol=table.tolerance)
+
+        # a table built with other model parameters is refused
+        with open(os.path.join(path, 'table.json')) as f:
+            description = json.load(f)
+        description['model_parameters'] = 'something else'
+        with open(os.path.join(path, 'table.json'), 'w') as f:
+            json.dump(description, f)
+
+        with pytest.raises(ValueError):
+            DistanceLookupTable.load(path)
+    finally:
+        shutil.rmtree(os.path.dirname(path))
+
+def test_lookup_refuses_other_models():
+
+    table = make_test_table()
+
+    catalog = astropy.table.Table()
+    catalog['_idx'] = [0]
+    catalog['x_cen'] = [30.]
+    catalog['y_cen'] = [0.]
+    catalog['v_cen'] = [40.]
+
+    # a universal table only stands in for the universal model
+    make_universal_distance_column(catalog, lookup_table=table)
+
+    with pytest.raises(ValueError):
+        make_reid_distance_column(catalog, lookup_table=table)
+
+    with pytest.raises(ValueError):
+        make_blitz_distance_column(catalog, lookup_table=table)
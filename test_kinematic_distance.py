@@ -0,0 +1,54 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import astropy.table
+import numpy as np
+
+from .kinematic_distance import (brand_blitz_kinematic_distances, brand_blitz_kinematic_distance,
+                                 make_blitz_distance_column, brand_blitz_parameters)
+
+def test_brand_blitz_matches_flat_rotation_geometry():
+
+    ro = brand_blitz_parameters['ro']
+    vo = brand_blitz_parameters['vo']
+
+    # first and fourth quadrant, away from the tangent points
+    longitude = np.array([20., 30., 45., 330., 340.])
+    velocity = np.array([40., 30., 10., -30., -20.])
+
+    near, far = brand_blitz_kinematic_distances(longitude, velocity, verbose=False)
+
+    # for a flat rotation curve, v = vo sin(l) (ro/r - 1)
+    l = np.radians(longitude)
+    r = ro * vo * np.sin(l) / (velocity + vo * np.sin(l))
+    half_chord = np.sqrt(r**2 - (ro * np.sin(l))**2)
+
+    np.testing.assert_allclose(near, ro * np.cos(l) - half_chord, atol=0.05)
+    np.testing.assert_allclose(far, ro * np.cos(l) + half_chord, atol=0.05)
+
+    # the scalar interface agrees
+    np.testing.assert_allclose(brand_blitz_kinematic_distance(longitude[0], velocity[0]),
+                               [near[0], far[0]])
+
+def test_blitz_distance_column():
+
+    catalog = astropy.table.Table()
+    # acute with a negative near solution; obtuse; beyond the terminal velocity
+    catalog['x_cen'] = [30., 130., 30.]
+    catalog['y_cen'] = [0., 0., 0.]
+    catalog['v_cen'] = [-10., -30., 300.]
+
+    near, far = brand_blitz_kinematic_distances(catalog['x_cen'], catalog['v_cen'], verbose=False)
+    assert near[0] < 0 < far[0]
+    assert near[1] == far[1]
+
+    near_column = make_blitz_distance_column(catalog, nearfar='near')
+    far_column = make_blitz_distance_column(catalog, nearfar='far')
+
+    np.testing.assert_allclose(near_column[:2], far[:2])
+    np.testing.assert_allclose(far_column[:2], far[:2])
+    assert np.isnan(near_column[2]) and np.isnan(far_column[2])
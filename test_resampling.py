@@ -0,0 +1,64 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from astropy.io.fits import Header
+
+from .resampling import block_reduce, block_reduce_header
+
+def test_block_reduce():
+
+    np.random.seed(0)
+    array = np.random.random((7, 9, 10))
+    array[np.random.random(array.shape) < 0.3] = np.nan
+    array[0:2, 0:3, 0:5] = np.nan
+
+    factors = (2, 3, 5)
+    shape = (3, 3, 2)
+
+    expected_mean = np.zeros(shape)
+    expected_sum = np.zeros(shape)
+    for i, j, k in np.ndindex(*shape):
+        block = array[i*2:(i+1)*2, j*3:(j+1)*3, k*5:(k+1)*5]
+        values = block[~np.isnan(block)]
+        expected_mean[i, j, k] = values.mean() if len(values) else np.nan
+        expected_sum[i, j, k] = values.sum() if len(values) else np.nan
+
+    assert np.isnan(expected_mean[0, 0, 0])
+
+    assert_allclose(block_reduce(array, factors), expected_mean)
+    assert_allclose(block_reduce(array, factors, how='sum'), expected_sum)
+
+    single = block_reduce(array.astype(np.float32), factors, dtype=np.float32)
+    assert single.dtype == np.float32
+    assert_allclose(single, expected_mean, rtol=1e-6)
+
+def test_block_reduce_header():
+
+    header = Header()
+    for n, (naxis, crpix, cdelt, crval) in enumerate([(10, 3., 0.5, 20.), (9, 1., -0.25, 0.), (7, 7.5, 1., -50.)]):
+        header['naxis'+str(n+1)] = naxis
+        header['crpix'+str(n+1)] = crpix
+        header['cdelt'+str(n+1)] = cdelt
+        header['crval'+str(n+1)] = crval
+
+    # numpy order: the last factor goes with NAXIS1
+    factors = (2, 3, 5)
+    new_header = block_reduce_header(header, factors)
+
+    # the world coordinate of each new pixel is the mean over its block
+    for n, factor in enumerate(reversed(factors)):
+        key = str(n+1)
+        world = lambda pixel, h: h['crval'+key] + (pixel - h['crpix'+key]) * h['cdelt'+key]
+
+        assert new_header['naxis'+key] == header['naxis'+key] // factor
+
+        new_pixels = np.arange(1, new_header['naxis'+key] + 1)
+        old_pixels = np.arange(1, new_header['naxis'+key] * factor + 1).reshape(-1, factor)
+        assert_allclose(world(new_pixels, new_header), world(old_pixels, header).mean(axis=1))
@@ -0,0 +1,85 @@
+"""
+To be run with py.test.
+
+"""
+
+from __future__ import division
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+
+from astropy.io.fits import getdata, Header
+
+from .slab_processing import process_in_slabs, create_memmapped_fits
+from .dame_moment_masking import moment_mask
+from .dame_interpolation import interpolate_datacube
+from .demo import resample_3d_variable
+
+def make_test_cube():
+
+    np.random.seed(0)
+    cube = np.random.normal(size=(16, 23, 19))
+    cube[5:9, 4:8, 3:6] += 4
+    cube[12, 20, 17] += 20
+    cube[0, 0, 0] += 20
+    cube[np.random.random(cube.shape) < 0.1] = np.nan
+
+    return cube
+
+def test_process_in_slabs_halo():
+
+    data = np.arange(30.)
+
+    # a 3-point running sum needs one plane of halo
+    running_sum = lambda slab, indices: slab + np.roll(slab, 1) + np.roll(slab, -1)
+
+    for slab_size in [1, 4, 7, 30]:
+        assert_array_equal(process_in_slabs(running_sum, data, slab_size=slab_size, halo=1, wrap=True),
+                           running_sum(data, None))
+
+        # in place, no slab may read planes that an earlier slab has already overwritten
+        for wrap in [True, False]:
+            expected = process_in_slabs(running_sum, data, slab_size=slab_size, halo=1, wrap=wrap)
+            in_place = data.copy()
+            assert process_in_slabs(running_sum, in_place, in_place, slab_size=slab_size, halo=1, wrap=wrap) is in_place
+            assert_array_equal(in_place, expected)
+
+def test_slabs_match_whole_cube():
+
+    cube = make_test_cube()
+
+    for slab_size in [3, 5, 40]:
+        for velocity_axis in [0, 2]:
+            assert_array_equal(moment_mask(cube, 1, velocity_axis=velocity_axis, slab_size=slab_size),
+                               moment_mask(cube, 1, velocity_axis=velocity_axis))
+
+        assert_array_equal(interpolate_datacube(cube, slab_size=slab_size),
+                           interpolate_datacube(cube))
+
+        assert_allclose(resample_3d_variable(cube, 3, 2, 4, slab_size=slab_size),
+                        resample_3d_variable(cube, 3, 2, 4))
+
+def test_memmapped_fits_output():
+
+    cube = make_test_cube().astype(np.float32)
+
+    header = Header()
+    header['CTYPE1'] = 'VELO-LSR'
+    header['CDELT1'] = 0.65
+
+    path = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(path, 'test_interp.fits')
+        output = create_memmapped_fits(filename, cube.shape, cube.dtype, header)
+        interpolate_datacube(cube, slab_size=4, out=output[0].data)
+        output.close()
+
+        data, new_header = getdata(filename, header=True)
+        assert_array_equal(data, interpolate_datacube(cube))
+        assert new_header['CTYPE1'] == 'VELO-LSR'
+    finally:
+        shutil.rmtree(path)